@@ -0,0 +1,166 @@
+import logging
+import re
+from collections.abc import Callable, Hashable
+from typing import Any, TypeVar
+
+import numpy as np
+import pandas as pd
+
+from app.config import CSV_CHUNK_ROWS
+from app.tool.chunked import Profile, chunks_of
+from app.tool.duck import DuckTable, quote
+from app.tool.tables import Tables
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Column-name patterns per role, most specific first
+ROLE_PATTERNS: dict[str, list[str]] = {
+    "rank": [r"\brank"],
+    "peak": [r"\bpeak"],
+    "gross": [r"worldwide.*gross", r"gross"],
+    "year": [r"\byear\b", r"release"],
+    "title": [r"\btitle", r"\bfilm", r"\bname"],
+}
+# How each role's cells are normalized; roles not listed are returned as-is
+ROLE_PARSERS: dict[str, Callable[[pd.Series], pd.Series]] = {
+    "rank": Tables.parse_int,
+    "peak": Tables.parse_int,
+    "gross": Tables.parse_money,
+    "year": Tables.parse_year,
+}
+
+
+def _name_pattern(name: str) -> str:
+    """Whole-word match for a free-text column name ("Worldwide gross" ~ "worldwide_gross")."""
+    words = [re.escape(w) for w in re.split(r"[\W_]+", name.lower()) if w]
+    return r"(?<![a-z0-9])" + r"[\W_]*".join(words) + r"(?![a-z0-9])"
+
+
+class AnalysisContext:
+    """
+    The tables of one request plus everything derived from them: which table holds which
+    roles, which column plays each role, and the parsed values of those columns. Every
+    derivation is computed once and shared by all questions of the request.
+
+    A table is either a DataFrame or a DuckTable (a DuckDB view over an uploaded file); of
+    the latter only the columns a question needs are ever read, and `scan` lets handlers
+    push filters and aggregates down to DuckDB instead.
+    """
+
+    def __init__(self, tables: list[pd.DataFrame | DuckTable]):
+        self.tables = tables
+        self.hits = 0
+        self.misses = 0
+        self._memo: dict[Hashable, Any] = {}
+
+    def memo(self, key: Hashable, compute: Callable[[], T]) -> T:
+        if key in self._memo:
+            self.hits += 1
+            return self._memo[key]
+        self.misses += 1
+        value = self._memo[key] = compute()
+        return value
+
+    def column(self, table: int, role: str) -> int | None:
+        """Position of the column playing `role` in table `table`, if any."""
+
+        def find() -> int | None:
+            names = [str(c) for c in self.tables[table].columns]
+            for pattern in ROLE_PATTERNS.get(role.lower(), [_name_pattern(role)]):
+                for i, name in enumerate(names):
+                    if re.search(pattern, name, re.I):
+                        return i
+            return None
+
+        return self.memo(("column", table, role), find)
+
+    def table_for(self, *roles: str) -> int:
+        """Index of the first table that has every role; the first table if none does."""
+
+        def find() -> int:
+            for i in range(len(self.tables)):
+                if all(self.column(i, r) is not None for r in roles):
+                    return i
+            return 0
+
+        return self.memo(("table", roles), find)
+
+    def values(self, table: int, role: str) -> pd.Series:
+        """
+        The role's column, normalized. A missing year falls back to years mentioned in the
+        title column ("Titanic (1997)").
+        """
+
+        def compute() -> pd.Series:
+            df = self.tables[table]
+            pos = self.column(table, role)
+            if pos is None and role == "year":
+                pos = self.column(table, "title")
+            if isinstance(df, DuckTable):
+                index = pd.RangeIndex(len(df))
+                col = df.column(df.columns[pos]) if pos is not None else None
+            else:
+                index = df.index
+                col = df.iloc[:, pos] if pos is not None else None
+            if col is None:
+                return pd.Series(pd.NA, index=index, dtype="object")
+            parse = ROLE_PARSERS.get(role.lower())
+            # typed columns (DuckDB scans, numeric CSV columns) need no text parsing
+            return parse(col) if parse and not pd.api.types.is_numeric_dtype(col) else col
+
+        return self.memo(("values", table, role), compute)
+
+    def numeric(self, table: int, role: str) -> np.ndarray:
+        """The role's values as a float array (NaN where a cell isn't a number)."""
+
+        def compute() -> np.ndarray:
+            col = self.values(table, role)
+            if pd.api.types.is_numeric_dtype(col):
+                return col.to_numpy(dtype=float, na_value=np.nan)
+            plain = pd.to_numeric(col, errors="coerce")
+            money = Tables.parse_money(col)
+            # "$1,234" style cells only parse as money; plain numbers parse both ways
+            best = money if money.notna().sum() > plain.notna().sum() else plain
+            return best.to_numpy(dtype=float, na_value=np.nan)
+
+        return self.memo(("numeric", table, role), compute)
+
+    def scan(self, table: int, *roles: str) -> tuple[DuckTable, list[str]] | None:
+        """
+        The DuckDB view and quoted column names for `roles`, if `table` is a view in which
+        every role is a typed numeric column, so SQL over it matches the parsed values.
+        """
+        df = self.tables[table]
+        if not isinstance(df, DuckTable):
+            return None
+        positions = [self.column(table, r) for r in roles]
+        if any(p is None or not df.is_numeric(df.columns[p]) for p in positions):
+            return None
+        return df, [quote(df.columns[p]) for p in positions]
+
+    def profile(self, table: int) -> Profile:
+        """
+        Row count, moments of the numeric columns and top values of the others, from one
+        pass over an in-memory table in chunks of CSV_CHUNK_ROWS (see tool.chunked). Views
+        aren't profiled: handlers push their aggregates down to DuckDB.
+        """
+        return self.memo(("profile", table), lambda: Profile.of(chunks_of(self.tables[table], CSV_CHUNK_ROWS)))
+
+    def frame(self, table: int, *roles: str) -> pd.DataFrame:
+        """
+        Normalized role columns of one table side by side. The frame shares its columns with
+        the memoized series rather than copying them: like everything memoized here it is
+        read-only, and callers that need to modify it take a `.copy()`.
+        """
+        return self.memo(
+            ("frame", table, roles),
+            lambda: pd.DataFrame({r: self.values(table, r) for r in roles}, copy=False),
+        )
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def log_stats(self) -> None:
+        logger.info(f"Analysis context: {self.hits} derived lookups served from cache, {self.misses} computed")
@@ -0,0 +1,212 @@
+import logging
+import re
+from collections.abc import Callable
+
+import numpy as np
+import pandas as pd
+
+from app.analyzer.context import AnalysisContext, _name_pattern
+from app.config import PROMPT_TABLE_TOKENS
+from app.tool.duck import DuckTable
+from app.tool.tables import Tables
+from app.utils.metrics import span
+from app.utils.text import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+TOP_K = 5
+SAMPLE_ROWS = 5
+CELL_CHARS = 40
+# Share of parseable cells above which a text column is treated as numeric
+NUMERIC_SHARE = 0.5
+
+# Aggregations worth pre-computing when a question asks for them, over the columns it names
+AGGREGATIONS: list[tuple[re.Pattern, str]] = [
+    (re.compile(r"\b(average|mean)\b", re.I), "mean"),
+    (re.compile(r"\b(total|sum)\b", re.I), "sum"),
+    (re.compile(r"\b(median)\b", re.I), "median"),
+    (re.compile(r"\b(highest|largest|maximum|max|most|top|biggest|latest)\b", re.I), "max"),
+    (re.compile(r"\b(lowest|smallest|minimum|min|least|fewest|earliest)\b", re.I), "min"),
+    (re.compile(r"\b(how many|count|number of)\b", re.I), "count"),
+]
+
+
+def _fmt(value) -> str:
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return "null"
+    if isinstance(value, (float, np.floating)):
+        return f"{value:.6g}"
+    text = str(value)
+    return text if len(text) <= CELL_CHARS else text[: CELL_CHARS - 1] + "…"
+
+
+class TableDigest:
+    """
+    A bounded-size description of a request's tables for the LLM prompt, in place of a
+    sample of rows: the schema, per-column statistics over *all* rows, aggregations the
+    questions ask for computed exactly, and a few example rows. Sections are added in that
+    order of priority until `max_tokens` is used up, so the prompt stays the same size
+    whether a table has ten rows or a million.
+    """
+
+    def __init__(self, ctx: AnalysisContext, questions: list[str], max_tokens: int = PROMPT_TABLE_TOKENS):
+        self.ctx = ctx
+        self.questions = questions
+        self.max_tokens = max_tokens
+
+    def numeric(self, table: int, name: str) -> np.ndarray | None:
+        """All values of a column as floats, if it's a numeric (or money-like) column."""
+
+        def compute() -> np.ndarray | None:
+            df = self.ctx.tables[table]
+            if isinstance(df, DuckTable) and not df.is_numeric(name):
+                return None  # text columns of scanned files aren't parsed
+            col = self._series(table, name)
+            if pd.api.types.is_bool_dtype(col):
+                return None
+            if pd.api.types.is_numeric_dtype(col):
+                return col.to_numpy(dtype=float, na_value=np.nan)
+            present = col.dropna()
+            if present.empty:
+                return None
+            # decide on a sample whether (and how) to parse a long column in full
+            sample = present.iloc[:200]
+            plain = pd.to_numeric(sample, errors="coerce").notna().mean()
+            money = Tables.parse_money(sample).notna().mean()
+            if max(plain, money) < NUMERIC_SHARE:
+                return None
+            parsed = Tables.parse_money(col) if money > plain else pd.to_numeric(col, errors="coerce")
+            return parsed.to_numpy(dtype=float, na_value=np.nan)
+
+        return self.ctx.memo(("digest-numeric", table, name), compute)
+
+    def _is_number(self, table: int, name: str) -> bool:
+        df = self.ctx.tables[table]
+        # a scanned file's column types come from DuckDB: no need to load the column
+        return df.is_numeric(name) if isinstance(df, DuckTable) else self.numeric(table, name) is not None
+
+    def _series(self, table: int, name: str) -> pd.Series:
+        df = self.ctx.tables[table]
+        return self.ctx.memo(
+            ("digest-series", table, name),
+            lambda: df.column(name) if isinstance(df, DuckTable) else df[name],
+        )
+
+    def _summary(self, table: int) -> dict[str, dict]:
+        """DuckDB's SUMMARIZE of a scanned file: stats in one pass, no column loaded into pandas."""
+        df = self.ctx.tables[table]
+        return self.ctx.memo(
+            ("digest-summary", table),
+            lambda: {row["column_name"]: row for row in df.session.query(f"SUMMARIZE {df.view}").to_pylist()},
+        )
+
+    def _column_line(self, table: int, name: str) -> str:
+        if isinstance(self.ctx.tables[table], DuckTable):
+            s = self._summary(table)[name]
+            kind = "numeric" if self.ctx.tables[table].is_numeric(name) else "text"
+            if s["min"] is None:  # SUMMARIZE gives NULL stats for a column with no values
+                return f"- {name}: {kind}, all null"
+            stats = f"min={_fmt(s['min'])}, p25={_fmt(s['q25'])}, median={_fmt(s['q50'])}, p75={_fmt(s['q75'])}, max={_fmt(s['max'])}"
+            if kind == "numeric" and s["avg"] is not None:
+                stats += f", mean={_fmt(float(s['avg']))}"
+            return f"- {name}: {kind}, nulls={s['null_percentage']}%, distinct~{s['approx_unique']}, {stats}"
+        values = self.numeric(table, name)
+        if values is not None:
+            present = values[~np.isnan(values)]
+            nulls = len(values) - len(present)
+            if present.size == 0:
+                return f"- {name}: numeric, all null"
+            q = np.quantile(present, [0, 0.25, 0.5, 0.75, 1])
+            return (f"- {name}: numeric, nulls={nulls}, min={_fmt(q[0])}, p25={_fmt(q[1])}, median={_fmt(q[2])}, "
+                    f"p75={_fmt(q[3])}, max={_fmt(q[4])}, mean={_fmt(present.mean())}")
+        col = self._series(table, name)
+        counts = col.value_counts(dropna=True)
+        top = ", ".join(f"{_fmt(v)} ({n})" for v, n in counts.head(TOP_K).items())
+        return f"- {name}: text, nulls={int(col.isna().sum())}, distinct={len(counts)}, top: {top}"
+
+    def _mentioned(self, table: int, question: str) -> list[str]:
+        names = [str(c) for c in self.ctx.tables[table].columns]
+        return [n for n in names if re.search(_name_pattern(n), question, re.I)]
+
+    def _label_column(self, table: int) -> str | None:
+        """The column that names a row (title, name, ...), for reporting argmax/argmin."""
+        pos = self.ctx.column(table, "title")
+        return str(self.ctx.tables[table].columns[pos]) if pos is not None else None
+
+    def _aggregations(self, table: int) -> list[str]:
+        lines: list[str] = []
+        for question in self.questions:
+            names = self._mentioned(table, question)
+            numeric = [n for n in names if self.numeric(table, n) is not None]
+            if "correlation" in question.lower() and len(numeric) >= 2:
+                x, y = self.numeric(table, numeric[0]), self.numeric(table, numeric[1])
+                mask = ~(np.isnan(x) | np.isnan(y))
+                if mask.sum() > 1:
+                    lines.append(f"- corr({numeric[0]}, {numeric[1]}) = {_fmt(np.corrcoef(x[mask], y[mask])[0, 1])}")
+            for pattern, agg in AGGREGATIONS:
+                if not pattern.search(question):
+                    continue
+                for name in numeric:
+                    lines.append(self._aggregate(table, name, agg))
+        return list(dict.fromkeys(line for line in lines if line))
+
+    def _aggregate(self, table: int, name: str, agg: str) -> str:
+        values = self.numeric(table, name)
+        present = ~np.isnan(values)
+        if not present.any():
+            return ""
+        if agg in ("max", "min"):
+            i = int(np.nanargmax(values) if agg == "max" else np.nanargmin(values))
+            label = self._label_column(table)
+            at = f" ({label} = {_fmt(self._series(table, label).iloc[i])})" if label and label != name else ""
+            return f"- {agg}({name}) = {_fmt(values[i])}{at}"
+        if agg == "count":
+            return f"- count({name} not null) = {int(present.sum())}"
+        fn: Callable[[np.ndarray], float] = {"mean": np.mean, "sum": np.sum, "median": np.median}[agg]
+        return f"- {agg}({name}) = {_fmt(fn(values[present]))}"
+
+    def _sample(self, table: int) -> str:
+        df = self.ctx.tables[table]
+        head = df.head(SAMPLE_ROWS) if isinstance(df, DuckTable) else df.iloc[:SAMPLE_ROWS]
+        return head.map(_fmt).to_csv(index=False).strip()
+
+    def render(self) -> str:
+        """The digest text, at most about `max_tokens` tokens; empty if it can't be built."""
+        with span("compute"):
+            try:
+                return self._render()
+            except Exception as e:
+                # the prompt can do without it: the questions still go to the LLM
+                logger.warning(f"Table digest failed: {e}")
+                return ""
+
+    def _render(self) -> str:
+        sections: list[list[str]] = [[] for _ in range(4)]  # schema, aggregations, stats, samples
+        for t, df in enumerate(self.ctx.tables):
+            names = [str(c) for c in df.columns]
+            dtypes = ", ".join(f"{n} ({'number' if self._is_number(t, n) else 'text'})" for n in names)
+            sections[0].append(f"Table {t}: {len(df)} rows; columns: {dtypes}")
+            aggs = self._aggregations(t)
+            if aggs:
+                sections[1].append(f"Table {t} computed over all rows:")
+                sections[1].extend(aggs)
+            sections[2].append(f"Table {t} column stats:")
+            # columns the questions name first, so they survive truncation
+            named = {n for q in self.questions for n in self._mentioned(t, q)}
+            sections[2].extend(self._column_line(t, n) for n in sorted(names, key=lambda n: n not in named))
+            sections[3].append(f"Table {t} first rows:\n{self._sample(t)}")
+
+        out: list[str] = []
+        used = 0
+        for section in sections:
+            for line in section:
+                cost = estimate_tokens(line) + 1
+                if used + cost > self.max_tokens:
+                    left = (self.max_tokens - used - 1) * 4
+                    if left > 80:  # worth a truncated line (e.g. the schema of a very wide table)
+                        out.append(line[: left - 1] + "…")
+                        used = self.max_tokens
+                    break
+                out.append(line)
+                used += cost
+        return "\n".join(out)
@@ -0,0 +1,321 @@
+import logging
+import operator
+import re
+from collections.abc import Callable
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from app.analyzer.context import ROLE_PARSERS, AnalysisContext
+from app.config import CSV_CHUNK_ROWS, PLOT_MAX_POINTS
+from app.tool.chunked import Comoments, Moments, TopK, chunks_of
+from app.tool.density import Density
+from app.tool.duck import DuckTable
+from app.tool.render import PlotSpec
+from app.tool.tables import UNIT_SCALE
+from app.utils.metrics import span
+
+logger = logging.getLogger(__name__)
+
+# A handler gets the request's tables and the question's regex match. It returns the
+# answer, or None when the data doesn't support it (the question then goes to the LLM).
+# Charts come back as a PlotSpec; the runner renders all of a request's charts together.
+Handler = Callable[[AnalysisContext, re.Match], Any]
+
+AMOUNT = r"\$\s*(?P<amount>\d+(?:\.\d+)?)\s*(?P<unit>billion|bn|million|mn|m|k)?\b"
+COLUMN = r"(?:the\s+)?[\"'`]?(?P<{}>[\w][\w\s%()./-]*?)[\"'`]?"
+END = r"\s*[?.]?\s*$"
+
+# Summary statistics by the words questions use for them
+STATS: dict[str, Callable[[Moments], float]] = {
+    "mean": lambda s: s.mean, "average": lambda s: s.mean,
+    "min": lambda s: s.min, "minimum": lambda s: s.min, "lowest": lambda s: s.min, "smallest": lambda s: s.min,
+    "max": lambda s: s.max, "maximum": lambda s: s.max, "highest": lambda s: s.max, "largest": lambda s: s.max,
+    "sum": lambda s: s.total, "total": lambda s: s.total,
+    "standard deviation": lambda s: s.std(), "std": lambda s: s.std(),
+    "variance": lambda s: s.variance(),
+}
+# The same statistics as DuckDB aggregates, for views
+STATS_SQL: dict[str, str] = {
+    "mean": "avg", "average": "avg",
+    "min": "min", "minimum": "min", "lowest": "min", "smallest": "min",
+    "max": "max", "maximum": "max", "highest": "max", "largest": "max",
+    "sum": "sum", "total": "sum",
+    "standard deviation": "stddev_samp", "std": "stddev_samp",
+    "variance": "var_samp",
+}
+COMPARISONS = {
+    "above": (">", operator.gt), "over": (">", operator.gt), "greater than": (">", operator.gt),
+    "more than": (">", operator.gt), "at least": (">=", operator.ge),
+    "below": ("<", operator.lt), "under": ("<", operator.lt), "less than": ("<", operator.lt),
+    "at most": ("<=", operator.le),
+}
+
+
+def _amount(m: re.Match) -> float:
+    unit = (m.group("unit") or "").lower()
+    return float(m.group("amount")) * UNIT_SCALE.get(unit, 1.0)
+
+
+def _pair(ctx: AnalysisContext, a: str, b: str) -> tuple[np.ndarray, np.ndarray] | None:
+    """Numeric values of two named columns from the same table, rows with both present."""
+    table = ctx.table_for(a, b)
+    if ctx.column(table, a) is None or ctx.column(table, b) is None:
+        return None
+    x, y = ctx.numeric(table, a), ctx.numeric(table, b)
+    mask = ~(np.isnan(x) | np.isnan(y))
+    if mask.sum() < 2:
+        return None
+    return x[mask], y[mask]
+
+
+def _number(value: Any) -> Any:
+    value = value.item() if isinstance(value, np.generic) else value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else round(value, 6)
+    return value
+
+
+def _column(ctx: AnalysisContext, role: str) -> tuple[int, str] | None:
+    """Table and column name of a named column."""
+    table = ctx.table_for(role)
+    pos = ctx.column(table, role)
+    return None if pos is None else (table, str(ctx.tables[table].columns[pos]))
+
+
+def count_over_before(ctx: AnalysisContext, m: re.Match) -> int | None:
+    table = ctx.table_for("gross", "year")
+    if ctx.column(table, "gross") is None:
+        return None
+    scan = ctx.scan(table, "gross", "year")
+    if scan:
+        view, (gross, year) = scan
+        return int(view.scalar("count(*)", f"{gross} >= ? AND coalesce({year}, 9999) < ?",
+                               [_amount(m), int(m.group("year"))]))
+    films = ctx.frame(table, "year", "gross")
+    return int(((films["gross"] >= _amount(m)) & (films["year"].fillna(9999) < int(m.group("year")))).sum())
+
+
+def earliest_over(ctx: AnalysisContext, m: re.Match) -> str | None:
+    table = ctx.table_for("title", "gross")
+    if ctx.column(table, "title") is None or ctx.column(table, "gross") is None:
+        return None
+    films = ctx.frame(table, "title", "year", "gross")
+    hit = films[films["gross"] > _amount(m)].sort_values(["year", "gross"])
+    return None if hit.empty else str(hit["title"].iloc[0])
+
+
+def correlation(ctx: AnalysisContext, m: re.Match) -> float | None:
+    a, b = m.group("a").strip(), m.group("b").strip()
+    scan = ctx.scan(ctx.table_for(a, b), a, b)
+    if scan:
+        view, (x, y) = scan
+        r = view.scalar(f"corr({x}, {y})")  # rows where either is NULL are skipped
+        return None if r is None else round(float(r), 6)
+    pair = _pair(ctx, a, b)
+    if pair is None:
+        return None
+    return round(float(np.corrcoef(*pair)[0, 1]), 6)
+
+
+def regression(ctx: AnalysisContext, m: re.Match) -> float | None:
+    """Slope or intercept of the least-squares line of b on a."""
+    b, a = m.group("b").strip(), m.group("a").strip()
+    scan = ctx.scan(ctx.table_for(a, b), a, b)
+    if scan:
+        view, (x, y) = scan
+        value = view.scalar(f"regr_{m.group('stat').lower()}({y}, {x})")
+        return None if value is None else round(float(value), 6)
+    pair = _pair(ctx, a, b)
+    if pair is None:
+        return None
+    fit = Comoments()
+    for start in range(0, len(pair[0]), CSV_CHUNK_ROWS):
+        fit.update(pair[0][start:start + CSV_CHUNK_ROWS], pair[1][start:start + CSV_CHUNK_ROWS])
+    value = fit.slope() if m.group("stat").lower() == "slope" else fit.intercept()
+    return None if np.isnan(value) else round(float(value), 6)
+
+
+def summary(ctx: AnalysisContext, m: re.Match) -> Any:
+    """
+    Mean, min, max, sum, standard deviation or variance of a column: aggregated by DuckDB
+    for a view, from the table's profile for a frame.
+    """
+    col = m.group("a").strip()
+    found = _column(ctx, col)
+    if found is None:
+        return None
+    table, name = found
+    stat = re.sub(r"\s+", " ", m.group("stat").lower())
+    scan = ctx.scan(table, col)
+    if scan:
+        view, (x,) = scan
+        value = view.scalar(f"{STATS_SQL[stat]}({x})")
+        return None if value is None else _number(value if isinstance(value, int) else float(value))
+    stats = None if isinstance(ctx.tables[table], DuckTable) else ctx.profile(table).moments.get(name)
+    if stats is None:
+        # a text column of numbers ("$1,234"): one pass over its parsed values
+        stats = Moments()
+        for chunk in chunks_of(pd.Series(ctx.numeric(table, col)), CSV_CHUNK_ROWS):
+            stats.update(chunk.to_numpy())
+    if not stats.n:
+        return None
+    value = STATS[stat](stats)
+    return None if np.isnan(value) else _number(value)
+
+
+def count_rows(ctx: AnalysisContext, m: re.Match) -> int | None:
+    if len(ctx.tables) != 1:
+        return None
+    return len(ctx.tables[0])  # a view's count(*) is DuckDB's
+
+
+def count_where(ctx: AnalysisContext, m: re.Match) -> int | None:
+    """Rows whose value in a column compares to a number: "How many rows have x above 3?"."""
+    col = m.group("a").strip()
+    found = _column(ctx, col)
+    if found is None:
+        return None
+    table, _ = found
+    sql, compare = COMPARISONS[re.sub(r"\s+", " ", m.group("op").lower())]
+    value = float(m.group("value"))
+    scan = ctx.scan(table, col)
+    if scan:
+        view, (x,) = scan
+        return int(view.scalar("count(*)", f"{x} {sql} ?", [value]))
+    return int(compare(ctx.numeric(table, col), value).sum())
+
+
+def top_values(ctx: AnalysisContext, m: re.Match) -> Any:
+    """
+    Most frequent value of a column, or the k most frequent: grouped by DuckDB for a view,
+    from the table's profile for a frame.
+    """
+    col = m.group("a").strip()
+    found = _column(ctx, col)
+    if found is None:
+        return None
+    table, name = found
+    k = int(m.group("k") or 1)
+    df = ctx.tables[table]
+    # a role whose text is normalized (years, ranks) is counted over the parsed values
+    if isinstance(df, DuckTable) and (col.lower() not in ROLE_PARSERS or df.is_numeric(name)):
+        counts = df.top(name, k)
+    else:
+        top = None if isinstance(df, DuckTable) else ctx.profile(table).top.get(name)
+        if top is None:
+            top = TopK()
+            for chunk in chunks_of(ctx.values(table, col), CSV_CHUNK_ROWS):
+                top.update(chunk)
+        counts = top.top(k)
+    values = [_number(value) for value, _ in counts]
+    if not values:
+        return None
+    return values[0] if m.group("k") is None else values
+
+
+def scatterplot(ctx: AnalysisContext, m: re.Match) -> PlotSpec | None:
+    a, b = m.group("a").strip(), m.group("b").strip()
+    pair = _pair(ctx, a, b)
+    if pair is None:
+        return None
+    dotted_red = bool(re.search(r"dotted\s+red|red\s+dotted", m.string, re.I))
+    if len(pair[0]) > PLOT_MAX_POINTS:
+        # binned here, so the spec carries a small grid to the plot worker instead of every point
+        return PlotSpec("density_with_regression", Density.of(*pair), a, b, dotted_red=dotted_red)
+    return PlotSpec("scatter_with_regression", *pair, a, b, dotted_red=dotted_red)
+
+
+def lookup(ctx: AnalysisContext, m: re.Match) -> Any:
+    """A single cell: "What was the worldwide gross of Titanic?" -> the row titled Titanic."""
+    col, key = m.group("a").strip(), m.group("key").strip(" \"'`").lower()
+    table = ctx.table_for(col, "title")
+    pos, label = ctx.column(table, col), ctx.column(table, "title")
+    if pos is None or label is None or pos == label:
+        return None
+    hits = np.flatnonzero((ctx.values(table, "title").astype(str).str.strip().str.lower() == key).to_numpy())
+    if len(hits) != 1:
+        return None
+    number = ctx.numeric(table, col)[hits[0]]
+    if not np.isnan(number):
+        return int(number) if float(number).is_integer() else float(number)
+    value = ctx.values(table, col).iloc[hits[0]]
+    return None if pd.isna(value) else str(value)
+
+
+HANDLERS: list[tuple[re.Pattern, Handler]] = [
+    (re.compile(r"how many .*?" + AMOUNT + r".*?before (?P<year>\d{4})", re.I), count_over_before),
+    (re.compile(r"earliest .*?(?:over|above|more than) " + AMOUNT, re.I), earliest_over),
+    (
+        re.compile(r"correlation between " + COLUMN.format("a") + r" and " + COLUMN.format("b") + r"\s*[?.]?$", re.I),
+        correlation,
+    ),
+    (
+        re.compile(
+            r"scatter\s*plot of " + COLUMN.format("a") + r" and " + COLUMN.format("b") + r"(?:\s+(?:along|with)\b|[,.]|$)",
+            re.I,
+        ),
+        scatterplot,
+    ),
+    (
+        re.compile(
+            r"(?P<stat>slope|intercept) of (?:the )?regression(?: line)? of " + COLUMN.format("b")
+            + r" (?:on|against|vs\.?) " + COLUMN.format("a") + END,
+            re.I,
+        ),
+        regression,
+    ),
+    (
+        re.compile(
+            r"\b(?P<stat>mean|average|min(?:imum)?|max(?:imum)?|lowest|smallest|highest|largest|sum|total|"
+            r"standard\s+deviation|std|variance)\s+(?:value\s+)?(?:of|in)\s+" + COLUMN.format("a") + END,
+            re.I,
+        ),
+        summary,
+    ),
+    (re.compile(r"^\s*how many (?:rows|records|entries)(?: are there)?(?: in [^?]*)?" + END, re.I), count_rows),
+    (
+        re.compile(
+            r"how many (?:rows|records|entries) (?:have|has|with|where) " + COLUMN.format("a")
+            + r" (?:is |are )?(?P<op>above|over|greater than|more than|at least|below|under|less than|at most) "
+            r"(?P<value>-?\d+(?:\.\d+)?)" + END,
+            re.I,
+        ),
+        count_where,
+    ),
+    (
+        re.compile(
+            r"(?:top|most (?:common|frequent))(?: (?P<k>\d+))? values? (?:of|in) " + COLUMN.format("a") + END, re.I
+        ),
+        top_values,
+    ),
+    (
+        re.compile(r"^\s*what(?:'s| is| was| are| were) " + COLUMN.format("a") + r" (?:of|for) (?P<key>.+?)\s*\??\s*$", re.I),
+        lookup,
+    ),
+]
+
+
+def has_handler(question: str) -> bool:
+    """Cheap routing check: does any deterministic handler recognise the question?"""
+    return any(pattern.search(question) for pattern, _ in HANDLERS)
+
+
+def answer_locally(ctx: AnalysisContext, question: str) -> tuple[bool, Any]:
+    """
+    (True, answer) if a deterministic handler could answer from the tables, else (False, None).
+    """
+    for pattern, handler in HANDLERS:
+        m = pattern.search(question)
+        if not m:
+            continue
+        try:
+            with span("compute"):
+                answer = handler(ctx, m)
+        except Exception as e:
+            logger.warning(f"Local handler {handler.__name__} failed: {e}")
+            continue
+        if answer is not None:
+            return True, answer
+    return False, None
@@ -0,0 +1,289 @@
+import logging
+import math
+import re
+import threading
+import time
+from decimal import Decimal
+from typing import Any
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+
+from app.analyzer.context import AnalysisContext, _name_pattern
+from app.analyzer.handlers import AMOUNT, _amount
+from app.config import PLAN_CACHE_SIZE
+from app.tool.duck import DuckTable, quote
+from app.utils.cache import LRUCache
+from app.utils.metrics import CACHE_REQUESTS, span
+
+logger = logging.getLogger(__name__)
+
+# Slot kinds in a question template, besides column names ("c"): dollar amounts, years, numbers
+VALUE_SLOTS = [
+    ("a", re.compile(AMOUNT, re.I)),
+    ("y", re.compile(r"(?<![\w.$])(?:1[5-9]|20)\d{2}(?![\w.])")),
+    ("n", re.compile(r"(?<![\w.$])\d+(?:\.\d+)?(?![\w.])")),
+]
+NUMBER = re.compile(r"(?<![\w.{])\d+(?:\.\d+)?(?:e[+-]?\d+)?(?![\w.}])", re.I)
+TABLE_REF = re.compile(r"\b(from|join)\s+\"?t(\d+)\"?(?![\w\"])", re.I)
+# Plans are LLM-written SQL run against the request's data. They run in a sandbox (see
+# `_sandbox`) that can't reach files, the network, Python objects or its own settings; these
+# patterns only turn away what is plainly not one read-only query before it gets there
+STATEMENT = re.compile(r"^\s*(?:select|with)\b[^;]*;?\s*$", re.I | re.S)
+FORBIDDEN = re.compile(
+    r"\b(?:read_\w+|\w+_scan|glob|copy|attach|detach|install|load|pragma|set|reset|call|export|import|"
+    r"create|insert|update|delete|drop|alter|getenv|current_setting)\b|'[^']*[/\\][^']*'",
+    re.I,
+)
+
+PLAN_PROMPT = """- When an answer is computed from the tables, add "sql": one DuckDB SELECT returning just
+  that value, reading Table 0 as t0, Table 1 as t1, ... and columns by their exact quoted names."""
+
+
+class Shape:
+    """
+    A question reduced to its template: column names replaced by {c0}, {c1}, ..., dollar
+    amounts by {a0}, years by {y0}, other numbers by {n0}, in order of appearance. `slots`
+    holds what each placeholder stands for in this question, as an SQL fragment.
+    """
+
+    def __init__(self, template: str, slots: dict[str, str], schema: tuple[tuple[str, ...], ...]):
+        self.template = template
+        self.slots = slots
+        self.schema = schema
+
+    @property
+    def key(self) -> tuple:
+        return self.template, self.schema
+
+    @classmethod
+    def of(cls, ctx: AnalysisContext, question: str) -> "Shape":
+        text = re.sub(r"\s+", " ", question.strip().lower()).rstrip("?.! ")
+        schema = tuple(tuple(str(c) for c in table.columns) for table in ctx.tables)
+        spans: list[tuple[int, int, str, str]] = []  # start, end, kind, SQL
+
+        def free(start: int, end: int) -> bool:
+            return all(end <= s or start >= e for s, e, _, _ in spans)
+
+        # longest names first, so "worldwide gross" wins over "gross"
+        for name in sorted({c for columns in schema for c in columns}, key=len, reverse=True):
+            for m in re.finditer(_name_pattern(name), text):
+                if free(m.start(), m.end()):
+                    spans.append((m.start(), m.end(), "c", quote(name)))
+        for kind, pattern in VALUE_SLOTS:
+            for m in pattern.finditer(text):
+                if free(m.start(), m.end()):
+                    value = _amount(m) if kind == "a" else float(m.group())
+                    spans.append((m.start(), m.end(), kind, _literal(value)))
+
+        parts, slots, counts, end = [], {}, {}, 0
+        for start, stop, kind, sql in sorted(spans):
+            slot = f"{kind}{counts.setdefault(kind, 0)}"
+            counts[kind] += 1
+            parts.append(text[end:start] + "{" + slot + "}")
+            slots[slot] = sql
+            end = stop
+        parts.append(text[end:])
+        return cls("".join(parts), slots, schema)
+
+
+class Plan:
+    """
+    SQL answering every question of one shape: the slots of the template appear in it as
+    {c0}, {a0}, ... and the tables as {t0}, {t1}, ..., filled in for each question.
+    """
+
+    def __init__(self, sql: str, llm_seconds: float):
+        self.sql = sql
+        self.llm_seconds = llm_seconds  # how long the LLM took for the answer this plan replaces
+
+    def render(self, slots: dict[str, str], tables: dict[int, str]) -> str:
+        return self.sql.format(**slots, **{f"t{i}": name for i, name in tables.items()})
+
+
+def _literal(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _templated(sql: str, shape: Shape) -> str | None:
+    """The LLM's SQL with this question's slot values and tables replaced by placeholders."""
+    if not STATEMENT.match(sql) or FORBIDDEN.search(sql):
+        return None
+    sql = sql.strip().rstrip(";").replace("{", "{{").replace("}", "}}")
+    sql = TABLE_REF.sub(lambda m: f"{m.group(1)} {{t{m.group(2)}}}", sql)
+    if "{t" not in sql:
+        return None
+    for slot, fragment in shape.slots.items():
+        if slot.startswith("c"):
+            name = fragment[1:-1].replace('""', '"')
+            bare = r"(?<![\w\"])" + re.escape(name) + r"(?![\w\"])" if re.fullmatch(r"[A-Za-z_]\w*", name) else None
+            sql = sql.replace(fragment, "{" + slot + "}")
+            if bare:
+                sql = re.sub(bare, "{" + slot + "}", sql, flags=re.I)
+        else:
+            # any spelling of the value: 2000000000, 2e9, 2000000000.0
+            value = float(fragment)
+            sql = NUMBER.sub(lambda m: "{" + slot + "}" if float(m.group()) == value else m.group(), sql)
+        if "{" + slot + "}" not in sql:
+            return None  # the answer doesn't follow from this slot: it would be wrong for other values
+    return sql
+
+
+def _scalar(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        value = float(value)
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    if isinstance(value, (int, str, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def _agrees(value: Any, answer: Any) -> bool:
+    """The plan's result matches the LLM's answer, allowing for the answer being rounded."""
+    if isinstance(answer, bool) or isinstance(value, bool):
+        return answer == value
+    try:
+        number = float(answer)
+    except (TypeError, ValueError):
+        return str(value).strip().lower() == str(answer).strip().lower()
+    if not isinstance(value, (int, float)):
+        return False
+    decimals = len(str(answer).partition(".")[2]) if "." in str(answer) else 0
+    return math.isclose(value, number, rel_tol=1e-6) or abs(value - number) <= 0.5 * 10**-decimals
+
+
+class Planner:
+    """
+    Question shapes compiled to SQL plans, kept in an LRU of `maxsize` shapes.
+
+    A plan comes from an LLM answer that carried its SQL: the query is templated on the
+    question's slots and kept only if, run locally, it reproduces the LLM's answer and every
+    slot is used in it. A later question of the same shape over tables with the same columns
+    is then answered by running the plan locally, with no LLM call.
+    """
+
+    def __init__(self, maxsize: int = PLAN_CACHE_SIZE):
+        self.enabled = maxsize > 0
+        self.plans = LRUCache(maxsize=max(1, maxsize))
+        self.hits = 0
+        self.misses = 0
+        self.learned = 0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def has_plan(self, ctx: AnalysisContext, question: str) -> bool:
+        """Routing check, counted as the cache lookup for the question."""
+        if not self.enabled:
+            return False
+        hit = Shape.of(ctx, question).key in self.plans
+        CACHE_REQUESTS.inc(cache="plan", result="hit" if hit else "miss")
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return hit
+
+    def answer(self, ctx: AnalysisContext, question: str) -> tuple[bool, Any]:
+        """(True, answer) from the cached plan for the question's shape, else (False, None)."""
+        if not self.enabled:
+            return False, None
+        shape = Shape.of(ctx, question)
+        plan = self.plans.get(shape.key)
+        if plan is None:
+            return False, None
+        t0 = time.perf_counter()
+        try:
+            with span("compute"):
+                value = self._run(ctx, plan.render(shape.slots, _table_names(ctx)))
+        except Exception as e:
+            logger.warning(f"Plan for {shape.template!r} failed: {e}")
+            return False, None
+        seconds = time.perf_counter() - t0
+        with self._lock:
+            self.saved_seconds += max(0.0, plan.llm_seconds - seconds)
+        logger.info(f"Plan cache hit for {shape.template!r}: {seconds * 1000:.1f} ms locally, "
+                    f"~{plan.llm_seconds:.1f}s by LLM")
+        return True, value
+
+    def learn(self, ctx: AnalysisContext, question: str, answer: Any, sql: str, llm_seconds: float) -> bool:
+        """Compile the LLM's SQL for `question` into a plan for its shape, if it checks out."""
+        if not self.enabled:
+            return False
+        shape = Shape.of(ctx, question)
+        templated = _templated(sql, shape)
+        if templated is None:
+            logger.info(f"No plan for {shape.template!r}: SQL not reusable")
+            return False
+        plan = Plan(templated, llm_seconds)
+        try:
+            value = self._run(ctx, plan.render(shape.slots, _table_names(ctx)))
+        except Exception as e:
+            logger.info(f"No plan for {shape.template!r}: {e}")
+            return False
+        if not _agrees(value, answer):
+            logger.info(f"No plan for {shape.template!r}: SQL gives {value!r}, the LLM said {answer!r}")
+            return False
+        self.plans.set(shape.key, plan)
+        with self._lock:
+            self.learned += 1
+        logger.info(f"Plan learned for {shape.template!r}")
+        return True
+
+    def _run(self, ctx: AnalysisContext, sql: str) -> Any:
+        with _sandbox() as con:
+            for i, name in _table_names(ctx).items():
+                table = ctx.tables[i]
+                con.register(name, _columns(table, sql) if isinstance(table, DuckTable) else table)
+            rows = con.execute(sql).fetchall()
+        if len(rows) != 1 or len(rows[0]) != 1:
+            raise ValueError(f"plan returned {len(rows)} rows, not a single value")
+        return _scalar(rows[0][0])
+
+    def stats(self) -> dict[str, Any]:
+        return {"hits": self.hits, "misses": self.misses, "plans": len(self.plans), "learned": self.learned,
+                "saved_seconds": round(self.saved_seconds, 2)}
+
+    def log_stats(self) -> None:
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        logger.info(f"Plan cache: {self.hits}/{lookups} hits ({rate:.0%}), {len(self.plans)} plans, "
+                    f"~{self.saved_seconds:.1f}s of LLM time saved")
+
+
+def _table_names(ctx: AnalysisContext) -> dict[int, str]:
+    """SQL name of each table in the sandbox."""
+    return {i: f"plan_t{i}" for i in range(len(ctx.tables))}
+
+
+def _sandbox() -> duckdb.DuckDBPyConnection:
+    """
+    A fresh in-memory database for one plan: no file system or network access, no extension
+    loading, no lookup of Python variables by name, and settings locked so the query can't
+    undo any of it. The request's tables are registered in it and nothing else.
+    """
+    return duckdb.connect(config={
+        "enable_external_access": False,
+        "python_enable_replacements": False,
+        "autoinstall_known_extensions": False,
+        "autoload_known_extensions": False,
+        "threads": 1,
+        "lock_configuration": True,
+    })
+
+
+def _columns(table: DuckTable, sql: str) -> pa.Table:
+    """
+    The view's columns the plan mentions, read from the request's session for the sandbox.
+    Read in full, not as a record batch reader: a reader can be scanned once, and a plan
+    that reads the table twice (a subquery over it) would see it empty the second time.
+    """
+    lowered = sql.lower()
+    columns = [c for c in table.columns if c.lower() in lowered] or table.columns[:1]
+    query = f"SELECT {', '.join(quote(c) for c in columns)} FROM {table.view}"
+    return table.session.cur.execute(query).fetch_arrow_table()
+
+
+planner = Planner()
@@ -1,5 +1,6 @@
 # app/config.py
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -15,3 +16,101 @@ HARD_TIMEOUT_SECONDS = int(os.getenv("HARD_TIMEOUT_SECONDS", "170"))  # ~<3 min
 MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", "100000"))  # 100 kB
 MAX_RESP_BYTES = int(os.getenv("MAX_RESP_BYTES", "800000"))  # safety cap
 USER_AGENT = os.getenv("USER_AGENT", "DataAnalystAgent/0.1 (+https://example.com)")
+
+# Deployment. Serverless (Vercel): no long-lived process to warm up, and a cold start per
+# instance; several defaults below depend on it
+SERVERLESS = bool(os.getenv("VERCEL"))
+
+# LLM proxy client
+OPENAI_PROXY_URL = os.getenv("OPENAI_PROXY_URL", "https://aipipe.org/openrouter/v1/chat/completions")
+LLM_MODEL = os.getenv("LLM_MODEL", "openai/gpt-4.1-nano")
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))  # in-flight calls per worker
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "16"))  # keep-alive pool size
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_SECONDS = float(os.getenv("LLM_BACKOFF_SECONDS", "0.5"))  # base for exponential backoff
+
+# Structured answers: questions go to the LLM in batches and come back as {"id", "answer"} objects
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "8"))  # questions per call
+LLM_ANSWER_ROUNDS = int(os.getenv("LLM_ANSWER_ROUNDS", "2"))  # first call plus follow-ups for missing answers
+LLM_RESPONSE_FORMAT = os.getenv("LLM_RESPONSE_FORMAT", "json_schema")  # json_schema, json_object or none
+LLM_STREAM = os.getenv("LLM_STREAM", "1") == "1"  # stream replies: answers survive a cut-off reply
+
+# Caches (must be writable; /tmp is the only writable path on serverless deploys)
+CACHE_DIR = Path(os.getenv("CACHE_DIR", Path(tempfile.gettempdir()) / "tds-agent-cache"))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "256"))  # in-process entries
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+LLM_CACHE_DISK = os.getenv("LLM_CACHE_DISK", "1") == "1"  # sqlite tier under CACHE_DIR
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Page fetching
+FETCH_TIMEOUT_SECONDS = float(os.getenv("FETCH_TIMEOUT_SECONDS", "30"))
+FETCH_POOL_SIZE = int(os.getenv("FETCH_POOL_SIZE", "8"))  # keep-alive connections per host
+FETCH_CACHE_DISK = os.getenv("FETCH_CACHE_DISK", "1") == "1"
+FETCH_CACHE_MAX_BYTES = int(os.getenv("FETCH_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+FETCH_MIN_FRESH_SECONDS = float(os.getenv("FETCH_MIN_FRESH_SECONDS", "300"))  # freshness when the server sets none
+FETCH_STALE_WHILE_REVALIDATE_SECONDS = float(os.getenv("FETCH_STALE_WHILE_REVALIDATE_SECONDS", "3600"))
+
+# Parsed-table cache (selected table per page content hash)
+TABLE_CACHE_SIZE = int(os.getenv("TABLE_CACHE_SIZE", "16"))  # in-process entries
+TABLE_CACHE_DISK = os.getenv("TABLE_CACHE_DISK", "1") == "1"  # Arrow IPC files under CACHE_DIR
+# Table store: those files, memory-mapped by every worker of the host (app.tool.store)
+TABLE_STORE_MAX_BYTES = int(os.getenv("TABLE_STORE_MAX_BYTES", str((256 if SERVERLESS else 1024) * 1024 * 1024)))
+
+# Upload ingestion (multipart parts are parsed as they arrive)
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(1024 * 1024 * 1024)))  # per file
+UPLOAD_TOTAL_MAX_BYTES = int(os.getenv("UPLOAD_TOTAL_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))  # per request
+UPLOAD_SPILL_BYTES = int(os.getenv("UPLOAD_SPILL_BYTES", str(16 * 1024 * 1024)))  # buffered in memory below this
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "100000"))
+
+# DuckDB engine (one database per worker, opened at startup)
+DUCK_EXTENSIONS = tuple(e for e in os.getenv("DUCK_EXTENSIONS", "parquet,httpfs").split(",") if e)
+DUCK_POOL_SIZE = int(os.getenv("DUCK_POOL_SIZE", "8"))  # pooled connections
+DUCK_THREADS = int(os.getenv("DUCK_THREADS", "0"))  # 0: DuckDB's default (all cores)
+DUCK_MEMORY_LIMIT = os.getenv("DUCK_MEMORY_LIMIT", "")  # e.g. "1GB"; spills to disk beyond it
+DUCK_SCAN_BYTES = int(os.getenv("DUCK_SCAN_BYTES", str(64 * 1024 * 1024)))  # larger uploads are scanned, not loaded
+
+# Question plans: SQL learned from LLM answers, reused for questions of the same shape (0: off)
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "256"))
+
+# Prompt: size of the table digest sent in place of raw rows
+PROMPT_TABLE_TOKENS = int(os.getenv("PROMPT_TABLE_TOKENS", "1500"))
+
+# Per-question pipeline
+PIPELINE_CONCURRENCY = int(os.getenv("PIPELINE_CONCURRENCY", "4"))  # LLM batches in flight per request
+
+# Admission control (per worker): requests beyond ADMIT_REQUESTS wait in a queue of at most
+# ADMIT_QUEUE, and are turned away with 503 when it is full or they couldn't finish in time.
+# Inside a request, fetches and CPU-heavy stages (parse, compute, plot) take a slot of their
+# class, LLM calls one of LLM_MAX_CONCURRENCY
+ADMIT_REQUESTS = int(os.getenv("ADMIT_REQUESTS", "16"))
+ADMIT_QUEUE = int(os.getenv("ADMIT_QUEUE", "32"))
+ADMIT_CPU = int(os.getenv("ADMIT_CPU", str(max(2, os.cpu_count() or 1))))
+ADMIT_FETCH = int(os.getenv("ADMIT_FETCH", str(FETCH_POOL_SIZE)))
+
+# Plot rendering: worker processes (0 renders in a thread of the server process; the default
+# on serverless, where spawning workers would add to every cold start)
+PLOT_WORKERS = int(os.getenv("PLOT_WORKERS", "0" if SERVERLESS else str(min(2, os.cpu_count() or 1))))
+# Scatter plots of more points than this are drawn as a density grid of PLOT_GRID x PLOT_GRID bins
+PLOT_MAX_POINTS = int(os.getenv("PLOT_MAX_POINTS", "20000"))
+PLOT_GRID = int(os.getenv("PLOT_GRID", "120"))
+
+# Load the heavy modules, plot workers and DuckDB at startup rather than on the first request
+WARMUP = os.getenv("WARMUP", "0" if SERVERLESS else "1") == "1"
+
+# matplotlib's font cache. The Docker image builds one in at MPLCONFIGDIR; on a read-only
+# home matplotlib would rebuild it in a new temp dir on every cold start, so keep it in /tmp
+if "MPLCONFIGDIR" not in os.environ and not os.access(Path.home(), os.W_OK):
+    os.environ["MPLCONFIGDIR"] = str(CACHE_DIR / "matplotlib")
+
+# Instrumentation: stage histograms and counters served on /metrics (off: spans are no-ops)
+METRICS_ENABLED = os.getenv("METRICS", "1") == "1"
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"  # per-request Server-Timing header
+
+# Share of HARD_TIMEOUT_SECONDS each request stage may use, in pipeline order
+BUDGET_SHARES = {
+    stage: float(share)
+    for stage, share in (
+        item.split("=") for item in os.getenv("BUDGET_SHARES", "fetch=0.2,parse=0.1,compute=0.15,llm=0.45,plot=0.1").split(",")
+    )
+}
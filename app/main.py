@@ -1,42 +1,235 @@
+import asyncio
+import json
+import logging
 import os
-import shutil
-import tempfile
-from pathlib import Path
+import sys
+import time
+from collections.abc import Callable
+from contextlib import asynccontextmanager
 
-import uvicorn
-from fastapi import FastAPI, File, UploadFile
+from fastapi import FastAPI, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+from .config import BUDGET_SHARES, HARD_TIMEOUT_SECONDS, METRICS_ENABLED, SERVER_TIMING, WARMUP
+from .utils import metrics
+from .utils.admission import Overloaded, admission
+from .utils.timing import Budget
+
+# The pipeline (pandas, numpy, pyarrow, DuckDB, lxml, httpx, ...) is imported on the first
+# /api/ request or by `warm_up`, not here: the health check and /metrics of a cold
+# serverless instance don't pay for it.
+
+logger = logging.getLogger(__name__)
+
+
+async def warm_up() -> None:
+    """
+    Import the pipeline, bring the plot workers up with matplotlib imported and open DuckDB
+    with its extensions, so the first request of a long-lived container pays none of it.
+    """
+    t0 = time.perf_counter()
+    from . import runner  # noqa: F401
+    from .tool import duck, web  # noqa: F401
+    from .tool.render import renderer
+
+    await renderer.start()
+    await asyncio.to_thread(duck.engine.start)
+    logger.info(f"Warm-up done in {time.perf_counter() - t0:.2f}s")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP:
+        await warm_up()
+    yield
+    # shut down only what was loaded: the LLM proxy connections, plot workers, DuckDB, and
+    # count this worker's table store hits
+    if (llm := sys.modules.get("app.tool.llm")) is not None:
+        await llm.aclose()
+    if (render := sys.modules.get("app.tool.render")) is not None:
+        render.renderer.shutdown()
+    if (duck := sys.modules.get("app.tool.duck")) is not None:
+        duck.engine.close()
+    if (store := sys.modules.get("app.tool.store")) is not None:
+        store.store.flush()
 
-from .runner import process_questions
 
 app = FastAPI(
     title="Data Analyst Agent API",
     description="API to process analytical questions, datasets, and generate outputs using LLM.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 
+if METRICS_ENABLED:
+    # registered only with metrics on, so turning them off takes the middleware out entirely
+
+    @app.middleware("http")
+    async def trace_requests(request: Request, call_next):
+        t0 = time.perf_counter()
+        with metrics.trace() as trace:
+            response = await call_next(request)
+        route = request.scope.get("route")
+        labels = {"route": getattr(route, "path", "other"), "status": str(response.status_code)}
+        metrics.REQUESTS.inc(**labels)
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - t0, **labels)
+        if trace.spans:
+            timing = trace.server_timing()
+            logger.info(f"{request.method} {request.url.path}: {timing}")
+            if SERVER_TIMING:
+                response.headers["Server-Timing"] = timing
+        return response
+
+
+async def _admit(budget: Budget) -> float | JSONResponse:
+    """The time the request was admitted (hand it to `admission.done`), or the 503 to send."""
+    try:
+        return await admission.admit(budget)
+    except Overloaded as e:
+        return JSONResponse(
+            {"error": str(e)}, status_code=503, headers={"Retry-After": f"{e.retry_after:.0f}"}
+        )
+
+
+async def _ingest(request: Request, budget: Budget):
+    """The request's upload, or the error response to send instead."""
+    from .utils.io import UploadError, UploadTooLarge, ingest
+
+    try:
+        with budget.stage("upload"), metrics.span("upload"):
+            return await ingest(request)
+    except UploadTooLarge as e:
+        return JSONResponse({"error": str(e)}, status_code=413)
+    except UploadError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+
 @app.post("/api/")
-async def analyze_api(
-    questions: UploadFile = File(...), attachments: list[UploadFile] = File(default=[])
-):
-    with tempfile.TemporaryDirectory() as tmpdir:
-        tmp_path = Path(tmpdir)
-
-        # Save questions
-        questions_path = tmp_path / "questions.txt"
-        with open(questions_path, "wb") as f:
-            shutil.copyfileobj(questions.file, f)
-
-        # Save attachments
-        attachments_dir = tmp_path / "attachments"
-        attachments_dir.mkdir(exist_ok=True)
-        for att in attachments:
-            with open(attachments_dir / att.filename, "wb") as f:
-                shutil.copyfileobj(att.file, f)
+async def analyze_api(request: Request):
+    """
+    multipart/form-data: a `questions` file (or any file named questions.txt) plus any
+    number of attachments. Files are parsed while they upload (see utils.io.ingest).
+    Under overload the request is turned away with 503 and Retry-After before its body is
+    read (see utils.admission).
+    """
+    from .runner import process_questions
+
+    budget = Budget(HARD_TIMEOUT_SECONDS, BUDGET_SHARES, admission.stage_gates())
+    admitted = await _admit(budget)
+    if isinstance(admitted, JSONResponse):
+        return admitted
+    try:
+        upload = await _ingest(request, budget)
+        if isinstance(upload, JSONResponse):
+            return upload
 
         # Process questions using LLM + tools
-        answers = await process_questions(questions_path, attachments_dir)
-        return answers
+        try:
+            answers = await process_questions(upload.questions, list(upload.tables.values()), budget)
+        finally:
+            upload.close()
+    finally:
+        admission.done(admitted)
+    # per-stage seconds used / allotted, e.g. "fetch=0.412/34.0, ..., total=2.9/170.0"
+    return JSONResponse(jsonable_encoder(answers), headers={"X-Stage-Budget": budget.header()})
+
+
+class _StreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse that calls `release` however sending ends. A background task isn't
+    enough: Starlette skips it when the client is gone before the first byte (and then the
+    body never starts either), and a cancelled send cancels it before it runs.
+    """
+
+    def __init__(self, content, release: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+
+def _event(event: str, data: dict, sse: bool) -> bytes:
+    if sse:
+        return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n".encode()
+    return (json.dumps(jsonable_encoder({"event": event, **data}), ensure_ascii=False) + "\n").encode()
+
+
+@app.post("/api/stream")
+async def analyze_stream_api(request: Request):
+    """
+    Same input as /api/, but every answer is sent as soon as it is ready instead of all at
+    the end: one {"event": "answer", "index", "key", "answer"} line of NDJSON per question,
+    in the order they finish, then {"event": "done", "answers", "budget"} with the answers
+    assembled as /api/ returns them. With `Accept: text/event-stream` the same messages go
+    out as Server-Sent Events. `key` is the answer's key when the task asks for an object.
+    """
+    from .runner import process_questions
+
+    budget = Budget(HARD_TIMEOUT_SECONDS, BUDGET_SHARES, admission.stage_gates())
+    admitted = await _admit(budget)
+    if isinstance(admitted, JSONResponse):
+        return admitted
+    try:
+        upload = await _ingest(request, budget)
+    except BaseException:
+        admission.done(admitted)
+        raise
+    if isinstance(upload, JSONResponse):
+        admission.done(admitted)
+        return upload
+    sse = "text/event-stream" in request.headers.get("accept", "")
+    queue: asyncio.Queue[tuple[str, dict]] = asyncio.Queue()
+    released = False
+
+    def release() -> None:
+        # from the body's finally or the response's, whichever comes first
+        nonlocal released
+        if not released:
+            released = True
+            upload.close()
+            admission.done(admitted)
+
+    def send(i: int, key: str | None, answer) -> None:
+        queue.put_nowait(("answer", {"index": i, "key": key, "answer": answer}))
+
+    async def run() -> None:
+        try:
+            answers = await process_questions(upload.questions, list(upload.tables.values()), budget, send)
+            queue.put_nowait(("done", {"answers": answers, "budget": budget.header()}))
+        except Exception as e:
+            logger.exception("Streaming request failed")
+            queue.put_nowait(("error", {"error": str(e)}))
+
+    async def events():
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event, data = await queue.get()
+                yield _event(event, data, sse)
+                if event != "answer":
+                    return
+        finally:
+            # also on client disconnect: stop answering and release the upload's files
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            release()
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}  # no proxy buffering
+    media_type = "text/event-stream" if sse else "application/x-ndjson"
+    # released by the response too: the body may never start (client gone before it did)
+    return _StreamingResponse(events(), release, media_type=media_type, headers=headers)
+
+
+@app.get("/metrics")
+async def metrics_api():
+    """Stage latency histograms and counters of this worker, in Prometheus text format."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/")
@@ -48,5 +241,7 @@ async def root():
 
 
 if __name__ == "__main__":
+    import uvicorn
+
     port = int(os.environ.get("PORT", 8000))
     uvicorn.run(app, host="0.0.0.0", port=port)
@@ -1,26 +1,70 @@
 # app/process_queries.py
-import json
+import asyncio
 import logging
 import re
+import time
+from collections.abc import Callable
+from contextlib import nullcontext
 from pathlib import Path
 from typing import Any
 
 import pandas as pd
+import pyarrow as pa
 
-from app.tool.llm import complete  # your proxy OpenAI client
-from app.tool.plot import scatter_with_regression
-from app.tool.tables import Tables
-from app.tool.web import Web
+from app.analyzer.context import AnalysisContext
+from app.analyzer.digest import TableDigest
+from app.analyzer.handlers import answer_locally, has_handler
+from app.analyzer.planner import PLAN_PROMPT, planner
+from app.config import (
+    BUDGET_SHARES,
+    HARD_TIMEOUT_SECONDS,
+    TABLE_CACHE_DISK,
+    TABLE_CACHE_SIZE,
+)
+from app.parser import ParsedTask
+from app.tool.duck import DuckTable, engine
+from app.tool.html_tables import TableExtractor
+from app.tool.render import PlotSpec, renderer
+from app.tool.store import store
+from app.tool.structured import answer_all, answer_cached
+from app.tool.tables import Tables, TableCache
+from app.utils.metrics import CACHE_REQUESTS, span
+from app.utils.payload import ResponseBytes
+from app.utils.text import estimate_tokens
+from app.utils.timing import Budget
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
+# parsed pages in the table store every worker maps; in this process only with the disk tier off
+table_cache = TableCache(store if TABLE_CACHE_DISK else None, maxsize=TABLE_CACHE_SIZE)
+
+# With less LLM budget than this left, questions are answered from the response cache only
+LLM_MIN_SECONDS = 3.0
+# With less plot budget than this left, plots are rendered small without re-encoding
+PLOT_MIN_SECONDS = 2.0
+
 
 def extract_relevant_table(html: str) -> tuple[pd.DataFrame, list[str]]:
     """
     Extract the most relevant table from HTML and determine numeric columns heuristically.
+    Results are cached by a hash of the HTML, so a repeated page skips parsing entirely.
     """
-    tables = pd.read_html(html, flavor="lxml")
+    key = TableCache.key(html)
+    cached = table_cache.get(key)
+    CACHE_REQUESTS.inc(cache="table", result="miss" if cached is None else "hit")
+    if cached is not None:
+        logger.info(f"Table cache hit for document {key[:12]}")
+        return cached
+    with span("parse"):
+        best_table, numeric_cols = _select_table(html)
+    table_cache.set(key, best_table, numeric_cols)
+    return best_table, numeric_cols
+
+
+def _select_table(html: str) -> tuple[pd.DataFrame, list[str]]:
+    # only the few best-scoring candidates are parsed into DataFrames
+    tables = TableExtractor.from_html(html, top_k=3)
     if not tables:
         raise RuntimeError("No tables found in HTML")
 
@@ -52,89 +96,216 @@ def extract_relevant_table(html: str) -> tuple[pd.DataFrame, list[str]]:
     return best_table, numeric_cols
 
 
-def clean_llm_output(text: str) -> str:
+SYSTEM_PROMPT = """
+You are a helpful data analyst. Use the tables provided to answer the questions you are given.
+- Answer each question with a single JSON value (number, string, boolean, array or object).
+- Reply with only a JSON object: {{"answers": [{{"id": "<question id>", "answer": <value>}}, ...]}},
+  one entry per question.
+- Do NOT include markdown, code fences, or extra text.
+- If a question asks for a plot, return a base64-encoded data URI under 100KB.
+{plans}
+
+Example:
+
+Questions:
+[q2] Which is the earliest film that grossed over $1.5 bn?
+Reply: {{"answers": [{{"id": "q2", "answer": "Titanic"}}]}}
+
+Task description:
+{task}
+
+Tables (statistics and computed values cover every row; prefer them over the sample rows):
+{digest}
+"""
+
+
+# Called with (question index, key in the answer object or None, answer) as each answer is final
+OnAnswer = Callable[[int, str | None, Any], None]
+
+
+def assemble_answers(task: ParsedTask, answers: list[Any]) -> list[Any] | dict[str, Any]:
     """
-    Remove markdown code fences if present to safely parse JSON.
+    Shape answers as the task asked: an object keyed by the template's keys, else an array.
     """
-    return re.sub(r"^```(?:json|plaintext)?|```$", "", text.strip(), flags=re.I | re.M)
+    if task.template_kind == "object" and task.template and len(task.template) == len(answers):
+        return dict(zip(task.template, answers))
+    return answers
+
+
+def answer_from_tables(ctx: AnalysisContext, question: str) -> tuple[bool, Any]:
+    """A deterministic handler's answer, else that of a plan learned for the question's shape."""
+    ok, answer = answer_locally(ctx, question)
+    return (ok, answer) if ok else planner.answer(ctx, question)
+
+
+def answer_keys(task: ParsedTask) -> list[str | None]:
+    """Key of each answer in the assembled object, None throughout when it is an array."""
+    shaped = assemble_answers(task, list(range(len(task.questions))))
+    return list(shaped) if isinstance(shaped, dict) else [None] * len(task.questions)
 
 
 async def process_questions(
-    questions_path: Path, attachments_dir: Path | None = None
-) -> list[dict[str, Any]]:
+    questions: str,
+    attachments: list[pd.DataFrame | pa.Table | Path] | None = None,
+    budget: Budget | None = None,
+    on_answer: OnAnswer | None = None,
+) -> list[Any] | dict[str, Any]:
     """
-    Reads questions.txt, fetches table if URL is present, sends all questions to LLM,
-    parses answers, and returns a list of dicts.
+    Takes the text of questions.txt and the attachments (DataFrames, or Arrow tables and
+    files to scan with DuckDB), fetches table if URL is present, and answers every question concurrently:
+    deterministic ones (counts, correlations, plots) locally from the tables, the rest in
+    batched LLM calls that return one answer per question id; questions whose answer is
+    missing or invalid are asked again on their own (see tool.structured). Returns answers
+    in question order.
+
+    Every stage runs within its slice of `budget` (by default HARD_TIMEOUT_SECONDS split by
+    BUDGET_SHARES). A stage that runs out degrades instead of failing the request: without
+    the page the LLM answers from the question alone, late LLM calls are served from the
+    response cache, plots render small, and unanswered questions get a placeholder.
+
+    Each answer is final as soon as it is ready -- counted against MAX_RESP_BYTES, and
+    downgraded if it doesn't fit (see utils.payload) -- and goes to `on_answer` then, in
+    whatever order the questions finish.
     """
-    questions = [q.strip() for q in questions_path.read_text(encoding="utf-8").splitlines() if q.strip()]
-    answers: list[dict[str, Any]] = []
-
-    # Load attachments into dataframes (if any)
-    dataframes: list[pd.DataFrame] = []
-    if attachments_dir and attachments_dir.exists():
-        for file in attachments_dir.iterdir():
-            if file.suffix.lower() == ".csv":
-                dataframes.append(pd.read_csv(file))
-            elif file.suffix.lower() in (".xls", ".xlsx"):
-                dataframes.append(pd.read_excel(file))
-
-    # Check if any question contains a URL
+    attachments = attachments or []
+    # files and Arrow tables (memory-mapped from the table store) are registered as views in
+    # a schema of this request's own, dropped at the end
+    session = engine.session() if any(not isinstance(a, pd.DataFrame) for a in attachments) else nullcontext()
+    with session as duck:
+        tables: list[pd.DataFrame | DuckTable] = []
+        for i, attachment in enumerate(attachments):
+            if isinstance(attachment, pd.DataFrame):
+                tables.append(attachment)
+                continue
+            try:
+                tables.append(await asyncio.to_thread(duck.register, f"attachment_{i}", attachment))
+            except Exception as e:
+                logger.warning(f"Could not scan attachment {i}: {e}")
+        budget = budget or Budget(HARD_TIMEOUT_SECONDS, BUDGET_SHARES)
+        return await _answer(ParsedTask(questions), tables, budget, on_answer)
+
+
+async def _answer(
+    task: ParsedTask, dataframes: list[pd.DataFrame | DuckTable], budget: Budget, on_answer: OnAnswer | None
+) -> list[Any] | dict[str, Any]:
+    questions = task.questions
+    keys = answer_keys(task)
+    payload = ResponseBytes(len(questions))
+    final: dict[int, Any] = {}
+
+    def settle(i: int, answer: Any) -> None:
+        if i in final:
+            return
+        final[i] = payload.admit(answer)
+        if on_answer is not None:
+            on_answer(i, keys[i], final[i])
+
     table_df: pd.DataFrame | None = None
-    numeric_cols: list[str] = []
 
-    for q in questions:
-        url_match = re.search(r"(https?://\S+)", q)
-        if url_match:
-            url = url_match.group(1)
-            logger.info(f"Fetching table from URL: {url}")
-            html = Web.get(url)
-            table_df, numeric_cols = extract_relevant_table(html)
-            break  # only fetch first table, LLM will use it for all questions
-
-    # Prepare data for LLM
-    table_json = table_df.head(20).to_dict(orient="records") if table_df is not None else []
-
-    # Construct system prompt with example
-    system_prompt = f"""
-You are a helpful data analyst. Use the table provided to answer questions.
-- Always return a JSON array of answers, in the same order as questions.
-- Do NOT include markdown, code fences, or extra text.
-- If a question asks for a plot, return a base64-encoded data URI under 100KB.
+    if task.urls:
+        from app.tool.web import Web  # requests and the fetch cache only for questions with URLs
 
-Example:
+        url = task.urls[0]  # only fetch first table, all questions use it
+        logger.info(f"Fetching table from URL: {url}")
+        html = await budget.thread("fetch", lambda: Web.get(url))
+        if html is not None:
+            table_df, _ = await budget.thread("parse", lambda: extract_relevant_table(html), fallback=(None, []))
 
-Questions:
-Scrape the list of highest grossing films from Wikipedia. It is at the URL:
-https://en.wikipedia.org/wiki/List_of_highest-grossing_films
+    tables = ([table_df] if table_df is not None else []) + dataframes
+    ctx = AnalysisContext(tables) if tables else None
 
-Answer the following questions and respond with a JSON array of strings containing the answer.
+    # Prepare data for LLM: a bounded digest of all rows, not a sample of them
+    digest = ""
+    if ctx is not None:
+        digest = await budget.thread("compute", TableDigest(ctx, questions).render, fallback="")
+        logger.info(f"Table digest: ~{estimate_tokens(digest)} tokens")
+    plans = planner.enabled and ctx is not None
+    system_prompt = SYSTEM_PROMPT.format(
+        task=task.raw.strip(), digest=digest or "(no table data)", plans=PLAN_PROMPT if plans else ""
+    )
 
-1. How many $2 bn movies were released before 2000?
-2. Which is the earliest film that grossed over $1.5 bn?
-3. What's the correlation between the Rank and Peak?
-4. Draw a scatterplot of Rank and Peak along with a dotted red regression line through it.
-   Return as a base-64 encoded data URI, `"data:image/png;base64,iVBORw0KG..."` under 100,000 bytes.
+    # LLM answers that came with their SQL: (question index, answer, SQL, seconds taken)
+    learn: list[tuple[int, Any, str, float]] = []
 
-Expected JSON answer:
-[1, "Titanic", 0.485782, "data:image/png;base64,iVBORw0KG... (response truncated)"]
+    async def ask_llm(indices: list[int]) -> dict[int, Any]:
+        # batched calls with an id per question; answers that arrive before the deadline
+        # stay in `results` even if the rest of the call is cut off
+        if not indices:
+            return {}
+        pending = {f"q{i + 1}": questions[i] for i in indices}
+        results: dict[str, Any] = {}
+        t0 = time.perf_counter()
 
-Now answer the following questions with the actual table:
+        def arrived(qid: str, answer: Any, obj: dict[str, Any]) -> None:
+            i = int(qid[1:]) - 1
+            settle(i, answer)
+            if plans and isinstance(obj.get("sql"), str):
+                learn.append((i, answer, obj["sql"], time.perf_counter() - t0))
 
-Table columns: {numeric_cols}
-Table data (first 20 rows): {json.dumps(table_json)}
-Questions:
-{json.dumps(questions, indent=2)}
-"""
+        if budget.low("llm", LLM_MIN_SECONDS):
+            budget.degrade(f"llm:cached-{len(indices)}q")
+            await answer_cached(system_prompt, pending, results, on_answer=arrived)
+        else:
+            await budget.run("llm", answer_all(system_prompt, pending, results, on_answer=arrived))
+        for i in indices:
+            logger.info(f"Question {i + 1}: llm answer={str(results.get(f'q{i + 1}'))[:200]!r}")
+        return {i: results.get(f"q{i + 1}", f"(Failed to answer question {i + 1})") for i in indices}
+
+    async def answer_local(indices: list[int]) -> dict[int, Any]:
+        # one worker thread for all local handlers: pandas/pyplot work stays serialized
+        # while the LLM-bound questions proceed concurrently
+        results = await budget.thread(
+            "compute", lambda: {i: answer_from_tables(ctx, questions[i]) for i in indices}, fallback={}
+        )
+        answered = {i: answer for i, (ok, answer) in results.items() if ok}
+        logger.info(f"Answered {len(answered)}/{len(indices)} routed questions locally")
+        for i, answer in answered.items():
+            if not isinstance(answer, PlotSpec):
+                settle(i, answer)
+        answered.update(await ask_llm([i for i in indices if i not in answered]))
+        return answered
+
+    local = [i for i, q in enumerate(questions) if ctx is not None and (has_handler(q) or planner.has_plan(ctx, q))]
+    remote = [i for i in range(len(questions)) if i not in local]
+    local_answers, remote_answers = await asyncio.gather(answer_local(local), ask_llm(remote))
+    answers = {**local_answers, **remote_answers}
+    for i, answer in answers.items():
+        if not isinstance(answer, PlotSpec):
+            settle(i, answer)  # placeholders for questions the LLM left unanswered
+
+    async def render_plots() -> None:
+        # every chart of the request renders at once, in parallel on the plot workers
+        plots = {i: spec for i, spec in answers.items() if isinstance(spec, PlotSpec)}
+        if not plots:
+            return
+        if budget.low("plot", PLOT_MIN_SECONDS):
+            budget.degrade("plot:fast")
+            for spec in plots.values():
+                spec.kwargs["fast"] = True
+        images = await budget.run("plot", renderer.render_many(list(plots.values())))
+        for i in plots:
+            answers[i] = f"(Failed to answer question {i + 1})"
+        if images is not None:
+            answers.update(zip(plots, images))
+        for i in plots:
+            settle(i, answers[i])
 
-    logger.info("Sending questions and table to LLM for answers...")
-    llm_output = complete(system=system_prompt, user="")
-    logger.info(f"llm_output='{llm_output[:200]}...'")  # truncate for logging
+    async def learn_plans() -> None:
+        # the SQL behind table answers becomes a plan for later questions of the same shape;
+        # only once the local answers are done, so no other thread is using the tables (the
+        # context's memo, a view's cursor; `budget.thread` waits out any compute thread that
+        # overran) -- plots render from their specs alone
+        if learn:
+            await budget.thread(
+                "compute", lambda: [planner.learn(ctx, questions[i], answer, sql, s) for i, answer, sql, s in learn]
+            )
 
-    try:
-        cleaned = clean_llm_output(llm_output)
-        llm_answers = json.loads(cleaned)
-    except Exception as e:
-        logger.error(f"Failed to parse LLM output: {e}")
-        llm_answers = [f"(Failed to answer question {i+1})" for i in range(len(questions))]
+    await asyncio.gather(render_plots(), learn_plans())
+    if ctx is not None:
+        ctx.log_stats()
+        planner.log_stats()
+    budget.log()
+    if payload.downgraded:
+        budget.degrade(f"response:{len(payload.downgraded)}-shrunk")
 
-    return llm_answers
+    return assemble_answers(task, [final[i] for i in range(len(questions))])
@@ -0,0 +1,213 @@
+import logging
+from collections.abc import Iterable
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+logger = logging.getLogger(__name__)
+
+# A text column of the first chunk with at most this share of distinct values is categorical
+CATEGORY_MAX_RATIO = 0.5
+# Distinct values a TopK counts exactly; past this only the heaviest are kept
+TOPK_CAPACITY = 10_000
+
+
+class Compactor:
+    """
+    Compact dtypes for a table read in chunks: integers downcast to the smallest type that
+    holds them, floats to float32 where that loses nothing, text to pyarrow-backed strings,
+    or to categoricals for columns the first chunk (the sample) shows to be repetitive.
+    Each chunk is compacted as it is read, so the object-dtype copy of the text exists for
+    one chunk at a time; `concat` joins the chunks without widening the categoricals.
+    """
+
+    def __init__(self, max_ratio: float = CATEGORY_MAX_RATIO):
+        self.max_ratio = max_ratio
+        self.categorical: set[str] | None = None
+
+    def __call__(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        if self.categorical is None:
+            limit = max(1, int(len(chunk) * self.max_ratio))
+            self.categorical = {
+                c for c in chunk.columns if chunk[c].dtype == object and chunk[c].nunique() <= limit
+            }
+        return pd.DataFrame({c: self._column(c, chunk[c]) for c in chunk.columns}, index=chunk.index)
+
+    def _column(self, name: str, s: pd.Series) -> pd.Series:
+        if isinstance(s.dtype, np.dtype) and np.issubdtype(s.dtype, np.integer):
+            return pd.to_numeric(s, downcast="integer")
+        if s.dtype == np.float64:
+            small = s.astype(np.float32)
+            # only if every value survives the round trip: answers must not change
+            return small if ((small.astype(np.float64) == s) | s.isna()).all() else s
+        if s.dtype == object:
+            if name in self.categorical:
+                return s.astype("category")
+            try:
+                return s.astype("string[pyarrow]")
+            except (TypeError, ValueError):  # mixed types (numbers next to strings)
+                return s
+        return s
+
+    def concat(self, chunks: list[pd.DataFrame]) -> pd.DataFrame:
+        if len(chunks) == 1:
+            return chunks[0]
+        columns = chunks[0].columns
+        categorical = [c for c in columns if all(isinstance(ch[c].dtype, pd.CategoricalDtype) for ch in chunks)]
+        out = pd.concat([ch.drop(columns=categorical) for ch in chunks], ignore_index=True)
+        for c in categorical:
+            out[c] = union_categoricals([ch[c] for ch in chunks])
+        return out[columns]
+
+
+class Moments:
+    """
+    Count, sum, min, max, mean and variance of a stream of numbers in one pass: chunk
+    statistics are merged into the running ones with Welford's update (Chan et al.'s form
+    for merging whole chunks), which stays exact where summing squares would not.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared deviations from the mean
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values: np.ndarray) -> None:
+        v = np.asarray(values, dtype=float)
+        v = v[~np.isnan(v)]
+        if not len(v):
+            return
+        n_b, mean_b = len(v), float(v.mean())
+        m2_b = float(((v - mean_b) ** 2).sum())
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / n
+        self.m2 += m2_b + delta * delta * self.n * n_b / n
+        self.n = n
+        self.total += float(v.sum())
+        self.min = min(self.min, float(v.min()))
+        self.max = max(self.max, float(v.max()))
+
+    def variance(self, ddof: int = 1) -> float:
+        return self.m2 / (self.n - ddof) if self.n > ddof else float("nan")
+
+    def std(self, ddof: int = 1) -> float:
+        return float(np.sqrt(self.variance(ddof)))
+
+
+class Comoments:
+    """
+    Means, squared deviations and co-deviation of (x, y) pairs, merged chunk by chunk like
+    Moments; enough for the correlation and the least-squares line. Pairs with a NaN are skipped.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean_x = self.mean_y = 0.0
+        self.m2_x = self.m2_y = self.c_xy = 0.0
+
+    def update(self, x: np.ndarray, y: np.ndarray) -> None:
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        keep = ~(np.isnan(x) | np.isnan(y))
+        x, y = x[keep], y[keep]
+        if not len(x):
+            return
+        n_b, mx, my = len(x), float(x.mean()), float(y.mean())
+        dx_b, dy_b = x - mx, y - my
+        n = self.n + n_b
+        dx, dy = mx - self.mean_x, my - self.mean_y
+        w = self.n * n_b / n
+        self.m2_x += float(dx_b @ dx_b) + dx * dx * w
+        self.m2_y += float(dy_b @ dy_b) + dy * dy * w
+        self.c_xy += float(dx_b @ dy_b) + dx * dy * w
+        self.mean_x += dx * n_b / n
+        self.mean_y += dy * n_b / n
+        self.n = n
+
+    def correlation(self) -> float:
+        denominator = np.sqrt(self.m2_x * self.m2_y)
+        return self.c_xy / denominator if denominator else float("nan")
+
+    def slope(self) -> float:
+        return self.c_xy / self.m2_x if self.m2_x else float("nan")
+
+    def intercept(self) -> float:
+        return self.mean_y - self.slope() * self.mean_x
+
+
+class TopK:
+    """
+    Most frequent values of a stream. Each chunk's counts are buffered and merged into the
+    running ones in one group-by once the buffer holds `capacity` x 10 entries. Counts are
+    exact while there are at most 2 x `capacity` distinct values; past that only the
+    `capacity` heaviest are kept (a value dropped and seen again restarts from zero), and
+    `exact` turns False.
+    """
+
+    def __init__(self, capacity: int = TOPK_CAPACITY):
+        self.capacity = capacity
+        self.exact = True
+        self._counts: list[pd.Series] = []
+        self._buffered = 0
+
+    def update(self, values: pd.Series) -> None:
+        counts = pd.Series(values).value_counts(dropna=True)
+        if isinstance(counts.index, pd.CategoricalIndex):
+            counts = counts[counts > 0]
+            counts.index = counts.index.astype(object)
+        self._counts.append(counts)
+        self._buffered += len(counts)
+        if self._buffered > 10 * self.capacity:
+            self._merge()
+
+    def _merge(self) -> pd.Series:
+        if len(self._counts) > 1:
+            merged = pd.concat(self._counts).groupby(level=0, sort=False).sum()
+            if len(merged) > 2 * self.capacity:
+                merged = merged.nlargest(self.capacity)
+                self.exact = False
+            self._counts = [merged]
+        self._buffered = len(self._counts[0]) if self._counts else 0
+        return self._counts[0] if self._counts else pd.Series(dtype="int64")
+
+    def top(self, k: int) -> list[tuple[Any, int]]:
+        return [(value, int(n)) for value, n in self._merge().nlargest(k).items()]
+
+
+class Profile:
+    """
+    One pass over a table's chunks: Moments of every numeric column, TopK of every other
+    column, and the row count. Memory is bounded by one chunk plus the accumulators.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.moments: dict[str, Moments] = {}
+        self.top: dict[str, TopK] = {}
+
+    @classmethod
+    def of(cls, chunks: Iterable[pd.DataFrame]) -> "Profile":
+        profile = cls()
+        for chunk in chunks:
+            profile.update(chunk)
+        return profile
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        self.rows += len(chunk)
+        for name in chunk.columns:
+            s = chunk[name]
+            if pd.api.types.is_numeric_dtype(s.dtype) and not pd.api.types.is_bool_dtype(s.dtype):
+                self.moments.setdefault(str(name), Moments()).update(s.to_numpy(dtype=float, na_value=np.nan))
+            else:
+                self.top.setdefault(str(name), TopK()).update(s)
+
+
+def chunks_of(df: pd.DataFrame, rows: int) -> Iterable[pd.DataFrame]:
+    """`df` in slices of `rows` rows (views, not copies)."""
+    for start in range(0, len(df), rows):
+        yield df.iloc[start:start + rows]
@@ -0,0 +1,62 @@
+import numpy as np
+
+from app.config import PLOT_GRID
+
+# Large scatter plots are drawn from a binned summary of the points rather than the points
+# themselves. This module is numpy-only, so the server process can bin a column pair
+# without importing matplotlib and ship just the grid to a plot worker (app.tool.render).
+
+
+def fit_line(x: np.ndarray, y: np.ndarray) -> tuple[float, float]:
+    """Least-squares slope and intercept of finite (x, y) pairs, the same line np.polyfit(x, y, 1) gives."""
+    mask = np.isfinite(x) & np.isfinite(y)
+    if not mask.all():
+        x, y = x[mask], y[mask]
+    mx, my = x.mean(), y.mean()
+    dx = x - mx
+    sxx = float(np.dot(dx, dx))
+    slope = float(np.dot(dx, y - my)) / sxx if sxx else 0.0
+    return slope, float(my - slope * mx)
+
+
+class Density:
+    """
+    Points counted on a bins x bins grid over their bounding box, along with the regression
+    line fitted on every point. `counts[i, j]` is the number of points in x-bin i, y-bin j.
+    """
+
+    def __init__(self, counts: np.ndarray, extent: tuple[float, float, float, float], slope: float,
+                 intercept: float, points: int):
+        self.counts = counts
+        self.extent = extent  # x0, x1, y0, y1
+        self.slope = slope
+        self.intercept = intercept
+        self.points = points
+
+    def __repr__(self) -> str:
+        return f"Density({self.points} points, {self.counts.shape[0]}x{self.counts.shape[1]} bins)"
+
+    @classmethod
+    def of(cls, data_x, data_y, bins: int = PLOT_GRID) -> "Density":
+        x = np.asarray(data_x, dtype=float)
+        y = np.asarray(data_y, dtype=float)
+        mask = np.isfinite(x) & np.isfinite(y)
+        if not mask.all():
+            x, y = x[mask], y[mask]
+        slope, intercept = fit_line(x, y)
+        x0, x1 = float(x.min()), float(x.max())
+        y0, y1 = float(y.min()), float(y.max())
+        # bin index = scaled offset, the maximum folded into the last bin; one bincount for the grid
+        ix = _bin(x, x0, x1, bins)
+        iy = _bin(y, y0, y1, bins)
+        ix *= bins
+        ix += iy
+        counts = np.bincount(ix, minlength=bins * bins).reshape(bins, bins)
+        return cls(counts, (x0, x1, y0, y1), slope, intercept, len(x))
+
+
+def _bin(v: np.ndarray, lo: float, hi: float, bins: int) -> np.ndarray:
+    scale = bins / (hi - lo) if hi > lo else 0.0
+    idx = ((v - lo) * scale).astype(np.intp)
+    np.minimum(idx, bins - 1, out=idx)
+    return idx
@@ -1,9 +1,224 @@
+import logging
+import queue
+import re
+import threading
+import uuid
+import weakref
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
 import duckdb
+import pandas as pd
+import pyarrow as pa
+
+from app.config import DUCK_EXTENSIONS, DUCK_MEMORY_LIMIT, DUCK_POOL_SIZE, DUCK_THREADS
+
+logger = logging.getLogger(__name__)
+
+# File types DuckDB scans in place, and the table function for each
+SCANNERS = {
+    ".parquet": "read_parquet",
+    ".csv": "read_csv_auto",
+    ".tsv": "read_csv_auto",
+    ".json": "read_json_auto",
+}
+
+
+def quote(name: str) -> str:
+    """SQL identifier for `name`."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+class DuckEngine:
+    """
+    One in-process DuckDB database per worker, opened once. Extensions are installed and
+    loaded at start-up; queries run on cursors (connections sharing the database, its
+    catalog and its loaded extensions) handed out from a fixed pool, so each thread has
+    its own connection without paying for a new database.
+    """
+
+    def __init__(
+        self,
+        database: str = ":memory:",
+        extensions: tuple[str, ...] = DUCK_EXTENSIONS,
+        pool_size: int = DUCK_POOL_SIZE,
+    ):
+        self.database = database
+        self.extensions = extensions
+        self.pool_size = pool_size
+        self._con: duckdb.DuckDBPyConnection | None = None
+        self._pool: queue.Queue[duckdb.DuckDBPyConnection] = queue.Queue()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # every thread's cursor, closed with the engine; a thread's goes when the thread does
+        self._thread_cursors: weakref.WeakSet[duckdb.DuckDBPyConnection] = weakref.WeakSet()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._con is not None:
+                return
+            config = {}
+            if DUCK_THREADS:
+                config["threads"] = DUCK_THREADS
+            if DUCK_MEMORY_LIMIT:
+                config["memory_limit"] = DUCK_MEMORY_LIMIT
+            con = duckdb.connect(self.database, config=config)
+            for ext in self.extensions:
+                try:
+                    con.execute(f"LOAD {ext}")
+                except duckdb.Error:
+                    try:
+                        con.execute(f"INSTALL {ext}; LOAD {ext};")
+                    except duckdb.Error as e:
+                        # e.g. httpfs offline: everything local still works
+                        logger.warning(f"DuckDB extension {ext} unavailable: {e}")
+            for _ in range(self.pool_size):
+                self._pool.put(con.cursor())
+            self._con = con
+            logger.info(f"DuckDB engine ready: {self.pool_size} pooled connections, extensions {self.extensions}")
+
+    @contextmanager
+    def cursor(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """A pooled connection for the duration of the block."""
+        self.start()
+        cur = self._pool.get()
+        try:
+            yield cur
+        finally:
+            self._pool.put(cur)
+
+    def thread_cursor(self) -> duckdb.DuckDBPyConnection:
+        """A connection owned by the calling thread, for results that outlive a query call."""
+        self.start()
+        with self._lock:
+            # a cursor from before a `close` belongs to the closed database: replace it
+            if getattr(self._local, "cur", None) not in self._thread_cursors:
+                self._local.cur = self._con.cursor()
+                self._thread_cursors.add(self._local.cur)
+            return self._local.cur
+
+    def query(self, sql: str, params: list[Any] | None = None) -> pa.Table:
+        with self.cursor() as cur:
+            return cur.execute(sql, params).fetch_arrow_table()
+
+    @contextmanager
+    def session(self) -> Iterator["DuckSession"]:
+        """
+        A request's own schema, dropped with everything in it at exit. It gets a connection
+        of its own rather than a pooled one, so a long request never waits on the pool.
+        """
+        self.start()
+        cur = self._con.cursor()
+        session = DuckSession(cur, "req_" + uuid.uuid4().hex[:12])
+        try:
+            yield session
+        finally:
+            session.close()
+            cur.close()
+
+    def close(self) -> None:
+        with self._lock:
+            while not self._pool.empty():
+                self._pool.get().close()
+            for cur in list(self._thread_cursors):
+                cur.close()
+            self._thread_cursors.clear()
+            if self._con is not None:
+                self._con.close()
+            self._con = None
+
+
+class DuckSession:
+    """
+    Views of one request's data in a private schema. Files are registered as views that
+    scan them in place, so queries read only the columns and row groups they need and
+    nothing is materialized up front.
+    """
+
+    def __init__(self, cur: duckdb.DuckDBPyConnection, schema: str):
+        self.cur = cur
+        self.schema = schema
+        self._frames: list[str] = []
+        cur.execute(f"CREATE SCHEMA {quote(schema)}")
+
+    def register(self, name: str, source: pd.DataFrame | pa.Table | Path) -> "DuckTable":
+        """View `name` over a DataFrame / Arrow table (zero-copy) or a parquet/CSV/JSON file."""
+        view = f"{quote(self.schema)}.{quote(name)}"
+        if isinstance(source, Path):
+            scan = SCANNERS[source.suffix.lower()]
+            path = str(source).replace("'", "''")
+            self.cur.execute(f"CREATE VIEW {view} AS SELECT * FROM {scan}('{path}')")
+        else:
+            # the connection-scoped replacement scan isn't part of the schema; alias it in
+            frame = f"{self.schema}_{len(self._frames)}"
+            self.cur.register(frame, source)
+            self._frames.append(frame)
+            self.cur.execute(f"CREATE VIEW {view} AS SELECT * FROM {quote(frame)}")
+        return DuckTable(self, view)
+
+    def query(self, sql: str, params: list[Any] | None = None) -> pa.Table:
+        return self.cur.execute(sql, params).fetch_arrow_table()
+
+    def stream(self, sql: str, params: list[Any] | None = None, batch_rows: int = 100_000) -> Iterator[pa.RecordBatch]:
+        """Result of `sql` in record batches, produced as DuckDB scans."""
+        reader = self.cur.execute(sql, params).fetch_record_batch(batch_rows)
+        yield from reader
+
+    def close(self) -> None:
+        self.cur.execute(f"DROP SCHEMA IF EXISTS {quote(self.schema)} CASCADE")
+        for frame in self._frames:
+            self.cur.unregister(frame)
+
+
+class DuckTable:
+    """A registered view: column names and types up front, data only as queried."""
+
+    def __init__(self, session: DuckSession, view: str):
+        self.session = session
+        self.view = view
+        described = session.cur.execute(f"DESCRIBE {view}").fetchall()
+        self.columns = [row[0] for row in described]
+        self.types = {row[0]: row[1] for row in described}
+        self._rows: int | None = None
+
+    def __len__(self) -> int:
+        if self._rows is None:
+            self._rows = self.session.query(f"SELECT count(*) AS n FROM {self.view}")["n"][0].as_py()
+        return self._rows
+
+    def is_numeric(self, column: str) -> bool:
+        return bool(re.match(r"(TINY|SMALL|BIG|HUGE|U)?INT|DOUBLE|FLOAT|REAL|DECIMAL", self.types[column]))
+
+    def column(self, column: str) -> pd.Series:
+        """One column as a Series; only that column is read."""
+        table = self.session.query(f"SELECT {quote(column)} FROM {self.view}")
+        return table.column(0).to_pandas().rename(column)
+
+    def head(self, n: int) -> pd.DataFrame:
+        return self.session.query(f"SELECT * FROM {self.view} LIMIT {int(n)}").to_pandas()
+
+    def scalar(self, select: str, where: str = "TRUE", params: list[Any] | None = None) -> Any:
+        """Aggregate evaluated by DuckDB, e.g. scalar("corr(x, y)", "x IS NOT NULL")."""
+        return self.session.cur.execute(f"SELECT {select} FROM {self.view} WHERE {where}", params).fetchone()[0]
+
+    def top(self, column: str, k: int) -> list[tuple[Any, int]]:
+        """The `k` most frequent non-null values of `column` and their counts, grouped by DuckDB."""
+        col = quote(column)
+        rows = self.session.cur.execute(
+            f"SELECT {col}, count(*) AS n FROM {self.view} WHERE {col} IS NOT NULL "
+            f"GROUP BY {col} ORDER BY n DESC, {col} LIMIT ?",
+            [int(k)],
+        ).fetchall()
+        return [(value, int(n)) for value, n in rows]
+
+
+engine = DuckEngine()
+
 
 class Duck:
     @staticmethod
     def query(sql: str) -> duckdb.DuckDBPyRelation:
-        con = duckdb.connect(database=':memory:')
-        con.execute("INSTALL httpfs; LOAD httpfs;")
-        con.execute("INSTALL parquet; LOAD parquet;")
-        return con.sql(sql)
+        # the shared engine: no new database, extensions already loaded
+        return engine.thread_cursor().sql(sql)
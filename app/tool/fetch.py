@@ -0,0 +1,231 @@
+import json
+import logging
+import re
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.config import (
+    CACHE_DIR,
+    FETCH_CACHE_DISK,
+    FETCH_CACHE_MAX_BYTES,
+    FETCH_MIN_FRESH_SECONDS,
+    FETCH_POOL_SIZE,
+    FETCH_STALE_WHILE_REVALIDATE_SECONDS,
+    FETCH_TIMEOUT_SECONDS,
+    USER_AGENT,
+)
+from app.utils.cache import LRUCache, SqliteCache
+from app.utils.metrics import CACHE_REQUESTS, FETCH_BYTES, span
+
+logger = logging.getLogger(__name__)
+
+MAX_AGE_RE = re.compile(r"(?:^|,)\s*max-age=(\d+)", re.I)
+# directives by which the server decides freshness itself
+EXPLICIT_RE = re.compile(r"(?:^|,)\s*(?:max-age|s-maxage|no-cache|must-revalidate|proxy-revalidate)\b", re.I)
+NO_CACHE_RE = re.compile(r"(?:^|,)\s*no-cache\b", re.I)
+# the cache is shared by all requests, so a shared-cache lifetime wins over max-age
+S_MAXAGE_RE = re.compile(r"(?:^|,)\s*s-maxage=(\d+)", re.I)
+
+
+def _max_age(cache_control: str, default: float = 0.0) -> float:
+    """Seconds a response stays fresh: as the server says, or `default` if it says nothing."""
+    if not EXPLICIT_RE.search(cache_control):
+        return default
+    if NO_CACHE_RE.search(cache_control):
+        return 0.0
+    m = S_MAXAGE_RE.search(cache_control) or MAX_AGE_RE.search(cache_control)
+    return float(m.group(1)) if m else 0.0
+
+
+class Fetcher:
+    """
+    Shared HTTP GET layer: one pooled keep-alive session plus a persistent cache that
+    honours ETag/Last-Modified.
+
+    An entry is fresh for the server's max-age (none under no-cache), or `min_fresh` seconds
+    when the response sets no freshness of its own, and is served without touching the network. For another `stale_while_revalidate` seconds it is still served
+    immediately while a background conditional request refreshes it. Older entries are
+    revalidated inline with If-None-Match/If-Modified-Since, so an unchanged page costs a 304.
+    """
+
+    def __init__(
+        self,
+        store: SqliteCache | None = None,
+        min_fresh: float = FETCH_MIN_FRESH_SECONDS,
+        stale_while_revalidate: float = FETCH_STALE_WHILE_REVALIDATE_SECONDS,
+        timeout: float = FETCH_TIMEOUT_SECONDS,
+        pool_size: int = FETCH_POOL_SIZE,
+    ):
+        self.store = store
+        self.min_fresh = min_fresh
+        self.stale_while_revalidate = stale_while_revalidate
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"User-Agent": USER_AGENT, "Accept-Encoding": "gzip, deflate"})
+        # decoded entries for the hot pages, so hits skip sqlite and json parsing
+        self._memory = LRUCache(maxsize=32)
+        self._revalidating: set[str] = set()
+        self._lock = threading.Lock()
+        self.counters = {"fresh": 0, "stale": 0, "revalidated": 0, "fetched": 0, "errors": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+        CACHE_REQUESTS.inc(cache="http", result=name)
+
+    def _load(self, url: str) -> dict[str, Any] | None:
+        entry = self._memory.get(url)
+        if entry is None and self.store is not None:
+            raw = self.store.get(url)
+            if raw is not None:
+                entry = json.loads(raw)
+                self._memory.set(url, entry)
+        return entry
+
+    def _save(self, url: str, entry: dict[str, Any]) -> None:
+        self._memory.set(url, entry)
+        if self.store is not None:
+            self.store.set(url, json.dumps(entry).encode("utf-8"))
+
+    def _request(
+        self,
+        url: str,
+        entry: dict[str, Any] | None,
+        on_chunk: Callable[[str], None] | None = None,
+    ) -> dict[str, Any]:
+        """
+        Conditional GET against the origin; returns the (new or refreshed) cache entry.
+        With `on_chunk`, a fresh body is streamed and handed over piece by piece as it arrives.
+        """
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        r = self.session.get(url, headers=headers, timeout=self.timeout, stream=on_chunk is not None)
+        if r.status_code == 304 and entry is not None:
+            self._count("revalidated")
+            entry = dict(entry)
+            if on_chunk is not None:
+                on_chunk(entry["body"])
+        else:
+            r.raise_for_status()
+            self._count("fetched")
+            if on_chunk is None:
+                body = r.text
+            else:
+                r.encoding = r.encoding or "utf-8"
+                parts = []
+                for part in r.iter_content(chunk_size=64 * 1024, decode_unicode=True):
+                    on_chunk(part)
+                    parts.append(part)
+                body = "".join(parts)
+            # bytes off the wire (compressed), falling back to the decoded size
+            FETCH_BYTES.inc(r.raw.tell() if r.raw is not None else len(body))
+            entry = {
+                "body": body,
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+            }
+        cache_control = r.headers.get("Cache-Control", entry.get("cache_control", ""))
+        entry["cache_control"] = cache_control
+        entry["fetched_at"] = time.time()
+        entry["max_age"] = _max_age(cache_control, self.min_fresh)
+        if "no-store" not in cache_control.lower():
+            self._save(url, entry)
+        return entry
+
+    def _revalidate_in_background(self, url: str, entry: dict[str, Any]) -> None:
+        with self._lock:
+            if url in self._revalidating:
+                return
+            self._revalidating.add(url)
+
+        def run():
+            try:
+                self._request(url, entry)
+            except Exception as e:
+                logger.warning(f"Background revalidation of {url} failed: {e}")
+            finally:
+                with self._lock:
+                    self._revalidating.discard(url)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def get(
+        self,
+        url: str,
+        on_chunk: Callable[[str], None] | None = None,
+        on_reset: Callable[[], None] | None = None,
+    ) -> str:
+        """
+        Body of `url` as text. `on_chunk` receives the body incrementally while it downloads
+        (or once, whole, when it comes from the cache) so parsing can overlap the transfer.
+        If a download fails midway and the cached copy is served instead, `on_reset` is
+        called first, so the consumer drops the partial body before the copy is replayed;
+        without it such a failure is raised rather than appending the copy to the fragment.
+        """
+        with span("fetch"):
+            return self._get(url, on_chunk, on_reset)
+
+    def _get(
+        self,
+        url: str,
+        on_chunk: Callable[[str], None] | None,
+        on_reset: Callable[[], None] | None,
+    ) -> str:
+        entry = self._load(url)
+        cached = None
+        if entry is not None:
+            age = time.time() - entry["fetched_at"]
+            if age < entry["max_age"]:
+                self._count("fresh")
+                cached = entry["body"]
+            elif age < entry["max_age"] + self.stale_while_revalidate:
+                self._count("stale")
+                self._revalidate_in_background(url, entry)
+                cached = entry["body"]
+        if cached is None:
+            delivered = False
+
+            def feed(part: str) -> None:
+                nonlocal delivered
+                delivered = True
+                on_chunk(part)
+
+            try:
+                return self._request(url, entry, feed if on_chunk is not None else None)["body"]
+            except requests.RequestException:
+                if entry is None or (delivered and on_reset is None):
+                    raise
+                # stale-if-error: an old copy beats failing the whole request
+                self._count("errors")
+                logger.warning(f"Fetching {url} failed; serving cached copy")
+                cached = entry["body"]
+                if delivered:
+                    on_reset()
+        if on_chunk is not None:
+            on_chunk(cached)
+        return cached
+
+
+def _make_store() -> SqliteCache | None:
+    if not FETCH_CACHE_DISK:
+        return None
+    try:
+        return SqliteCache(CACHE_DIR / "http.sqlite", max_bytes=FETCH_CACHE_MAX_BYTES)
+    except Exception as e:
+        logger.warning(f"HTTP disk cache unavailable ({e}); using memory only")
+        return None
+
+
+fetcher = Fetcher(_make_store())
@@ -0,0 +1,176 @@
+import heapq
+import re
+from collections.abc import Iterable
+
+import pandas as pd
+from lxml import etree
+
+WS_RE = re.compile(r"\s+")
+TEXT_XPATH = etree.XPath(".//text()[not(ancestor::style) and not(ancestor::script)]")
+
+
+def _text(cell: etree._Element) -> str:
+    return WS_RE.sub(" ", "".join(TEXT_XPATH(cell))).strip()
+
+
+def _is_number(text: str) -> bool:
+    # mirrors read_html's thousands="," coercion, so scores agree with the old selection
+    try:
+        float(text.replace(",", ""))
+        return True
+    except ValueError:
+        return False
+
+
+def _rows(table: etree._Element) -> list[etree._Element]:
+    """<tr> elements of this table only (not of tables nested inside it)."""
+    return table.xpath("./tr|./thead/tr|./tbody/tr|./tfoot/tr")
+
+
+def _span(cell: etree._Element, attr: str) -> int:
+    try:
+        return max(1, min(int(cell.get(attr, "1")), 1000))
+    except ValueError:
+        return 1
+
+
+class TableExtractor:
+    """
+    Incremental <table> picker built on lxml's pull parser.
+
+    Feed it HTML as it arrives; every top-level table is scored from cheap features of its
+    first rows (numeric columns, numeric-cell ratio, `wikitable` class, header keywords) and
+    only the `top_k` best survive. Losers are cleared as soon as they are scored, so a page
+    with many big tables never holds more than the current winners. `close()` fully parses
+    the winners (with rowspan/colspan) into DataFrames, best first.
+    """
+
+    def __init__(self, keywords: Iterable[str] = (), top_k: int = 1, sample_rows: int = 10):
+        self.keywords = [k.lower() for k in keywords]
+        self.top_k = top_k
+        self.sample_rows = sample_rows
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget everything fed so far, to start over on another copy of the page."""
+        self.scanned = 0
+        self._seq = 0
+        self._best: list[tuple[float, int, etree._Element]] = []  # min-heap on (score, -seq)
+        self._parser = etree.HTMLPullParser(events=("end",), tag="table")
+
+    def feed(self, chunk: str | bytes) -> None:
+        self._parser.feed(chunk)
+        self._drain()
+
+    def close(self) -> list[pd.DataFrame]:
+        self._parser.close()
+        self._drain()
+        ranked = sorted(self._best, key=lambda item: (-item[0], -item[1]))
+        return [self.parse(el) for _, _, el in ranked]
+
+    @classmethod
+    def from_html(cls, html: str | bytes, **kwargs) -> list[pd.DataFrame]:
+        extractor = cls(**kwargs)
+        extractor.feed(html)
+        return extractor.close()
+
+    def _drain(self) -> None:
+        for _, el in self._parser.read_events():
+            if any(a.tag == "table" for a in el.iterancestors()):
+                continue  # nested: scored as part of its outer table
+            self.scanned += 1
+            self._seq += 1
+            item = (self.score(el), -self._seq, el)
+            if len(self._best) < self.top_k:
+                heapq.heappush(self._best, item)
+                continue
+            dropped = heapq.heappushpop(self._best, item)
+            dropped[2].clear()
+
+    def score(self, table: etree._Element) -> float:
+        rows = _rows(table)[: self.sample_rows + 3]
+        header: list[str] = []
+        numeric_cols: set[int] = set()
+        cells = numeric = 0
+        for tr in rows:
+            tds = tr.xpath("./td|./th")
+            if all(c.tag == "th" for c in tds):
+                header.extend(_text(c).lower() for c in tds)
+                continue
+            for i, c in enumerate(tds):
+                text = _text(c)
+                cells += 1
+                if _is_number(text):
+                    numeric += 1
+                    numeric_cols.add(i)
+        score = float(len(numeric_cols))
+        score += numeric / cells if cells else 0.0
+        if "wikitable" in (table.get("class") or "").split():
+            score += 1.0
+        score += 2.0 * sum(any(k in h for h in header) for k in self.keywords)
+        return score
+
+    @staticmethod
+    def parse(table: etree._Element) -> pd.DataFrame:
+        grid: list[list[str]] = []
+        header_rows = 0
+        pending: dict[int, tuple[int, str]] = {}  # column -> (rows left, text) from rowspans
+        for tr in _rows(table):
+            tds = tr.xpath("./td|./th")
+            row: list[str] = []
+            col = 0
+
+            def fill_pending():
+                nonlocal col
+                while col in pending:
+                    left, text = pending[col]
+                    row.append(text)
+                    if left > 1:
+                        pending[col] = (left - 1, text)
+                    else:
+                        del pending[col]
+                    col += 1
+
+            for cell in tds:
+                fill_pending()
+                text = _text(cell)
+                rowspan = _span(cell, "rowspan")
+                for _ in range(_span(cell, "colspan")):
+                    row.append(text)
+                    if rowspan > 1:
+                        pending[col] = (rowspan - 1, text)
+                    col += 1
+            fill_pending()
+            while pending and col <= max(pending):
+                if col not in pending:
+                    row.append("")
+                    col += 1
+                fill_pending()
+            if not row:
+                continue
+            if len(grid) == header_rows and tds and all(c.tag == "th" for c in tds):
+                header_rows += 1
+            grid.append(row)
+
+        width = max((len(r) for r in grid), default=0)
+        grid = [r + [""] * (width - len(r)) for r in grid]
+        head, body = grid[:header_rows], grid[header_rows:]
+        if head:
+            columns = []
+            for i in range(width):
+                parts: list[str] = []
+                for r in head:
+                    if r[i] and r[i] not in parts:
+                        parts.append(r[i])
+                columns.append(" ".join(parts) or str(i))
+        else:
+            columns = list(range(width))
+        df = pd.DataFrame(body, columns=columns)
+        for c in range(width):
+            col = df.iloc[:, c]
+            col = col.mask(col == "")
+            try:
+                df.isetitem(c, pd.to_numeric(col.str.replace(",", "", regex=False)))
+            except (ValueError, TypeError, AttributeError):
+                df.isetitem(c, col)
+        return df
@@ -1,8 +1,31 @@
+import asyncio
+import hashlib
 import json
 import logging
 import os
+import random
+from collections.abc import AsyncIterator
+from typing import Any
 
-import requests
+import httpx
+
+from app.config import (
+    CACHE_DIR,
+    LLM_BACKOFF_SECONDS,
+    LLM_CACHE_DISK,
+    LLM_CACHE_MAX_BYTES,
+    LLM_CACHE_SIZE,
+    LLM_CACHE_TTL_SECONDS,
+    LLM_MAX_CONNECTIONS,
+    LLM_MAX_RETRIES,
+    LLM_MODEL,
+    LLM_TIMEOUT_SECONDS,
+    OPENAI_PROXY_URL,
+)
+from app.utils.admission import admission
+from app.utils.cache import LRUCache, SingleFlight, SqliteCache
+from app.utils.metrics import CACHE_REQUESTS, LLM_CALLS, LLM_PROMPT_TOKENS, span
+from app.utils.text import estimate_tokens
 
 logger = logging.getLogger(__name__)
 
@@ -11,42 +34,343 @@ OPENAI_PROXY_TOKEN = os.getenv("OPENAI_PROXY_TOKEN")
 if not OPENAI_PROXY_TOKEN:
     logger.warning("OPENAI_PROXY_TOKEN not set; LLM calls will fail.")
 
-OPENAI_PROXY_URL = "https://aipipe.org/openrouter/v1/chat/completions"
+# Statuses worth retrying: rate limits and transient proxy/upstream failures
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
 
-def complete(system: str, user: str) -> str:
-    """
-    Send a system + user prompt to OpenAI via AI Pipe / OpenRouter proxy.
-    Returns the text completion.
-    """
-    if not OPENAI_PROXY_TOKEN:
-        logger.error("No proxy token available.")
-        return ""
-
-    payload = {
-        "model": "openai/gpt-4.1-nano",
+def _payload(system: str, user: str, **params: Any) -> dict[str, Any]:
+    payload: dict[str, Any] = {
+        "model": LLM_MODEL,
         "messages": [
             {"role": "system", "content": system},
             {"role": "user", "content": user},
         ],
     }
+    payload.update(params)
+    return payload
 
-    headers = {
+
+def _headers() -> dict[str, str]:
+    return {
         "Authorization": f"Bearer {OPENAI_PROXY_TOKEN}",
         "Content-Type": "application/json",
     }
 
+
+def _extract_text(data: dict[str, Any]) -> str:
+    # extract text from OpenRouter response
+    choices = data.get("choices")
+    if choices and isinstance(choices, list):
+        return choices[0].get("message", {}).get("content", "") or ""
+    return ""
+
+
+def _observe_prompt(payload: dict[str, Any]) -> None:
+    LLM_PROMPT_TOKENS.observe(estimate_tokens("".join(m["content"] for m in payload["messages"])))
+
+
+def cache_key(payload: dict[str, Any]) -> str:
+    """
+    Content address of a request: hash of model, messages and every other parameter.
+    """
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Completions by content address: an in-process LRU in front of an optional sqlite tier.
+    Only non-empty completions are stored, so failures are never replayed.
+    """
+
+    def __init__(self, memory: LRUCache, disk: SqliteCache | None = None):
+        self.memory = memory
+        self.disk = disk
+
+    async def get(self, key: str) -> str | None:
+        text = self.memory.get(key)
+        if text is None and self.disk is not None:
+            raw = await asyncio.to_thread(self.disk.get, key)
+            if raw is not None:
+                text = raw.decode("utf-8")
+                self.memory.set(key, text)
+        return text
+
+    async def set(self, key: str, text: str) -> None:
+        if not text:
+            return
+        self.memory.set(key, text)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.set, key, text.encode("utf-8"))
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
+
+
+def _make_cache() -> ResponseCache:
+    disk = None
+    if LLM_CACHE_DISK:
+        try:
+            disk = SqliteCache(
+                CACHE_DIR / "llm.sqlite", ttl=LLM_CACHE_TTL_SECONDS, max_bytes=LLM_CACHE_MAX_BYTES
+            )
+        except Exception as e:
+            logger.warning(f"LLM disk cache unavailable ({e}); using memory only")
+    return ResponseCache(LRUCache(maxsize=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL_SECONDS), disk)
+
+
+response_cache = _make_cache()
+
+
+def _backoff(attempt: int, retry_after: str | None = None) -> float:
+    """
+    Seconds to wait before retry `attempt` (0-based): the server's Retry-After if given,
+    otherwise exponential backoff with full jitter.
+    """
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, LLM_BACKOFF_SECONDS * (2**attempt))
+
+
+class LLMClient:
+    """
+    Async client for the OpenAI-compatible proxy.
+
+    Keeps one keep-alive connection pool for the lifetime of the event loop and caps the
+    number of in-flight completions, so slow calls queue here instead of blocking the loop.
+    """
+
+    def __init__(
+        self,
+        url: str = OPENAI_PROXY_URL,
+        max_connections: int = LLM_MAX_CONNECTIONS,
+        timeout: float = LLM_TIMEOUT_SECONDS,
+        max_retries: int = LLM_MAX_RETRIES,
+    ):
+        self.url = url
+        self.max_retries = max_retries
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 10.0)),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=60.0,
+            ),
+        )
+        # in-flight completions of this worker: the "llm" class of admission control
+        self._slots = admission.gates["llm"]
+        # identical requests in flight at the same time share one upstream call
+        self._inflight = SingleFlight()
+
+    async def _send(self, payload: dict[str, Any], stream: bool = False) -> httpx.Response:
+        """
+        POST the payload, retrying 429/5xx and transport errors. For streaming requests the
+        returned response is still open and must be closed by the caller.
+        """
+        for attempt in range(self.max_retries + 1):
+            last_try = attempt == self.max_retries
+            try:
+                req = self._client.build_request("POST", self.url, headers=_headers(), json=payload)
+                resp = await self._client.send(req, stream=stream)
+            except httpx.TransportError as e:
+                if last_try:
+                    raise
+                delay = _backoff(attempt)
+                logger.warning(f"LLM transport error ({e!r}); retrying in {delay:.2f}s")
+            else:
+                if resp.status_code not in RETRY_STATUSES or last_try:
+                    if stream and resp.is_error:
+                        await resp.aread()
+                        await resp.aclose()
+                    resp.raise_for_status()
+                    return resp
+                delay = _backoff(attempt, resp.headers.get("Retry-After"))
+                logger.warning(f"LLM proxy returned {resp.status_code}; retrying in {delay:.2f}s")
+                await resp.aclose()
+            await asyncio.sleep(delay)
+        raise RuntimeError("unreachable")
+
+    async def _complete(self, payload: dict[str, Any]) -> str:
+        _observe_prompt(payload)
+        async with self._slots.slot():
+            with span("llm"):
+                try:
+                    resp = await self._send(payload)
+                    text = _extract_text(resp.json())
+                except Exception as e:
+                    logger.error(f"OpenAI proxy request failed: {e}")
+                    LLM_CALLS.inc(result="error")
+                    return ""
+        LLM_CALLS.inc(result="ok")
+        return text
+
+    async def complete(self, system: str, user: str, cache: bool = True, **params: Any) -> str:
+        if not OPENAI_PROXY_TOKEN:
+            logger.error("No proxy token available.")
+            return ""
+        payload = _payload(system, user, **params)
+        if not cache:
+            return await self._complete(payload)
+
+        key = cache_key(payload)
+        text = await response_cache.get(key)
+        CACHE_REQUESTS.inc(cache="llm", result="miss" if text is None else "hit")
+        if text is not None:
+            return text
+
+        async def fetch() -> str:
+            text = await self._complete(payload)
+            await response_cache.set(key, text)
+            return text
+
+        return await self._inflight.do(key, fetch)
+
+    async def stream(self, system: str, user: str, cache: bool = True, **params: Any) -> AsyncIterator[str]:
+        """
+        Yield content deltas as the proxy streams them (server-sent events).
+        A cached completion is replayed as a single delta.
+        """
+        if not OPENAI_PROXY_TOKEN:
+            logger.error("No proxy token available.")
+            return
+        key = cache_key(_payload(system, user, **params))
+        if cache:
+            text = await response_cache.get(key)
+            CACHE_REQUESTS.inc(cache="llm", result="miss" if text is None else "hit")
+            if text is not None:
+                yield text
+                return
+        payload = _payload(system, user, stream=True, **params)
+        _observe_prompt(payload)
+        parts: list[str] = []
+        async with self._slots.slot():
+            with span("llm"):
+                try:
+                    resp = await self._send(payload, stream=True)
+                except Exception as e:
+                    logger.error(f"OpenAI proxy request failed: {e}")
+                    LLM_CALLS.inc(result="error")
+                    return
+                try:
+                    async for line in resp.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        try:
+                            choices = json.loads(data).get("choices") or [{}]
+                        except json.JSONDecodeError:
+                            continue
+                        delta = choices[0].get("delta", {}).get("content")
+                        if delta:
+                            parts.append(delta)
+                            yield delta
+                except httpx.HTTPError as e:
+                    logger.error(f"OpenAI proxy stream failed: {e}")
+                    parts.clear()
+                finally:
+                    await resp.aclose()
+        LLM_CALLS.inc(result="ok" if parts else "error")
+        if cache:
+            await response_cache.set(key, "".join(parts))
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+# one client per event loop (pools and semaphores can't cross loops), closed on that loop by
+# `aclose` (the app's lifespan) or, failing that, by its task when asyncio.run cancels it at exit
+_clients: dict[asyncio.AbstractEventLoop, tuple[LLMClient, asyncio.Task]] = {}
+
+
+def get_client() -> LLMClient:
+    """
+    Shared client for the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(loop)
+    if entry is None:
+        client = LLMClient()
+        entry = _clients[loop] = client, loop.create_task(_close_at_exit(client))
+    return entry[0]
+
+
+async def _close_at_exit(client: LLMClient) -> None:
+    try:
+        await asyncio.Event().wait()
+    finally:
+        _clients.pop(asyncio.get_running_loop(), None)
+        await client.aclose()
+
+
+async def acomplete(system: str, user: str, cache: bool = True, **params: Any) -> str:
+    """
+    Async version of `complete`; extra params (temperature, max_tokens, ...) go into the payload.
+    Responses are served from `response_cache` unless `cache=False`.
+    """
+    return await get_client().complete(system, user, cache=cache, **params)
+
+
+async def astream(system: str, user: str, cache: bool = True, **params: Any) -> AsyncIterator[str]:
+    async for delta in get_client().stream(system, user, cache=cache, **params):
+        yield delta
+
+
+async def acached(system: str, user: str, **params: Any) -> str | None:
+    """
+    The cached completion for this exact request, without calling the proxy; None on a miss.
+    Used when the request's deadline no longer leaves room for a live call.
+    """
+    return await response_cache.get(cache_key(_payload(system, user, **params)))
+
+
+def cache_stats() -> dict[str, Any]:
+    stats = response_cache.stats()
+    stats["collapsed"] = sum(client._inflight.shared for client, _ in list(_clients.values()))
+    return stats
+
+
+async def aclose() -> None:
+    entry = _clients.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+        client, closer = entry
+        closer.cancel()
+        await client.aclose()
+
+
+_session = None
+
+
+def complete(system: str, user: str) -> str:
+    """
+    Send a system + user prompt to OpenAI via AI Pipe / OpenRouter proxy.
+    Returns the text completion. Blocking; use `acomplete` from async code.
+    """
+    global _session
+    if not OPENAI_PROXY_TOKEN:
+        logger.error("No proxy token available.")
+        return ""
+    if _session is None:
+        import requests  # the async client doesn't need it; load on first blocking call
+
+        _session = requests.Session()
+
     try:
-        resp = requests.post(
-            OPENAI_PROXY_URL, headers=headers, data=json.dumps(payload), timeout=30
+        resp = _session.post(
+            OPENAI_PROXY_URL,
+            headers=_headers(),
+            data=json.dumps(_payload(system, user)),
+            timeout=LLM_TIMEOUT_SECONDS,
         )
         resp.raise_for_status()
-        data = resp.json()
-        # extract text from OpenRouter response
-        choices = data.get("choices")
-        if choices and isinstance(choices, list):
-            return choices[0].get("message", {}).get("content", "")
-        return ""
+        return _extract_text(resp.json())
     except Exception as e:
         logger.error(f"OpenAI proxy request failed: {e}")
         return ""
@@ -1,49 +1,63 @@
-import io, base64
 import numpy as np
-import matplotlib.pyplot as plt
-from typing import Tuple
-from app.config import MAX_IMAGE_BYTES
+from matplotlib.axes import Axes
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.colors import LogNorm
+from matplotlib.figure import Figure
+from app.config import MAX_IMAGE_BYTES, PLOT_MAX_POINTS
+from app.tool.density import Density, fit_line
+from app.utils.image import figure_to_data_uri
 
-def scatter_with_regression(data_x, data_y, x_label: str, y_label: str, dotted_red: bool = False) -> str:
-    x = np.asarray(data_x, dtype=float)
-    y = np.asarray(data_y, dtype=float)
-    m, b = np.polyfit(x[~(np.isnan(x)|np.isnan(y))], y[~(np.isnan(x)|np.isnan(y))], 1)
+# Figures are built with the object-oriented API: no pyplot global state, so rendering is
+# safe from worker threads and processes (see app.tool.render).
 
-    fig = plt.figure(figsize=(5, 4), dpi=120)
-    ax = fig.gca()
-    ax.scatter(x, y)
-    yy = m*x + b
+def _figure(fast: bool) -> tuple[Figure, Axes]:
+    # fast: short on time -- render at a lower DPI, which usually fits in a single encode
+    fig = Figure(figsize=(5, 4), dpi=72 if fast else 120)
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+
+def _finish(fig: Figure, ax: Axes, x_range: tuple[float, float], m: float, b: float, x_label: str, y_label: str,
+            dotted_red: bool) -> str:
+    # a straight line: its two endpoints are all there is to draw
+    xs = np.array(x_range)
     if dotted_red:
-        ax.plot(x, yy, linestyle=":", color="red")
+        ax.plot(xs, m*xs + b, linestyle=":", color="red")
     else:
-        ax.plot(x, yy)
+        ax.plot(xs, m*xs + b)
     ax.set_xlabel(x_label)
     ax.set_ylabel(y_label)
     ax.grid(True, linestyle=":", linewidth=0.5)
-
-    buf = io.BytesIO()
     fig.tight_layout()
-    fig.savefig(buf, format="png")
-    plt.close(fig)
-
-    # Shrink if needed
-    img_bytes = buf.getvalue()
-    if len(img_bytes) > MAX_IMAGE_BYTES:
-        # Try WebP fallback
-        try:
-            from PIL import Image
-            buf2 = io.BytesIO(img_bytes)
-            im = Image.open(buf2)
-            out = io.BytesIO()
-            im.save(out, format="WEBP", quality=55, method=6)
-            data = out.getvalue()
-            mime = "image/webp"
-        except Exception:
-            data = img_bytes[:MAX_IMAGE_BYTES]
-            mime = "image/png"
-    else:
-        data = img_bytes
-        mime = "image/png"
 
-    b64 = base64.b64encode(data).decode("ascii")
-    return f"data:{mime};base64,{b64}"
+    # PNG-8 / smaller DPI / WebP, whichever lands under the cap (app.utils.image)
+    return figure_to_data_uri(fig, MAX_IMAGE_BYTES)
+
+
+def scatter_with_regression(data_x, data_y, x_label: str, y_label: str, dotted_red: bool = False, fast: bool = False) -> str:
+    x = np.asarray(data_x, dtype=float)
+    y = np.asarray(data_y, dtype=float)
+    if len(x) > PLOT_MAX_POINTS:
+        # millions of markers take seconds to draw and don't fit MAX_IMAGE_BYTES: bin them
+        return density_with_regression(Density.of(x, y), x_label, y_label, dotted_red, fast)
+    mask = np.isfinite(x) & np.isfinite(y)
+    x, y = x[mask], y[mask]
+    m, b = fit_line(x, y)
+
+    fig, ax = _figure(fast)
+    ax.scatter(x, y)
+    return _finish(fig, ax, (x.min(), x.max()), m, b, x_label, y_label, dotted_red)
+
+
+def density_with_regression(density: Density, x_label: str, y_label: str, dotted_red: bool = False, fast: bool = False) -> str:
+    """The scatter plot of a large point set, drawn as a grid of point counts (app.tool.density)."""
+    fig, ax = _figure(fast)
+    x0, x1, y0, y1 = density.extent
+    # empty cells masked (background shows through), the rest shaded by log count
+    counts = np.ma.masked_equal(density.counts.T, 0)
+    image = ax.imshow(counts, origin="lower", extent=density.extent, aspect="auto", interpolation="nearest",
+                      cmap="Blues", norm=LogNorm(vmin=1, vmax=max(1, counts.max())))
+    fig.colorbar(image, ax=ax, label="points")
+    ax.set_xlim(x0, x1)
+    ax.set_ylim(y0, y1)
+    return _finish(fig, ax, (x0, x1), density.slope, density.intercept, x_label, y_label, dotted_red)
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any
+
+from app.config import PLOT_WORKERS
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class PlotSpec:
+    """
+    A chart to draw: the name of a plotting function in `PLOTTERS` plus its arguments.
+    Specs are plain picklable data, so they can be shipped to worker processes in batches.
+    """
+
+    def __init__(self, kind: str, *args: Any, **kwargs: Any):
+        self.kind = kind
+        self.args = args
+        self.kwargs = kwargs
+
+    def __repr__(self) -> str:
+        return f"PlotSpec({self.kind!r})"
+
+
+def _plotters() -> dict[str, Callable[..., Any]]:
+    from app.analyzer import plot_util
+    from app.tool import plot
+
+    return {
+        "scatter_with_regression": plot.scatter_with_regression,
+        "density_with_regression": plot.density_with_regression,
+        "scatter_with_regression_slope": plot_util.scatter_with_regression,
+    }
+
+
+def _warm() -> int:
+    """
+    Worker initializer: import matplotlib and draw one throwaway chart, so font loading and
+    the Agg backend's first-use costs are paid before any request needs a plot.
+    """
+    import numpy as np
+
+    from app.tool.plot import scatter_with_regression
+
+    scatter_with_regression(np.arange(3.0), np.arange(3.0), "x", "y")
+    return multiprocessing.current_process().pid
+
+
+def render_spec(spec: PlotSpec) -> Any:
+    return _plotters()[spec.kind](*spec.args, **spec.kwargs)
+
+
+def render_batch(specs: list[PlotSpec]) -> tuple[list[Any], list[tuple[str, float]]]:
+    """
+    Render several specs in one worker round trip. The worker's spans (encode) come back
+    with the results, for the server process to record.
+    """
+    with metrics.trace(observe=False) as trace:
+        return [render_spec(spec) for spec in specs], trace.spans
+
+
+class PlotRenderer:
+    """
+    Renders plot specs off the event loop in a pool of pre-warmed worker processes, one
+    batch per worker, so the charts of one request draw in parallel and never hold the
+    GIL the server runs on. With `workers=0` specs render in a thread instead; the figures
+    are built without pyplot, so that is safe too, just serialized by the GIL.
+    """
+
+    def __init__(self, workers: int = PLOT_WORKERS):
+        self.workers = workers
+        self.rendered = 0
+        self._pool: Executor | None = None
+
+    def _executor(self) -> Executor:
+        if self._pool is None:
+            if self.workers > 0:
+                # spawn, not fork: the server process already runs threads (uvicorn, httpx)
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="plot")
+        return self._pool
+
+    async def start(self) -> None:
+        """Start every worker and warm it up; call at startup to keep the cost off requests."""
+        t0 = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        pool = self._executor()
+        # all submitted before any finishes, so each one brings up its own worker
+        pids = await asyncio.gather(*(loop.run_in_executor(pool, _warm) for _ in range(max(1, self.workers))))
+        logger.info(f"Plot renderer: {len(set(pids))} worker(s) warm in {time.perf_counter() - t0:.2f}s")
+
+    async def render(self, spec: PlotSpec) -> Any:
+        return (await self.render_many([spec]))[0]
+
+    async def render_many(self, specs: list[PlotSpec]) -> list[Any]:
+        """Render `specs` in parallel across the workers; results in input order."""
+        if not specs:
+            return []
+        loop = asyncio.get_running_loop()
+        pool = self._executor()
+        n = max(1, min(self.workers, len(specs)))
+        batches = [specs[i::n] for i in range(n)]
+        with metrics.span("plot"):
+            done = await asyncio.gather(*(loop.run_in_executor(pool, render_batch, b) for b in batches))
+        results: list[Any] = [None] * len(specs)
+        for i, (batch, spans) in enumerate(done):
+            results[i::n] = batch
+            for stage, seconds in spans:
+                metrics.record(stage, seconds)
+        self.rendered += len(specs)
+        return results
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+renderer = PlotRenderer()
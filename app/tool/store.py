@@ -0,0 +1,195 @@
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any
+
+import pyarrow as pa
+
+from app.config import CACHE_DIR, TABLE_STORE_MAX_BYTES
+from app.utils.cache import LRUCache
+from app.utils.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# Hits wait at most this long to be added to the index when nothing else writes it
+HITS_FLUSH_SECONDS = 30.0
+
+
+class TableStore:
+    """
+    Arrow tables shared by every worker process on the host, keyed by content hash.
+
+    Each table is written once, as an uncompressed Arrow IPC file, and read by memory-mapping
+    it: the columns are views of the file's pages, which the OS page cache holds once however
+    many workers map them, so a table costs memory once per host rather than once per worker.
+
+    `index.json` records each file's size and hit count. Gets read it under a shared lock
+    on `index.lock` and writes take an exclusive one, so hits never wait on each other. A
+    hit records its recency by touching the file's mtime rather than rewriting the index,
+    and hit counts are added to the index in batches: whenever it is written anyway, and at
+    least every HITS_FLUSH_SECONDS.
+    Puts evict the least recently used files until the total is within `max_bytes`.
+    Evicting a file a worker still has mapped is safe: the unlinked file lives on until the
+    last mapping goes.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = TABLE_STORE_MAX_BYTES, mapped: int = 64):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        # this process's mappings, so repeated gets don't re-open the file
+        self._mapped = LRUCache(maxsize=mapped)
+        self._thread_lock = threading.Lock()
+        # hits not yet added to the index
+        self._hits: Counter[str] = Counter()
+        self._hits_lock = threading.Lock()
+        self._flushed = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.arrow"
+
+    @contextmanager
+    def _index(self, shared: bool = False) -> Iterator[dict[str, dict[str, Any]]]:
+        """
+        The index, locked against every other thread and process until the block ends.
+        `shared` locks it for reading only, alongside other readers: changes aren't saved.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with nullcontext() if shared else self._thread_lock, open(self.directory / "index.lock", "a+") as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                path = self.directory / "index.json"
+                try:
+                    index = json.loads(path.read_text())
+                except (OSError, ValueError):
+                    index = {}
+                if shared:
+                    yield index
+                    return
+                before = json.dumps(index, sort_keys=True)
+                with self._hits_lock:
+                    hits, self._hits = self._hits, Counter()
+                    self._flushed = time.monotonic()
+                for key, n in hits.items():
+                    if key in index:
+                        index[key]["hits"] = index[key].get("hits", 0) + n
+                yield index
+                if json.dumps(index, sort_keys=True) != before:
+                    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+                    tmp.write_text(json.dumps(index))
+                    os.replace(tmp, path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _map(self, key: str) -> pa.Table:
+        with pa.memory_map(str(self._path(key)), "r") as source:
+            # read_all on a memory map is zero-copy: the buffers point into the mapping
+            table = pa.ipc.open_file(source).read_all()
+        self._mapped.set(key, table)
+        return table
+
+    def _used(self, key: str) -> None:
+        try:
+            os.utime(self._path(key))
+        except OSError:  # evicted meanwhile: a mapping we hold still reads fine
+            pass
+
+    def _used_at(self, key: str) -> float:
+        try:
+            return self._path(key).stat().st_mtime
+        except OSError:
+            return 0.0
+
+    def get(self, key: str) -> pa.Table | None:
+        table = self._mapped.get(key)
+        if table is None:
+            with self._index(shared=True) as index:
+                known = key in index
+            if known:
+                try:
+                    table = self._map(key)
+                except (OSError, pa.ArrowException) as e:
+                    logger.warning(f"Discarding unreadable table store entry {key[:12]}: {e}")
+                    self.discard(key)
+        if table is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._used(key)
+            with self._hits_lock:
+                self._hits[key] += 1
+                due = time.monotonic() - self._flushed > HITS_FLUSH_SECONDS
+            if due:
+                self.flush()
+        CACHE_REQUESTS.inc(cache="store", result="miss" if table is None else "hit")
+        return table
+
+    def put(self, key: str, table: pa.Table) -> pa.Table:
+        """Store `table` under `key` unless it's there already; returns the memory-mapped copy."""
+        with self._index() as index:
+            if key in index and self._path(key).exists():
+                self._used(key)
+                return self._mapped.get(key) or self._map(key)
+        # written outside the lock, to a temp file renamed into place, so readers never map
+        # a half-written file; files not yet in the index are never evicted
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f, pa.ipc.new_file(f, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        with self._index() as index:
+            index[key] = {"bytes": self._path(key).stat().st_size, "hits": 0}
+            self.writes += 1
+            self._evict(index, keep=key)
+        return self._map(key)
+
+    def _evict(self, index: dict[str, dict[str, Any]], keep: str) -> None:
+        total = sum(e["bytes"] for e in index.values())
+        for key in sorted(index, key=self._used_at):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= index.pop(key)["bytes"]
+            self._path(key).unlink(missing_ok=True)
+            self.evictions += 1
+
+    def flush(self) -> None:
+        """Add the hits not yet counted to the index."""
+        if self._hits:
+            with self._index():
+                pass
+
+    def discard(self, key: str) -> None:
+        with self._index() as index:
+            index.pop(key, None)
+            self._path(key).unlink(missing_ok=True)
+
+    def stats(self) -> dict[str, Any]:
+        with self._index() as index:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "entries": len(index),
+                "bytes": sum(e["bytes"] for e in index.values()),
+                "host_hits": sum(e.get("hits", 0) for e in index.values()),
+            }
+
+
+store = TableStore(CACHE_DIR / "tables")
@@ -0,0 +1,192 @@
+import asyncio
+import json
+import logging
+import re
+from collections.abc import Callable
+from typing import Any
+
+from app.config import LLM_ANSWER_ROUNDS, LLM_BATCH_SIZE, LLM_RESPONSE_FORMAT, LLM_STREAM, PIPELINE_CONCURRENCY
+from app.tool.llm import acached, acomplete, astream
+from app.utils.jsonstream import ObjectStream
+
+logger = logging.getLogger(__name__)
+
+# Shape of a reply: one {"id", "answer"} object per question asked
+ANSWERS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "answers": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"id": {"type": "string"}, "answer": {}, "sql": {"type": "string"}},
+                "required": ["id", "answer"],
+            },
+        }
+    },
+    "required": ["answers"],
+}
+
+
+def _number(value: Any) -> float | None:
+    if isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# What an answer to some kinds of question must look like; any other non-empty answer passes
+CHECKS: list[tuple[re.Pattern, Callable[[Any], bool]]] = [
+    (re.compile(r"\bcorrelation\b", re.I), lambda a: (n := _number(a)) is not None and -1 <= n <= 1),
+    (re.compile(r"\bhow many\b|\bnumber of\b", re.I), lambda a: _number(a) is not None),
+]
+
+
+def clean_llm_output(text: str) -> str:
+    """
+    Remove markdown code fences if present to safely parse JSON.
+    """
+    return re.sub(r"^```(?:json|plaintext)?|```$", "", text.strip(), flags=re.I | re.M)
+
+
+def parse_answer(text: str) -> Any:
+    """
+    One answer from the LLM: JSON if it parses, otherwise the bare text.
+    """
+    cleaned = clean_llm_output(text).strip()
+    try:
+        return json.loads(cleaned)
+    except json.JSONDecodeError:
+        return cleaned
+
+
+def valid(question: str, answer: Any) -> bool:
+    if answer is None or (isinstance(answer, str) and not answer.strip()):
+        return False
+    return all(check(answer) for pattern, check in CHECKS if pattern.search(question))
+
+
+def response_format() -> dict[str, Any]:
+    """Payload parameters asking the proxy for the answers schema, as LLM_RESPONSE_FORMAT allows."""
+    if LLM_RESPONSE_FORMAT == "json_schema":
+        return {"response_format": {"type": "json_schema", "json_schema": {"name": "answers", "schema": ANSWERS_SCHEMA}}}
+    if LLM_RESPONSE_FORMAT == "json_object":
+        return {"response_format": {"type": "json_object"}}
+    return {}
+
+
+def batch_prompt(questions: dict[str, str], retry: bool = False) -> str:
+    head = "Your previous reply had no valid answer to these questions; answer only them.\n" if retry else ""
+    return head + "Questions:\n" + "\n".join(f"[{qid}] {question}" for qid, question in questions.items())
+
+
+def _id(value: Any) -> str:
+    # "q3", "[q3]" and 3 all name question q3
+    qid = str(value).strip().strip("[]")
+    return f"q{qid}" if qid.isdigit() else qid
+
+
+# Called with (question id, answer, the answer's whole object) as each valid answer comes in;
+# the object carries any extra fields the prompt asked for
+OnAnswer = Callable[[str, Any, dict[str, Any]], None]
+
+
+def _store(results: dict[str, Any], qid: str, obj: dict[str, Any], on_answer: OnAnswer | None) -> None:
+    results[qid] = obj["answer"]
+    if on_answer is not None:
+        on_answer(qid, obj["answer"], obj)
+
+
+def _collect(
+    objects: list[dict[str, Any]], questions: dict[str, str], results: dict[str, Any], on_answer: OnAnswer | None
+) -> None:
+    for obj in objects:
+        qid = _id(obj.get("id"))
+        if qid in questions and qid not in results and "answer" in obj:
+            if valid(questions[qid], obj["answer"]):
+                _store(results, qid, obj, on_answer)
+            else:
+                logger.info(f"Invalid LLM answer for {qid}: {str(obj['answer'])[:80]!r}")
+
+
+def _single(text: str, questions: dict[str, str], results: dict[str, Any], on_answer: OnAnswer | None) -> None:
+    """A lone question answered with a bare value instead of the answers object."""
+    if len(questions) != 1 or not text.strip():
+        return
+    (qid, question), = questions.items()
+    answer = parse_answer(text)
+    if qid not in results and not (isinstance(answer, dict) and "answers" in answer) and valid(question, answer):
+        _store(results, qid, {"id": qid, "answer": answer}, on_answer)
+
+
+async def ask(
+    system: str,
+    questions: dict[str, str],
+    results: dict[str, Any],
+    retry: bool = False,
+    on_answer: OnAnswer | None = None,
+) -> None:
+    """
+    One call for a batch of `questions` (id -> text). Each valid answer goes into `results`
+    (and to `on_answer`) as soon as its object has streamed in, so when the call is
+    cancelled at the deadline or the reply is cut off, every answer that did arrive is kept.
+    """
+    user = batch_prompt(questions, retry)
+    stream = ObjectStream()
+    if LLM_STREAM:
+        async for delta in astream(system, user, **response_format()):
+            _collect(stream.feed(delta), questions, results, on_answer)
+    else:
+        _collect(stream.feed(await acomplete(system, user, **response_format())), questions, results, on_answer)
+    _single(stream.text, questions, results, on_answer)
+
+
+async def answer_all(
+    system: str,
+    questions: dict[str, str],
+    results: dict[str, Any],
+    rounds: int = LLM_ANSWER_ROUNDS,
+    batch_size: int = LLM_BATCH_SIZE,
+    concurrency: int = PIPELINE_CONCURRENCY,
+    on_answer: OnAnswer | None = None,
+) -> None:
+    """
+    Answer `questions` in batches of `batch_size`, filling `results` (id -> answer). After
+    each round only the questions still without a valid answer are asked again, in a
+    follow-up batch that carries just them rather than the whole set.
+    """
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(batch: dict[str, str], retry: bool) -> None:
+        async with slots:
+            await ask(system, batch, results, retry, on_answer)
+
+    pending = dict(questions)
+    for attempt in range(rounds):
+        ids = list(pending)
+        batches = [{qid: pending[qid] for qid in ids[i : i + batch_size]} for i in range(0, len(ids), batch_size)]
+        await asyncio.gather(*(one(batch, attempt > 0) for batch in batches))
+        pending = {qid: q for qid, q in pending.items() if qid not in results}
+        if not pending:
+            return
+        if attempt + 1 < rounds:
+            logger.info(f"LLM answered {len(questions) - len(pending)}/{len(questions)}; re-asking {sorted(pending)}")
+
+
+async def answer_cached(
+    system: str,
+    questions: dict[str, str],
+    results: dict[str, Any],
+    batch_size: int = LLM_BATCH_SIZE,
+    on_answer: OnAnswer | None = None,
+) -> None:
+    """Answers to a first-round batch from the response cache only, without calling the proxy."""
+    ids = list(questions)
+    for i in range(0, len(ids), batch_size):
+        batch = {qid: questions[qid] for qid in ids[i : i + batch_size]}
+        text = await acached(system, batch_prompt(batch), **response_format())
+        if text:
+            _collect(ObjectStream().feed(text), batch, results, on_answer)
+            _single(text, batch, results, on_answer)
@@ -1,5 +1,35 @@
+import hashlib
+import json
+import logging
 import re
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from app.utils.cache import LRUCache
+
+if TYPE_CHECKING:
+    from app.tool.store import TableStore
+
+logger = logging.getLogger(__name__)
+
+# Patterns run through pyarrow.compute (RE2 syntax: no lookarounds, named groups only)
+FOOTNOTE_RE = r"\[[^\]]*\]"  # [1], [a], [# 12]
+# a number, then the word after it, skipping the upper end of a range ("300–400 million")
+AMOUNT_RE = r"(?P<num>[0-9][0-9,]*(?:\.[0-9]+)?)[-–—0-9,.\s$]*(?P<unit>[A-Za-z]*)"
+MONEY_RE = r"\$\s*" + AMOUNT_RE
+YEAR_RE = r"(?:^|[^0-9])(?P<year>(?:19|20)[0-9]{2})(?:[^0-9]|$)"
+INT_RE = r"(?P<int>-?[0-9][0-9,]*)"
+UNIT_SCALE = {
+    "b": 1e9, "bn": 1e9, "billion": 1e9,
+    "m": 1e6, "mn": 1e6, "million": 1e6,
+    "k": 1e3, "thousand": 1e3,
+    "usd": 1.0, "dollars": 1.0,
+}
+
 
 class Tables:
     @staticmethod
@@ -15,3 +45,139 @@ class Tables:
             if c in out.columns:
                 out[c] = pd.to_numeric(out[c], errors="coerce")
         return out
+
+    @staticmethod
+    def _arrow_text(s: pd.Series) -> pa.Array:
+        """Cells as an Arrow string array; non-strings are stringified, missing cells stay null."""
+        try:
+            text = pa.array(s, pa.string(), from_pandas=True)
+            # pyarrow-backed string columns come back as their chunked array
+            return text.combine_chunks() if isinstance(text, pa.ChunkedArray) else text
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # mixed column (numbers next to strings)
+            return pa.array(s.astype(str), pa.string(), mask=s.isna().to_numpy())
+
+    @staticmethod
+    def _extract(text: pa.Array, pattern: str, group: str) -> pa.Array:
+        """Regex group per cell; null where the pattern doesn't match."""
+        return pc.struct_field(pc.extract_regex(text, pattern), group)
+
+    @staticmethod
+    def parse_money(s: pd.Series) -> pd.Series:
+        """
+        Dollar amounts to float: "$2,923,706,026[1]", "F8$1.5 bn", "$300–400 million" (lower
+        bound), "2.5m". The amount after a "$" wins; cells without one fall back to their
+        first number, ignoring footnote markers. Unparseable cells, and amounts followed by a
+        word that isn't a known unit ("$1.2 bil"), become NaN rather than a guessed scale.
+        """
+        text = Tables._arrow_text(s)
+        found = pc.extract_regex(text, MONEY_RE)
+        num, unit = pc.struct_field(found, "num"), pc.struct_field(found, "unit")
+        missing = pc.is_null(found)
+        if pc.any(missing).as_py():
+            rest = pc.replace_substring_regex(pc.filter(text, missing), FOOTNOTE_RE, "")
+            bare = pc.extract_regex(rest, AMOUNT_RE)
+            num = pc.replace_with_mask(num, missing, pc.struct_field(bare, "num"))
+            unit = pc.replace_with_mask(unit, missing, pc.struct_field(bare, "unit"))
+        value = pc.cast(pc.replace_substring(num, ",", ""), pa.float64())
+        unit = pc.utf8_lower(unit)
+        scale = pc.if_else(pc.equal(unit, ""), 1.0, pa.scalar(None, pa.float64()))
+        for factor in sorted(set(UNIT_SCALE.values())):
+            words = pa.array([w for w, f in UNIT_SCALE.items() if f == factor])
+            scale = pc.if_else(pc.is_in(unit, value_set=words), factor, scale)
+        amount = pc.multiply(value, scale)
+        return pd.Series(amount.to_numpy(zero_copy_only=False), index=s.index)
+
+    @staticmethod
+    def parse_year(s: pd.Series) -> pd.Series:
+        """First 19xx/20xx year in each cell ("Titanic (1997)" -> 1997) as nullable Int64."""
+        year = pc.cast(Tables._extract(Tables._arrow_text(s), YEAR_RE, "year"), pa.int64())
+        return pd.Series(year.to_numpy(zero_copy_only=False), index=s.index).astype("Int64")
+
+    @staticmethod
+    def parse_int(s: pd.Series) -> pd.Series:
+        """First integer in each cell ("1,234[5]" -> 1234, "T2" -> 2) as nullable Int64."""
+        digits = pc.replace_substring(Tables._extract(Tables._arrow_text(s), INT_RE, "int"), ",", "")
+        value = pc.cast(digits, pa.int64())
+        return pd.Series(value.to_numpy(zero_copy_only=False), index=s.index).astype("Int64")
+
+
+class TableCache:
+    """
+    Parsed tables keyed by a content hash of the source document.
+
+    With a `store` (app.tool.store), tables live there as memory-mapped Arrow files shared
+    by every worker, and this process keeps no copy of its own: each get converts the mapped
+    table to a fresh DataFrame. Without one, an in-process LRU of `maxsize` DataFrames holds
+    them. Each entry also carries the list of numeric columns chosen when it was parsed.
+    Tables Arrow can't represent go to the in-process LRU even with a store.
+    """
+
+    def __init__(self, store: "TableStore | None" = None, maxsize: int = 16):
+        self.store = store
+        self._memory = LRUCache(maxsize=maxsize)
+
+    @staticmethod
+    def key(document: str | bytes) -> str:
+        if isinstance(document, str):
+            document = document.encode("utf-8", errors="surrogatepass")
+        return hashlib.sha256(document).hexdigest()
+
+    @staticmethod
+    def to_arrow(df: pd.DataFrame, **metadata: Any) -> pa.Table | None:
+        """`df` as an Arrow table with JSON `metadata`, or None if Arrow can't represent it."""
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=True)
+        except (pa.ArrowException, TypeError, ValueError) as e:
+            # mixed-type object columns or duplicate names: keep it in memory only
+            logger.info(f"Table not representable in Arrow ({e}); not persisting")
+            return None
+        meta = dict(table.schema.metadata or {})
+        meta.update({k.encode(): json.dumps(v).encode() for k, v in metadata.items()})
+        return table.replace_schema_metadata(meta)
+
+    def get(self, key: str) -> tuple[pd.DataFrame, list[str]] | None:
+        # checked with a store too: it holds the tables Arrow can't represent
+        hit = self._memory.get(key)
+        if hit is not None:
+            df, numeric_cols = hit
+            # callers get their own frame; the cached one stays pristine
+            return df.copy(), list(numeric_cols)
+        if self.store is None:
+            return None
+        table = self.store.get(key)
+        if table is None:
+            return None
+        return table.to_pandas(), json.loads(table.schema.metadata[b"numeric_cols"])
+
+    def set(self, key: str, df: pd.DataFrame, numeric_cols: list[str]) -> None:
+        table = self.to_arrow(df, numeric_cols=list(numeric_cols)) if self.store is not None else None
+        if table is None:
+            self._memory.set(key, (df.copy(), list(numeric_cols)))
+        else:
+            self.store.put(key, table)
+
+    def get_tables(self, key: str) -> list[pd.DataFrame] | None:
+        """Several tables stored together by `set_tables`."""
+        hit = self._memory.get(key)
+        if hit is not None:
+            return [df.copy() for df in hit]
+        if self.store is None:
+            return None
+        first = self.store.get(f"{key}-0")
+        if first is None:
+            return None
+        count = json.loads(first.schema.metadata[b"count"])
+        tables = [first] + [self.store.get(f"{key}-{i}") for i in range(1, count)]
+        return None if any(t is None for t in tables) else [t.to_pandas() for t in tables]
+
+    def set_tables(self, key: str, dfs: list[pd.DataFrame]) -> None:
+        tables = [self.to_arrow(df, count=len(dfs)) for df in dfs] if self.store is not None else [None]
+        if any(t is None for t in tables):
+            self._memory.set(key, [df.copy() for df in dfs])
+            return
+        for i, table in enumerate(tables):
+            self.store.put(f"{key}-{i}", table)
+
+    def stats(self) -> dict[str, Any]:
+        return self.store.stats() if self.store is not None else self._memory.stats()
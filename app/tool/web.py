@@ -1,21 +1,64 @@
 import pandas as pd
-import requests
-from bs4 import BeautifulSoup
-from app.config import USER_AGENT
+from app.tool.fetch import fetcher
+from app.tool.html_tables import TableExtractor
+from app.tool.tables import TableCache
 
 class Web:
     @staticmethod
     def get(url: str) -> str:
-        headers = {"User-Agent": USER_AGENT}
-        r = requests.get(url, headers=headers, timeout=30)
-        r.raise_for_status()
-        return r.text
+        return fetcher.get(url)
 
     @staticmethod
     def read_html_tables(url: str) -> list[pd.DataFrame]:
         return pd.read_html(url, flavor="lxml")
 
     @staticmethod
-    def soup(url: str) -> BeautifulSoup:
+    def tables(
+        url: str, keywords: tuple[str, ...] = (), top_k: int = 1, cache: TableCache | None = None
+    ) -> tuple[str, list[pd.DataFrame]]:
+        """
+        Fetch `url` and return (html, best tables), picking tables while the body downloads.
+        With `cache`, the tables are kept under a hash of the body. A body the fetcher serves
+        whole (from its own cache) is looked up there before it is parsed at all; one that
+        arrives in pieces is parsed as it downloads and stored afterwards.
+        """
+        extractor = TableExtractor(keywords=keywords, top_k=top_k)
+        held: str | None = None  # a first chunk that may turn out to be the whole body
+        streaming = cache is None
+
+        def feed(chunk: str) -> None:
+            nonlocal held, streaming
+            if not streaming:
+                if held is None:
+                    held = chunk
+                    return
+                streaming = True
+                extractor.feed(held)
+                held = None
+            extractor.feed(chunk)
+
+        def reset() -> None:
+            nonlocal held, streaming
+            held, streaming = None, cache is None
+            extractor.reset()
+
+        html = fetcher.get(url, on_chunk=feed, on_reset=reset)
+        if cache is None:
+            return html, extractor.close()
+        key = TableCache.key(html + repr((keywords, top_k)))
+        if not streaming:
+            tables = cache.get_tables(key)
+            if tables is not None:
+                return html, tables
+            if held is not None:
+                extractor.feed(held)
+        tables = extractor.close()
+        cache.set_tables(key, tables)
+        return html, tables
+
+    @staticmethod
+    def soup(url: str) -> "BeautifulSoup":  # noqa: F821
+        from bs4 import BeautifulSoup  # only needed here; keeps bs4 out of every cold start
+
         html = Web.get(url)
         return BeautifulSoup(html, "lxml")
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from app.config import ADMIT_CPU, ADMIT_FETCH, ADMIT_QUEUE, ADMIT_REQUESTS, LLM_MAX_CONCURRENCY
+from app.utils.metrics import (
+    ADMISSION_ACTIVE,
+    ADMISSION_ESTIMATE,
+    ADMISSION_QUEUED,
+    ADMISSION_REJECTED,
+    ADMISSION_WAIT_SECONDS,
+)
+from app.utils.timing import Budget
+
+logger = logging.getLogger(__name__)
+
+# Weight of the latest hold time in a gate's running estimate of it
+SERVICE_ALPHA = 0.2
+
+# Budget stages that take a slot of a resource class (LLM calls take theirs in tool.llm)
+STAGE_CLASSES = {"fetch": "fetch", "parse": "cpu", "compute": "cpu", "plot": "cpu"}
+
+
+class Overloaded(Exception):
+    """A request turned away (HTTP 503); `retry_after` seconds is when to try again."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Server overloaded ({reason}); retry in {retry_after:.0f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Gate:
+    """
+    At most `limit` holders at once; the rest wait in FIFO order, at most `queue_size` of
+    them (None: unbounded). Keeps a running average of how long a slot is held, from which
+    `estimate` predicts how long a new arrival would wait. Event-loop only: not thread-safe.
+    """
+
+    def __init__(self, name: str, limit: int, queue_size: int | None = None):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue_size = queue_size
+        self.active = 0
+        self.service = 0.0  # seconds a slot is held, on average
+        self._waiters: deque[asyncio.Future] = deque()
+        self._gauge()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def full(self) -> bool:
+        return self.queue_size is not None and self.queued >= self.queue_size
+
+    def estimate(self) -> float:
+        """Seconds a new arrival would wait: the slots ahead of it, `limit` freed at a time."""
+        ahead = self.active + self.queued - self.limit + 1
+        return ahead / self.limit * self.service if ahead > 0 else 0.0
+
+    def _gauge(self) -> None:
+        ADMISSION_ACTIVE.set(self.active, resource=self.name)
+        ADMISSION_QUEUED.set(self.queued, resource=self.name)
+        ADMISSION_ESTIMATE.set(self.estimate(), resource=self.name)
+
+    def try_acquire(self) -> bool:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self._gauge()
+            ADMISSION_WAIT_SECONDS.observe(0.0, resource=self.name)
+            return True
+        return False
+
+    async def acquire(self) -> None:
+        if self.try_acquire():
+            return
+        t0 = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._gauge()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._hand_off()  # given a slot just as we were cancelled: pass it on
+            else:
+                self._waiters.remove(waiter)
+                self._gauge()
+            raise
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - t0, resource=self.name)
+
+    def release(self, held: float | None = None) -> None:
+        """Free a slot held for `held` seconds (None: don't count it in the estimate)."""
+        if held is not None:
+            self.service = held if self.service == 0.0 else self.service + SERVICE_ALPHA * (held - self.service)
+        self._hand_off()
+
+    def _hand_off(self) -> None:
+        # the slot goes straight to the first waiter still waiting, so nobody can jump the queue
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self._gauge()
+                return
+        self.active -= 1
+        self._gauge()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        await self.acquire()
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - t0)
+
+
+class Admission:
+    """
+    Admission control of one worker: a gate for whole requests plus one per resource class
+    a request competes for inside the pipeline (LLM calls, CPU-heavy stages, fetches).
+
+    A request is admitted at once while fewer than the request limit are running, and
+    otherwise queues. It is turned away up front, without reading its body, when the queue
+    is full or when the estimated wait plus the average request time would overrun its
+    budget; a queued request that would still start too late is turned away when that
+    becomes certain. Waits for any gate are part of the request's budget.
+    """
+
+    def __init__(self, requests: int, queue: int, limits: dict[str, int]):
+        self.requests = Gate("request", requests, queue)
+        self.gates = {name: Gate(name, limit) for name, limit in limits.items()}
+
+    def stage_gates(self) -> dict[str, Gate]:
+        """Gates for `Budget`, by stage name."""
+        return {stage: self.gates[name] for stage, name in STAGE_CLASSES.items()}
+
+    def _reject(self, reason: str, wait: float) -> Overloaded:
+        ADMISSION_REJECTED.inc(reason=reason)
+        retry_after = max(1.0, math.ceil(wait or self.requests.service))
+        logger.warning(f"Rejecting request ({reason}): {self.requests.active} running, "
+                       f"{self.requests.queued} queued, retry in {retry_after:.0f}s")
+        return Overloaded(reason, retry_after)
+
+    async def admit(self, budget: Budget) -> float:
+        """
+        Wait for a request slot; returns the time it was granted, to hand back to `done`.
+        Raises Overloaded if the request should be turned away.
+        """
+        gate = self.requests
+        with budget.stage("queue"):
+            if gate.try_acquire():
+                return time.monotonic()
+            wait = gate.estimate()
+            if gate.full():
+                raise self._reject("queue-full", wait)
+            # queue only as long as the request could still finish after it
+            latest = budget.remaining() - gate.service
+            if wait > latest:
+                raise self._reject("deadline", wait)
+            try:
+                await asyncio.wait_for(gate.acquire(), timeout=latest)
+            except asyncio.TimeoutError:
+                raise self._reject("deadline", gate.estimate()) from None
+            return time.monotonic()
+
+    def done(self, admitted: float) -> None:
+        self.requests.release(time.monotonic() - admitted)
+
+
+admission = Admission(
+    ADMIT_REQUESTS, ADMIT_QUEUE, {"llm": LLM_MAX_CONCURRENCY, "cpu": ADMIT_CPU, "fetch": ADMIT_FETCH}
+)
@@ -0,0 +1,191 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from pathlib import Path
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU with optional per-entry TTL and hit/miss counters.
+    Bounded by entry count and, if `sizeof` is given, by total size.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 256,
+        ttl: float | None = None,
+        max_bytes: int | None = None,
+        sizeof: Callable[[Any], int] | None = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._data: OrderedDict[Hashable, tuple[float, int, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                expires, size, value = item
+                if expires >= time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self._bytes -= size
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any) -> None:
+        size = self.sizeof(value) if self.sizeof else 0
+        expires = time.monotonic() + self.ttl if self.ttl else float("inf")
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (expires, size, value)
+            self._bytes += size
+            while len(self._data) > self.maxsize or (
+                self.max_bytes is not None and self._bytes > self.max_bytes and len(self._data) > 1
+            ):
+                _, (_, evicted_size, _) = self._data.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            item = self._data.get(key)
+            return item is not None and item[0] >= time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SqliteCache:
+    """
+    On-disk key -> bytes store with TTL. Least recently used rows are evicted once the
+    stored values exceed `max_bytes`. Safe to share between threads and worker processes.
+    """
+
+    def __init__(self, path: Path, ttl: float | None = None, max_bytes: int = 64 * 1024 * 1024):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._con = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+        with self._lock, self._con:
+            self._con.execute("PRAGMA journal_mode=WAL")
+            self._con.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL,"
+                " expires REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._con.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    def get(self, key: str) -> bytes | None:
+        now = time.time()
+        with self._lock, self._con:
+            row = self._con.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires >= ?", (key, now)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._con.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return row[0]
+
+    def set(self, key: str, value: bytes) -> None:
+        now = time.time()
+        expires = now + self.ttl if self.ttl else float("inf")
+        with self._lock, self._con:
+            self._con.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), expires, now),
+            )
+            self._con.execute("DELETE FROM cache WHERE expires < ?", (now,))
+            (total,) = self._con.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()
+            if total > self.max_bytes:
+                # drop the oldest rows until we are back under budget
+                self._con.execute(
+                    "DELETE FROM cache WHERE key IN ("
+                    " SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed DESC) AS running"
+                    " FROM cache) WHERE running > ?)",
+                    (self.max_bytes,),
+                )
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            entries, size = self._con.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        return {"entries": entries, "bytes": size, "hits": self.hits, "misses": self.misses}
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into one: the first caller starts `fn` in a
+    task owned by the flight, and everyone arriving while it is in flight awaits the same
+    result. A caller that is cancelled only stops waiting; the task is cancelled when the
+    last of its waiters goes.
+    """
+
+    def __init__(self):
+        self.shared = 0
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self._waiters: dict[Hashable, int] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._landed(key, t))
+        else:
+            self.shared += 1
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                if not task.done():
+                    task.cancel()
+                    self._landed(key, task)
+
+    def _landed(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # consume the outcome so a flight nobody waits for any more doesn't log "never retrieved"
+        if task.done() and not task.cancelled():
+            task.exception()
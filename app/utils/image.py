@@ -0,0 +1,124 @@
+import base64
+import io
+import logging
+import math
+
+from matplotlib.figure import Figure
+from PIL import Image
+
+from app.config import MAX_IMAGE_BYTES
+from app.utils.metrics import span
+
+logger = logging.getLogger(__name__)
+
+# Aim this far under the cap when sizing the second encode: size only roughly follows area
+MARGIN = 0.85
+# Below this scale text stops being legible; get the bytes from lossy WebP instead
+MIN_PNG_SCALE = 0.5
+# Lossy WebP at WEBP_QUALITY typically lands at a quarter of PNG-8 on dense plots or less
+WEBP_QUALITY = 80
+WEBP_RATIO = 4.0
+MIN_SIDE = 64
+
+
+class EncodedImage:
+    def __init__(self, data: bytes, mime: str, encodes: int):
+        self.data = data
+        self.mime = mime
+        self.encodes = encodes
+
+    def data_uri(self) -> str:
+        return f"data:{self.mime};base64,{base64.b64encode(self.data).decode('ascii')}"
+
+
+def rasterize(fig: Figure, dpi: float) -> Image.Image:
+    """Draw `fig` at `dpi` into an RGB image without encoding it."""
+    fig.set_dpi(dpi)
+    fig.canvas.draw()
+    width, height = fig.canvas.get_width_height()
+    return Image.frombuffer("RGBA", (width, height), fig.canvas.buffer_rgba()).convert("RGB")
+
+
+def png8(img: Image.Image) -> bytes:
+    """
+    Palette PNG: charts use a handful of flat colours, so 256 are plenty and the file is
+    a fraction of the RGB encoding.
+    """
+    out = io.BytesIO()
+    img.quantize(colors=256, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE).save(
+        out, format="PNG", compress_level=9
+    )
+    return out.getvalue()
+
+
+def webp(img: Image.Image, quality: int = WEBP_QUALITY) -> bytes:
+    out = io.BytesIO()
+    img.save(out, format="WEBP", quality=quality, method=4)
+    return out.getvalue()
+
+
+def encode_figure(fig: Figure, max_bytes: int = MAX_IMAGE_BYTES, dpi: float | None = None) -> EncodedImage:
+    """
+    Encode `fig` under `max_bytes`, normally in at most two encodes.
+
+    The first is a PNG-8 at the figure's DPI. If it's too big, its size is the estimate for
+    the second: encoded bytes scale with pixel area, so the figure is redrawn at the DPI
+    that should land under the cap -- as PNG-8 when that shrinks it by at most half, else as
+    lossy WebP, which holds up much better on dense plots. Only when that estimate misses
+    does it keep halving the area; the result is always a complete, valid image.
+    """
+    dpi = dpi or fig.dpi
+    data = png8(rasterize(fig, dpi))
+    if len(data) <= max_bytes:
+        return EncodedImage(data, "image/png", 1)
+
+    scale = math.sqrt(max_bytes * MARGIN / len(data))
+    if scale >= MIN_PNG_SCALE:
+        data, mime = png8(rasterize(fig, dpi * scale)), "image/png"
+    else:
+        scale = min(1.0, math.sqrt(max_bytes * MARGIN * WEBP_RATIO / len(data)))
+        data, mime = webp(rasterize(fig, dpi * scale)), "image/webp"
+    encodes = 2
+
+    while len(data) > max_bytes:
+        if min(fig.get_size_inches()) * dpi * scale <= MIN_SIDE:
+            logger.warning(f"Image still {len(data)} bytes at its smallest; returning it over the {max_bytes} cap")
+            break
+        scale *= math.sqrt(0.5)
+        data, mime = webp(rasterize(fig, dpi * scale), quality=60), "image/webp"
+        encodes += 1
+    if encodes > 2:
+        logger.info(f"Image needed {encodes} encodes to fit {max_bytes} bytes")
+    return EncodedImage(data, mime, encodes)
+
+
+def figure_to_data_uri(fig: Figure, max_bytes: int = MAX_IMAGE_BYTES, dpi: float | None = None) -> str:
+    with span("encode"):
+        return encode_figure(fig, max_bytes, dpi).data_uri()
+
+
+def shrink_data_uri(uri: str, max_len: int) -> str | None:
+    """
+    Re-encode an image data URI into one of at most `max_len` characters: PNG-8 at full size
+    if that is enough, else lossy WebP at the scale the size estimate suggests, smaller again
+    until it fits. None if it can't get that small without a side dropping under MIN_SIDE.
+    """
+    img = Image.open(io.BytesIO(base64.b64decode(uri.partition(",")[2]))).convert("RGB")
+    # base64 takes 4 characters per 3 bytes; the header is at most "data:image/webp;base64,"
+    max_bytes = (max_len - len("data:image/webp;base64,")) * 3 // 4
+    if max_bytes <= 0:
+        return None
+    data, mime = png8(img), "image/png"
+    scale = 1.0
+    while len(data) > max_bytes:
+        # bytes follow pixel area; the first WebP also gains its usual WEBP_RATIO over PNG-8
+        ratio = max_bytes * MARGIN / len(data)
+        if mime == "image/png":
+            scale = min(1.0, math.sqrt(ratio * WEBP_RATIO))
+        else:
+            scale *= min(0.9, math.sqrt(ratio))
+        size = (round(img.width * scale), round(img.height * scale))
+        if min(size) < MIN_SIDE:
+            return None
+        data, mime = webp(img.resize(size, Image.Resampling.LANCZOS) if scale < 1 else img), "image/webp"
+    return EncodedImage(data, mime, 0).data_uri()
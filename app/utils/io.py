@@ -1,14 +1,408 @@
-from typing import Dict, List, Tuple
-from fastapi import UploadFile
-
-async def read_uploads(files: List[UploadFile]) -> Dict[str, bytes]:
-    blobs = {}
-    for f in files:
-        blobs[f.filename] = await f.read()
-    return blobs
-
-def find_questions(blobs: Dict[str, bytes]) -> str:
-    for name in blobs:
-        if name.lower().endswith("questions.txt") or name.lower() == "questions.txt":
-            return blobs[name].decode("utf-8", errors="replace")
-    raise ValueError("questions.txt is required but missing")
+import abc
+import asyncio
+import hashlib
+import io
+import logging
+import queue
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import pandas as pd
+import pyarrow as pa
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+
+from app.config import (
+    CSV_CHUNK_ROWS,
+    DUCK_SCAN_BYTES,
+    TABLE_CACHE_DISK,
+    UPLOAD_MAX_BYTES,
+    UPLOAD_SPILL_BYTES,
+    UPLOAD_TOTAL_MAX_BYTES,
+)
+from app.tool.chunked import Compactor
+from app.tool.duck import SCANNERS
+from app.utils.metrics import UPLOAD_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+class UploadError(ValueError):
+    """Malformed upload (HTTP 400)."""
+
+
+class UploadTooLarge(UploadError):
+    """An upload, or the request as a whole, is over its size cap (HTTP 413)."""
+
+
+# Threads of the CSV parsers, which block waiting for upload data: kept out of the default
+# executor so they can't take every thread from the rest of the app's to_thread work
+_PARSERS = ThreadPoolExecutor(max_workers=32, thread_name_prefix="upload-parse")
+
+
+class _Pipe(io.RawIOBase):
+    """
+    Bytes written from the event loop, read by a parser thread. The queue is bounded, so a
+    parser that falls behind slows the upload down instead of letting it pile up in memory.
+    A writer facing a full queue waits on the loop for the reader to signal room; it never
+    takes a thread.
+    """
+
+    def __init__(self, depth: int = 16):
+        self._queue: queue.Queue[bytes | None] = queue.Queue(maxsize=depth)
+        self._buffer = memoryview(b"")
+        self._eof = False
+        self._loop = asyncio.get_running_loop()
+        self._room = asyncio.Event()  # set from the reader's thread when it takes a chunk
+        self.abandoned = False  # set by the reader (`abandon`) when it stops early
+        self.aborted = False  # set by the writer when the upload is rejected
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer:
+            if self._eof:
+                return 0
+            try:
+                chunk = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                if self.aborted:
+                    self._eof = True
+                continue
+            self._signal()
+            if chunk is None:
+                self._eof = True
+                return 0
+            self._buffer = memoryview(chunk)
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def _signal(self) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._room.set)
+        except RuntimeError:  # the loop is gone: nobody is writing any more
+            pass
+
+    def abandon(self) -> None:
+        """Called by the reader when it stops reading: pending and later puts return at once."""
+        self.abandoned = True
+        self._signal()
+
+    async def put(self, chunk: bytes | None) -> None:
+        """Hand a chunk (None for end of data) to the reader; waits while the queue is full."""
+        while not self.abandoned:
+            try:
+                self._queue.put_nowait(chunk)
+                return
+            except queue.Full:
+                # cleared before re-checking, with no await in between: a chunk taken
+                # since the failed put shows as room, one taken later sets the event
+                self._room.clear()
+                if not self._queue.full():
+                    continue
+                await self._room.wait()
+
+
+class _Sink(abc.ABC):
+    """Destination of one file part: `feed` its bytes as they arrive, then `finish`."""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.size = 0
+        self.digest = hashlib.sha256()  # of the part's bytes: its key in the table store
+
+    @abc.abstractmethod
+    async def feed(self, data: bytes) -> None: ...
+
+    @abc.abstractmethod
+    async def finish(self) -> Any: ...
+
+    def abort(self) -> None:
+        pass
+
+
+class _CsvSink(_Sink):
+    """
+    Parses the CSV in chunks on a worker thread while the part is still arriving, each chunk
+    compacted (see tool.chunked.Compactor) before the next is read.
+    """
+
+    def __init__(self, filename: str):
+        super().__init__(filename)
+        self._pipe = _Pipe()
+        self._parsed = asyncio.get_running_loop().run_in_executor(_PARSERS, self._parse)
+
+    def _parse(self) -> pd.DataFrame:
+        compact = Compactor()
+        try:
+            with pd.read_csv(io.BufferedReader(self._pipe, 1024 * 1024), chunksize=CSV_CHUNK_ROWS) as reader:
+                chunks = [compact(chunk) for chunk in reader]
+        finally:
+            self._pipe.abandon()
+        return compact.concat(chunks)
+
+    async def feed(self, data: bytes) -> None:
+        await self._pipe.put(data)
+
+    async def finish(self) -> pd.DataFrame:
+        await self._pipe.put(None)
+        return await self._parsed
+
+    def abort(self) -> None:
+        self._pipe.aborted = True
+        # nobody awaits the parse any more; retrieve its outcome so it isn't logged as lost
+        self._parsed.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+
+class _SpooledSink(_Sink):
+    """
+    Buffers the part -- in memory up to UPLOAD_SPILL_BYTES, then in a temporary file -- for
+    formats that need random access (Excel) or aren't parsed at all.
+    """
+
+    PARSERS = {
+        ".xlsx": lambda f: Compactor()(pd.read_excel(f)),
+        ".xls": lambda f: Compactor()(pd.read_excel(f)),
+    }
+
+    def __init__(self, filename: str):
+        super().__init__(filename)
+        self._file = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPILL_BYTES)
+
+    async def feed(self, data: bytes) -> None:
+        if self.size > UPLOAD_SPILL_BYTES:  # spilled to disk: don't block the loop on the write
+            await asyncio.to_thread(self._file.write, data)
+        else:
+            self._file.write(data)
+
+    def _parse(self) -> Any:
+        try:
+            self._file.seek(0)
+            parse = self.PARSERS.get(Path(self.filename).suffix.lower())
+            return parse(self._file) if parse else self._file.read()
+        finally:
+            self._file.close()
+
+    @property
+    def tabular(self) -> bool:
+        return Path(self.filename).suffix.lower() in self.PARSERS
+
+    async def finish(self) -> Any:
+        return await asyncio.to_thread(self._parse)
+
+    def abort(self) -> None:
+        self._file.close()
+
+
+class _FileSink(_Sink):
+    """
+    Writes the part to a file that DuckDB then scans in place (app.tool.duck): parquet,
+    and CSV/JSON too large to load into pandas.
+    """
+
+    def __init__(self, filename: str, path: Path):
+        super().__init__(filename)
+        self.path = path
+        self._file = open(path, "wb")
+
+    async def feed(self, data: bytes) -> None:
+        await asyncio.to_thread(self._file.write, data)
+
+    async def finish(self) -> Path:
+        self._file.close()
+        return self.path
+
+    def abort(self) -> None:
+        self._file.close()
+
+
+class Ingested:
+    """
+    Parsed contents of an /api/ request. Tables are DataFrames, Arrow tables memory-mapped
+    from the table store, or Paths of files left on disk for DuckDB to scan; those live
+    until `close`.
+    """
+
+    def __init__(self):
+        self.questions: str | None = None
+        self.tables: Dict[str, pd.DataFrame | pa.Table | Path] = {}
+        self.files: Dict[str, bytes] = {}  # uploads that aren't tables
+        self.bytes = 0
+        self._dir: tempfile.TemporaryDirectory | None = None
+
+    def add_table(self, filename: str, table: pd.DataFrame | pa.Table | Path) -> None:
+        # keyed by position too: attachments sharing a file name are separate tables
+        self.tables[f"{len(self.tables)}-{filename}"] = table
+
+    def path_for(self, filename: str) -> Path:
+        if self._dir is None:
+            self._dir = tempfile.TemporaryDirectory(prefix="upload-")
+        return Path(self._dir.name) / f"{len(self.tables)}-{Path(filename).name}"
+
+    def close(self) -> None:
+        if self._dir is not None:
+            self._dir.cleanup()
+            self._dir = None
+
+
+def _is_questions(field: str, filename: str) -> bool:
+    return field == "questions" or filename.lower().endswith("questions.txt")
+
+
+def _sink(field: str, filename: str, result: Ingested, large: bool) -> _Sink:
+    suffix = Path(filename).suffix.lower()
+    if _is_questions(field, filename):
+        return _SpooledSink(filename)
+    if suffix == ".parquet" or (large and suffix in SCANNERS):
+        return _FileSink(filename, result.path_for(filename))
+    if suffix == ".csv":
+        return _CsvSink(filename)
+    return _SpooledSink(filename)
+
+
+async def ingest(
+    request: Request,
+    max_bytes: int = UPLOAD_MAX_BYTES,
+    total_max_bytes: int = UPLOAD_TOTAL_MAX_BYTES,
+) -> Ingested:
+    """
+    Read a multipart request part by part, feeding each file straight into its parser as
+    the bytes arrive: CSVs into a chunked reader on a worker thread, other files into a
+    buffer that spills to disk past UPLOAD_SPILL_BYTES. Parquet, and CSV/JSON in requests
+    over DUCK_SCAN_BYTES, are written to disk once and left for DuckDB to scan in place.
+    Nothing is copied a second time. Call `close()` on the result when done with it.
+
+    Raises UploadTooLarge as soon as a file or the request crosses its cap (before reading
+    anything when Content-Length already says so), and UploadError for malformed bodies or
+    a missing questions file.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise UploadError("Expected a multipart/form-data body")
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > total_max_bytes:
+        raise UploadTooLarge(f"Request is {int(length)} bytes; the limit is {total_max_bytes}")
+    # without a length, assume large: scanning in place is safe for any size
+    large = not (length and length.isdigit()) or int(length) > DUCK_SCAN_BYTES
+
+    # parser callbacks are synchronous: they queue events, handled after each write
+    events: List[Tuple[str, Any]] = []
+    header: Dict[str, bytes] = {"field": b"", "value": b""}
+    headers: Dict[bytes, bytes] = {}
+
+    def on_header_end() -> None:
+        headers[header["field"].lower()] = header["value"]
+        header["field"] = header["value"] = b""
+
+    callbacks = {
+        "on_part_begin": headers.clear,
+        "on_header_field": lambda data, start, end: header.__setitem__("field", header["field"] + data[start:end]),
+        "on_header_value": lambda data, start, end: header.__setitem__("value", header["value"] + data[start:end]),
+        "on_header_end": on_header_end,
+        "on_headers_finished": lambda: events.append(("begin", dict(headers))),
+        "on_part_data": lambda data, start, end: events.append(("data", bytes(data[start:end]))),
+        "on_part_end": lambda: events.append(("end", None)),
+    }
+    parser = MultipartParser(options[b"boundary"], callbacks)
+
+    result = Ingested()
+    sink: _Sink | None = None
+    field = ""
+    try:
+        async for chunk in request.stream():
+            try:
+                parser.write(chunk)
+            except Exception as e:
+                raise UploadError(f"Malformed multipart body: {e}") from e
+            for kind, value in events:
+                if kind == "begin":
+                    _, disposition = parse_options_header(value.get(b"content-disposition", b""))
+                    field = disposition.get(b"name", b"").decode("utf-8", "replace")
+                    filename = disposition.get(b"filename", field.encode()).decode("utf-8", "replace")
+                    sink = _sink(field, filename, result, large)
+                elif kind == "data" and sink is not None:
+                    sink.size += len(value)
+                    sink.digest.update(value)
+                    result.bytes += len(value)
+                    if sink.size > max_bytes:
+                        raise UploadTooLarge(f"{sink.filename} is over the {max_bytes}-byte upload limit")
+                    if result.bytes > total_max_bytes:
+                        raise UploadTooLarge(f"Request is over the {total_max_bytes}-byte limit")
+                    await sink.feed(value)
+                elif kind == "end" and sink is not None:
+                    done, sink = sink, None
+                    await _finish(result, done, field)
+            events.clear()
+    except BaseException:
+        if sink is not None:
+            sink.abort()
+        result.close()
+        raise
+
+    if result.questions is None:
+        result.close()
+        raise UploadError("questions.txt is required but missing")
+    UPLOAD_BYTES.inc(result.bytes)
+    logger.info(f"Ingested {result.bytes} bytes: {len(result.tables)} table(s), {len(result.files)} other file(s)")
+    return result
+
+
+async def _finish(result: Ingested, sink: _Sink, field: str) -> None:
+    key = f"upload-{sink.digest.hexdigest()}"
+    if isinstance(sink, _SpooledSink) and sink.tabular and not _is_questions(field, sink.filename):
+        # a workbook seen before is read from its columnar copy: Excel parsing is the slow part
+        cached = await asyncio.to_thread(_stored, key)
+        if cached is not None:
+            sink.abort()
+            result.add_table(sink.filename, cached)
+            return
+    try:
+        parsed = await sink.finish()
+    except Exception as e:
+        # an unreadable attachment shouldn't sink the request; its questions go to the LLM
+        logger.warning(f"Could not parse {sink.filename}: {e}")
+        return
+    if _is_questions(field, sink.filename):
+        result.questions = parsed.decode("utf-8", errors="replace")
+    elif isinstance(parsed, pd.DataFrame):
+        result.add_table(sink.filename, await asyncio.to_thread(_share, key, parsed))
+    elif isinstance(parsed, Path):
+        result.add_table(sink.filename, parsed)
+    else:
+        result.files[sink.filename] = parsed
+
+
+def _stored(key: str) -> pa.Table | None:
+    if not TABLE_CACHE_DISK:
+        return None
+    from app.tool.store import store
+
+    return store.get(key)
+
+
+def _share(key: str, df: pd.DataFrame) -> pd.DataFrame | pa.Table:
+    """
+    The parsed attachment as a table in the table store (app.tool.store), memory-mapped, so
+    workers handed the same file share one copy of it; `df` itself if it isn't stored.
+    """
+    if not TABLE_CACHE_DISK:
+        return df
+    from app.tool.store import store
+    from app.tool.tables import TableCache
+
+    table = store.get(key)
+    if table is None:
+        table = TableCache.to_arrow(df)
+        if table is None:
+            return df
+        try:
+            table = store.put(key, table)
+        except OSError as e:
+            logger.warning(f"Could not store attachment in the table store: {e}")
+            return df
+    return table
@@ -0,0 +1,58 @@
+import json
+from typing import Any
+
+
+class ObjectStream:
+    """
+    Incremental, tolerant scanner for JSON objects in text that arrives in pieces.
+
+    `feed` returns every object completed by the new text that sits directly in an array
+    or at the top level -- the items of `{"answers": [{...}, {...}]}`, of a bare `[...]`,
+    or objects one after another -- as soon as its closing brace arrives. Anything outside
+    JSON (code fences, prose) is skipped, and a reply cut off mid-way (deadline, max_tokens)
+    still yields every object that was complete; only the unfinished one is lost.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._in_string = False
+        self._escape = False
+        # open containers: (bracket, offset of the opening bracket)
+        self._stack: list[tuple[str, int]] = []
+
+    def feed(self, chunk: str) -> list[dict[str, Any]]:
+        self.text += chunk
+        found: list[dict[str, Any]] = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                # strings only count inside JSON; a stray quote in prose would swallow the rest
+                self._in_string = bool(self._stack)
+            elif c in "{[":
+                self._stack.append((c, i))
+            elif c in "}]":
+                opener = "{" if c == "}" else "["
+                # unbalanced input: drop containers until the matching opener, if any
+                while self._stack and self._stack[-1][0] != opener:
+                    self._stack.pop()
+                if not self._stack:
+                    continue
+                _, start = self._stack.pop()
+                if c == "}" and (not self._stack or self._stack[-1][0] == "["):
+                    try:
+                        value = json.loads(text[start : i + 1])
+                    except json.JSONDecodeError:
+                        continue
+                    if isinstance(value, dict):
+                        found.append(value)
+        self._pos = len(text)
+        return found
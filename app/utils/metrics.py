@@ -0,0 +1,251 @@
+import bisect
+import contextvars
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager, nullcontext
+from typing import Any
+
+from app.config import METRICS_ENABLED
+
+# Set from METRICS; with it off, spans and counters return before doing any work
+enabled = METRICS_ENABLED
+
+# Upper bounds of the latency buckets, in seconds: 1 ms up to the request deadline
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 180.0)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Labels) -> str:
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels) + "}" if labels else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """Monotonic count per label set, e.g. bytes fetched or cache hits."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1.0, **labels: str) -> None:
+        if not enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0.0) + value
+
+    def exposition(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(key)} {_number(value)}"
+
+
+class Gauge:
+    """Current value per label set, e.g. requests waiting in a queue."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels: str) -> None:
+        if not enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = value
+
+    def exposition(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            yield f"{self.name}{_labels(key)} {_number(value)}"
+
+
+class Histogram:
+    """Observations per label set in fixed buckets, plus their sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        # per label set: [count per bucket (the last one is +Inf), sum]
+        self.values: dict[Labels, list[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        if not enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def exposition(self) -> Iterator[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self.values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip((*self.buckets, "+Inf"), counts):
+                cumulative += n
+                le = bound if isinstance(bound, str) else _number(bound)
+                yield f"{self.name}_bucket{_labels((*key, ('le', le)))} {cumulative}"
+            yield f"{self.name}_sum{_labels(key)} {_number(total)}"
+            yield f"{self.name}_count{_labels(key)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Counter | Gauge | Histogram] = {}
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self.metrics.setdefault(name, Counter(name, help))
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self.metrics.setdefault(name, Gauge(name, help))
+
+    def histogram(self, name: str, help: str, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.metrics.setdefault(name, Histogram(name, help, buckets))
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+        lines: list[str] = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.exposition())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "agent_stage_seconds", "Time spent per span of each stage (fetch, parse, llm, compute, plot, encode, upload)"
+)
+REQUEST_SECONDS = registry.histogram("agent_request_seconds", "Request latency by route and status")
+REQUESTS = registry.counter("agent_requests_total", "Requests by route and status")
+FETCH_BYTES = registry.counter("agent_fetch_bytes_total", "Bytes received from origin servers")
+UPLOAD_BYTES = registry.counter("agent_upload_bytes_total", "Bytes of multipart uploads received")
+CACHE_REQUESTS = registry.counter("agent_cache_requests_total", "Cache lookups by cache and result")
+LLM_CALLS = registry.counter("agent_llm_calls_total", "Completions sent to the LLM proxy by outcome")
+LLM_PROMPT_TOKENS = registry.histogram("agent_llm_prompt_tokens", "Estimated prompt size of LLM calls", TOKEN_BUCKETS)
+ADMISSION_ACTIVE = registry.gauge("agent_admission_active", "Slots in use per resource class")
+ADMISSION_QUEUED = registry.gauge("agent_admission_queue_depth", "Waiters queued per resource class")
+ADMISSION_ESTIMATE = registry.gauge(
+    "agent_admission_wait_estimate_seconds", "Estimated queue wait of a new arrival per resource class"
+)
+ADMISSION_WAIT_SECONDS = registry.histogram("agent_admission_wait_seconds", "Time queued for a slot per resource class")
+ADMISSION_REJECTED = registry.counter("agent_admission_rejected_total", "Requests turned away (503) by reason")
+
+
+class Trace:
+    """
+    The spans of one request, for its Server-Timing header. With `observe=False` spans are
+    only collected, e.g. in a plot worker whose spans the parent process records.
+    """
+
+    def __init__(self, observe: bool = True):
+        self.observe = observe
+        self.started = time.perf_counter()
+        self.spans: list[tuple[str, float]] = []
+
+    def totals(self) -> dict[str, tuple[float, int]]:
+        """Seconds and number of spans per stage."""
+        out: dict[str, tuple[float, int]] = {}
+        for stage, seconds in list(self.spans):
+            total, n = out.get(stage, (0.0, 0))
+            out[stage] = (total + seconds, n + 1)
+        return out
+
+    def server_timing(self) -> str:
+        """
+        'fetch;dur=412.3, llm;dur=2210.0;desc="4 spans", total;dur=2950.1'. Durations of
+        concurrent spans add up, so a stage can exceed the total.
+        """
+        parts = [
+            f"{stage};dur={seconds * 1000:.1f}" + (f';desc="{n} spans"' if n > 1 else "")
+            for stage, (seconds, n) in self.totals().items()
+        ]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+# the current request's trace; asyncio tasks and to_thread calls inherit it
+_trace: contextvars.ContextVar[Trace | None] = contextvars.ContextVar("trace", default=None)
+
+
+@contextmanager
+def trace(observe: bool = True) -> Iterator[Trace]:
+    """Collect the spans recorded in this context (and tasks/threads started from it)."""
+    t = Trace(observe)
+    token = _trace.set(t)
+    try:
+        yield t
+    finally:
+        _trace.reset(token)
+
+
+def record(stage: str, seconds: float) -> None:
+    """Add a finished span to the stage histogram and the current trace."""
+    if not enabled:
+        return
+    t = _trace.get()
+    if t is None or t.observe:
+        STAGE_SECONDS.observe(seconds, stage=stage)
+    if t is not None:
+        t.spans.append((stage, seconds))
+
+
+class _Span:
+    __slots__ = ("stage", "t0")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self) -> "_Span":
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        record(self.stage, time.perf_counter() - self.t0)
+
+
+_NOOP = nullcontext()
+
+
+def span(stage: str) -> _Span | nullcontext:
+    """
+    Time the block as one span of `stage`:
+
+        with span("fetch"):
+            html = fetcher.get(url)
+
+    With metrics off this returns a shared no-op context manager.
+    """
+    if not enabled:
+        return _NOOP
+    return _Span(stage)
@@ -0,0 +1,69 @@
+import json
+import logging
+from typing import Any
+
+from app.config import MAX_RESP_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Bytes held back for each answer not yet admitted: a number, a short string or a placeholder
+RESERVE = 256
+# What a long text answer is cut down to when it has to shrink
+ELLIPSIS = "…"
+
+
+def size(answer: Any) -> int:
+    """Bytes the answer takes in the JSON response."""
+    return len(json.dumps(answer, default=str, ensure_ascii=False).encode())
+
+
+def omitted(nbytes: int) -> str:
+    return f"(answer omitted: {nbytes} bytes over the response size limit)"
+
+
+class ResponseBytes:
+    """
+    Running byte count of one response's answers against `limit` (MAX_RESP_BYTES).
+
+    Answers are admitted in the order they are ready, not question order, so each one may
+    use what is left after holding RESERVE bytes back for every answer still to come. An
+    answer over that is downgraded rather than dropped: a chart is re-encoded smaller, a
+    long text is cut short, anything else is replaced by a placeholder saying so.
+    """
+
+    def __init__(self, answers: int, limit: int = MAX_RESP_BYTES):
+        self.limit = limit
+        self.pending = answers
+        # brackets of the array plus a separator per answer
+        self.used = 2 + max(0, answers - 1)
+        self.downgraded: list[tuple[int, int]] = []  # (bytes asked for, bytes admitted)
+
+    def allowance(self) -> int:
+        """Bytes the next answer may take."""
+        return self.limit - self.used - RESERVE * max(0, self.pending - 1)
+
+    def admit(self, answer: Any) -> Any:
+        """`answer` if it fits the allowance, else the largest downgrade of it that does."""
+        nbytes, allowed = size(answer), self.allowance()
+        if nbytes > allowed:
+            answer = self._downgrade(answer, nbytes, allowed)
+            self.downgraded.append((nbytes, size(answer)))
+            logger.warning(f"Answer of {nbytes} bytes over the {allowed} left of MAX_RESP_BYTES; sent {size(answer)}")
+        self.used += size(answer)
+        self.pending = max(0, self.pending - 1)
+        return answer
+
+    @staticmethod
+    def _downgrade(answer: Any, nbytes: int, allowed: int) -> Any:
+        if isinstance(answer, str) and answer.startswith("data:image/"):
+            from app.utils.image import shrink_data_uri  # PIL, only once a chart has to shrink
+
+            smaller = shrink_data_uri(answer, allowed - 2)  # two bytes of quotes
+            return smaller if smaller is not None else omitted(nbytes - allowed)
+        if isinstance(answer, str) and allowed > RESERVE:
+            # cut by characters, then by bytes if multi-byte or escaped characters push it over
+            cut = answer[: allowed - 2 - len(ELLIPSIS.encode())] + ELLIPSIS
+            while size(cut) > allowed and len(cut) > 1:
+                cut = cut[: -len(ELLIPSIS) - max(1, (size(cut) - allowed))] + ELLIPSIS
+            return cut
+        return omitted(nbytes - allowed)
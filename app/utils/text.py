@@ -39,3 +39,8 @@ def split_numbered_questions(text: str) -> List[str]:
         if m:
             qs.append(m.group(2).strip())
     return qs if qs else [text.strip()]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English and numbers)."""
+    return (len(text) + 3) // 4
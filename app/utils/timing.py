@@ -1,11 +1,35 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import logging
 import signal
+import threading
+import time
+from collections.abc import Awaitable, Callable
 from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, TypeVar
+
+if TYPE_CHECKING:
+    from app.utils.admission import Gate
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
 
 class Timeout(Exception):
     pass
 
 @contextmanager
 def time_limit(seconds: int):
+    """
+    SIGALRM-based limit for scripts. Signals only reach the main thread, so anywhere else
+    (uvicorn workers, to_thread) this is a no-op; request code should use `Budget` instead.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        logger.debug("time_limit ignored outside the main thread")
+        yield
+        return
     def signal_handler(signum, frame):
         raise Timeout("Time limit exceeded")
     signal.signal(signal.SIGALRM, signal_handler)
@@ -14,3 +38,144 @@ def time_limit(seconds: int):
         yield
     finally:
         signal.alarm(0)
+
+
+class Budget:
+    """
+    Wall-clock budget of one request, split across its stages.
+
+    Stages are ordered as in `shares`. Each may use its share of the total plus whatever
+    earlier stages left unused, while keeping the shares of later stages in reserve. `run`
+    enforces that allowance on a coroutine and hands back a fallback on overrun, so a slow
+    stage degrades the answer instead of blowing the request's deadline. The wall-clock time of each stage
+    is recorded for the logs and the X-Stage-Budget response header.
+
+    `gates` maps stages to the admission gate of their resource class (utils.admission):
+    `run` waits for a slot before starting the work, and the wait counts against the stage.
+    Blocking work goes through `thread`, which holds the slot until the thread returns.
+    """
+
+    def __init__(self, total: float, shares: dict[str, float], gates: "dict[str, Gate] | None" = None):
+        self.total = total
+        self.shares = shares
+        self.gates = gates or {}
+        self.started = time.monotonic()
+        # wall-clock span of each stage, first start to last end: concurrent work in one
+        # stage (e.g. parallel LLM calls) is counted once
+        self.spans: dict[str, tuple[float, float]] = {}
+        self.degraded: list[str] = []
+        # threads still running after their stage gave up on them, by stage
+        self._stragglers: dict[str, set[asyncio.Future]] = {}
+        self._lock = threading.Lock()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self) -> float:
+        return max(0.0, self.total - self.elapsed())
+
+    def allowance(self, stage: str) -> float:
+        """Seconds `stage` may take right now."""
+        stages = list(self.shares)
+        later = stages[stages.index(stage) + 1 :] if stage in stages else []
+        reserve = sum(self.shares[s] for s in later) * self.total
+        own = self.shares.get(stage, 0.0) * self.total
+        remaining = self.remaining()
+        return min(remaining, max(own, remaining - reserve))
+
+    def low(self, stage: str, need: float) -> bool:
+        """True if `stage` has less than `need` seconds left and should take a cheaper path."""
+        return self.allowance(stage) < need
+
+    def degrade(self, what: str) -> None:
+        with self._lock:
+            self.degraded.append(what)
+        logger.warning(f"Budget: degraded {what} ({self.remaining():.1f}s left)")
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            t1 = time.monotonic()
+            with self._lock:
+                start, end = self.spans.get(name, (t0, t1))
+                self.spans[name] = (min(start, t0), max(end, t1))
+
+    def used(self, name: str) -> float:
+        start, end = self.spans.get(name, (0.0, 0.0))
+        return end - start
+
+    async def run(self, name: str, aw: Awaitable[T], fallback: Any = None) -> T | Any:
+        """
+        Await `aw` within the stage's allowance; on overrun cancel it and return `fallback`.
+        """
+        timeout = self.allowance(name)
+        gate = self.gates.get(name)
+        if gate is not None:
+            aw = self._gated(gate, aw)
+        with self.stage(name):
+            try:
+                return await asyncio.wait_for(aw, timeout=timeout)
+            except asyncio.TimeoutError:
+                self.degrade(f"{name}:timeout")
+                return fallback
+
+    async def thread(self, name: str, fn: Callable[[], T], fallback: Any = None) -> T | Any:
+        """
+        `run` for blocking work: `fn` in a worker thread. A thread can't be stopped, so one
+        that overruns keeps its gate slot until it actually returns, and later work of the
+        same stage in this request waits for it first: a request's threads of one stage
+        never overlap (compute threads share the analysis context).
+        """
+        timeout = self.allowance(name)
+        gate = self.gates.get(name)
+        loop = asyncio.get_running_loop()
+        fut: asyncio.Future | None = None
+
+        async def work() -> T:
+            nonlocal fut
+            if self._stragglers.get(name):
+                await asyncio.wait(list(self._stragglers[name]))
+            if gate is not None:
+                await gate.acquire()
+            t0 = time.monotonic()
+            fut = loop.run_in_executor(None, functools.partial(contextvars.copy_context().run, fn))
+            if gate is not None:
+                fut.add_done_callback(lambda _: gate.release(time.monotonic() - t0))
+            return await asyncio.shield(fut)
+
+        with self.stage(name):
+            try:
+                return await asyncio.wait_for(work(), timeout=timeout)
+            except asyncio.TimeoutError:
+                if fut is not None and not fut.done():
+                    stragglers = self._stragglers.setdefault(name, set())
+                    stragglers.add(fut)
+                    fut.add_done_callback(stragglers.discard)
+                    # nobody awaits it any more; retrieve its outcome so it isn't logged as lost
+                    fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+                self.degrade(f"{name}:timeout")
+                return fallback
+
+    @staticmethod
+    async def _gated(gate: "Gate", aw: Awaitable[T]) -> T:
+        try:
+            async with gate.slot():
+                return await aw
+        finally:
+            if inspect.iscoroutine(aw):
+                aw.close()  # timed out while queued: the work never started
+
+    def header(self) -> str:
+        """'fetch=0.120/42.5, parse=...' -- seconds used / share of the budget."""
+        stages = list(self.shares) + [s for s in self.spans if s not in self.shares]
+        parts = [f"{s}={self.used(s):.3f}/{self.shares.get(s, 0.0) * self.total:.1f}" for s in stages]
+        parts.append(f"total={self.elapsed():.3f}/{self.total:.1f}")
+        if self.degraded:
+            parts.append("degraded=" + "+".join(self.degraded))
+        return ", ".join(parts)
+
+    def log(self) -> None:
+        logger.info(f"Budget: {self.header()}")
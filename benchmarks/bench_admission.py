@@ -0,0 +1,85 @@
+"""
+Overload: requests arrive at a fixed rate well above what the LLM proxy (a stub with fixed
+latency, LLM_MAX_CONCURRENCY calls at a time) can serve. Without admission control every
+request is taken in and waits its turn for an LLM slot, so latency climbs towards the
+deadline and late requests are answered with placeholders. With it, requests beyond
+ADMIT_REQUESTS + ADMIT_QUEUE are turned away at once with 503 and Retry-After, and the
+admitted ones finish in bounded time.
+
+    python -m benchmarks.bench_admission --rate 12 --seconds 8 --llm-latency 1.0
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import numpy as np
+
+from benchmarks.stubs import StubLLM, _Server, structured
+
+QUESTIONS = "Answer the following question.\n\n1. What is the capital of country number {nonce}?\n"
+
+
+async def _load(base_url: str, rate: float, seconds: float, first: int) -> list[tuple[int, float, bool]]:
+    """Open-loop arrivals: (status, seconds, answered) per request."""
+    import httpx
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+
+        async def one(nonce: int) -> tuple[int, float, bool]:
+            files = {"questions": ("questions.txt", QUESTIONS.format(nonce=nonce).encode())}
+            t0 = time.perf_counter()
+            r = await client.post("/api/", files=files)
+            elapsed = time.perf_counter() - t0
+            answered = r.status_code == 200 and not str(r.json()[0]).startswith("(Failed")
+            return r.status_code, elapsed, answered
+
+        tasks = []
+        for i in range(int(rate * seconds)):
+            tasks.append(asyncio.create_task(one(first + i)))
+            await asyncio.sleep(1 / rate)
+        return await asyncio.gather(*tasks)
+
+
+def _report(mode: str, results: list[tuple[int, float, bool]]) -> None:
+    ok = [s for status, s, _ in results if status == 200]
+    shed = [s for status, s, _ in results if status == 503]
+    answered = sum(a for _, _, a in results)
+    pct = lambda v, q: f"{np.percentile(v, q):6.2f}s" if v else "     -"  # noqa: E731
+    print(f"{mode:4} {len(results):4} sent  {len(ok):4} x 200 (p50 {pct(ok, 50)}, p99 {pct(ok, 99)}, "
+          f"{answered} answered)  {len(shed):4} x 503 (p99 {pct(shed, 99)})")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rate", type=float, default=12.0, help="requests per second")
+    ap.add_argument("--seconds", type=float, default=8.0)
+    ap.add_argument("--llm-latency", type=float, default=1.0)
+    ap.add_argument("--llm-slots", type=int, default=4)
+    ap.add_argument("--deadline", type=float, default=20.0)
+    args = ap.parse_args()
+
+    with StubLLM(latency=args.llm_latency, reply=structured(lambda q: "stub answer")) as llm:
+        # before app.* is imported: config is read at import time
+        os.environ.update({
+            "OPENAI_PROXY_URL": llm.url, "OPENAI_PROXY_TOKEN": "stub", "LLM_CACHE_DISK": "0",
+            "LLM_MAX_CONCURRENCY": str(args.llm_slots), "HARD_TIMEOUT_SECONDS": str(int(args.deadline)),
+            "ADMIT_REQUESTS": str(args.llm_slots), "ADMIT_QUEUE": str(2 * args.llm_slots),
+        })
+        from app.main import app
+        from app.utils.admission import admission
+
+        limit, queue_size = admission.requests.limit, admission.requests.queue_size
+        with _Server(app) as server:
+            for mode, first in (("off", 0), ("on", 100_000)):
+                if mode == "off":
+                    admission.requests.limit, admission.requests.queue_size = 1_000_000, None
+                else:
+                    admission.requests.limit, admission.requests.queue_size = limit, queue_size
+                results = asyncio.run(_load(server.base_url, args.rate, args.seconds, first))
+                _report(mode, results)
+
+
+if __name__ == "__main__":
+    main()
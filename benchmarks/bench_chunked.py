@@ -0,0 +1,105 @@
+"""
+Peak RSS and time of answering the common aggregate questions (row count, mean, standard
+deviation, min/max, correlation, top values) over a large CSV, three ways:
+
+    full     pd.read_csv with default dtypes, then pandas aggregates (the old path)
+    compact  chunked read with compact dtypes (tool.chunked.Compactor, as utils.io.ingest
+             keeps the table), then one Profile pass over it
+    stream   one Profile pass over the chunks as they are read; nothing is kept
+
+Each runs in a fresh process.
+
+    python -m benchmarks.bench_chunked --mb 300
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CHUNK_ROWS = 100_000
+
+
+def write_csv(path: Path, mb: int) -> None:
+    rng = np.random.default_rng(0)
+    with open(path, "w") as f:
+        f.write("id,x,y,z,category,name\n")
+        i = 0
+        while f.tell() < mb * 1024 * 1024:
+            n = 500_000
+            x = rng.uniform(0, 100, n)
+            pd.DataFrame({
+                "id": np.arange(i, i + n), "x": x.round(3), "y": (2 * x + rng.normal(0, 10, n)).round(3),
+                "z": rng.integers(0, 1000, n), "category": rng.choice(list("ABCDE"), n),
+                "name": [f"user{k}" for k in rng.integers(0, 200_000, n)],
+            }).to_csv(f, header=False, index=False)
+            i += n
+
+
+def run(mode: str, path: Path) -> dict:
+    from app.tool.chunked import Comoments, Compactor, Profile, chunks_of
+
+    t0 = time.perf_counter()
+    if mode == "full":
+        df = pd.read_csv(path)
+        answers = {
+            "rows": len(df), "mean_x": df["x"].mean(), "std_y": df["y"].std(), "max_z": int(df["z"].max()),
+            "corr_xy": df["x"].corr(df["y"]), "top_category": df["category"].value_counts().index[0],
+            "top_name": df["name"].value_counts().index[0],
+        }
+    else:
+        fit = Comoments()
+        if mode == "compact":
+            compact = Compactor()
+            with pd.read_csv(path, chunksize=CHUNK_ROWS) as reader:
+                df = compact.concat([compact(chunk) for chunk in reader])
+            chunks = chunks_of(df, CHUNK_ROWS)
+        else:
+            reader = pd.read_csv(path, chunksize=CHUNK_ROWS)
+            chunks = reader
+
+        def fitted(chunks):
+            for chunk in chunks:
+                fit.update(chunk["x"].to_numpy(), chunk["y"].to_numpy())
+                yield chunk
+
+        profile = Profile.of(fitted(chunks))
+        answers = {
+            "rows": profile.rows, "mean_x": profile.moments["x"].mean, "std_y": profile.moments["y"].std(),
+            "max_z": int(profile.moments["z"].max), "corr_xy": fit.correlation(),
+            "top_category": profile.top["category"].top(1)[0][0], "top_name": profile.top["name"].top(1)[0][0],
+        }
+    elapsed = time.perf_counter() - t0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {"mode": mode, "file_mb": round(path.stat().st_size / 2**20), "seconds": round(elapsed, 2),
+            "peak_rss_mb": round(peak),
+            "answers": {k: round(v, 6) if isinstance(v, float) else v for k, v in answers.items()}}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mb", type=int, default=300)
+    ap.add_argument("--child", nargs=2, metavar=("MODE", "PATH"))
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(run(args.child[0], Path(args.child[1]))))
+        return
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "data.csv"
+        write_csv(path, args.mb)
+        for mode in ("full", "compact", "stream"):
+            out = subprocess.run([sys.executable, "-m", "benchmarks.bench_chunked", "--child", mode, str(path)],
+                                 capture_output=True, text=True, check=True)
+            print(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Cold start per endpoint: each run is a fresh `python -X importtime` process that imports
+app.main, runs the app's startup, and serves one request followed by a second (warm) one.
+Reports the seconds for each phase and, from the import-time profile, how many modules
+each phase imported and the slowest of them, so an eager import that creeps back in shows
+up against the endpoint that pays for it.
+
+--mode serverless sets VERCEL=1 (no warm-up, plots in-process); --mode container runs the
+startup warm-up (WARMUP=1) and shows what it moves off the first request. The LLM and the
+origin are stubs in this (parent) process, so the child's profile is the app's alone.
+
+    python -m benchmarks.bench_coldstart --mode serverless --out coldstart.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+PHASES = ("import", "startup", "first", "second")
+BOUNDARY = "bench-coldstart-51c2"
+CSV = "x,y,category\n" + "".join(f"{i},{2 * i + (i * 7919) % 13},{'ABC'[i % 3]}\n" for i in range(2000))
+
+
+def multipart(questions: str, csv: str | None = None) -> bytes:
+    parts = [f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="questions"; filename="questions.txt"\r\n'
+             f"Content-Type: text/plain\r\n\r\n{questions}\r\n"]
+    if csv is not None:
+        parts.append(f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="attachments"; filename="data.csv"\r\n'
+                     f"Content-Type: text/csv\r\n\r\n{csv}\r\n")
+    parts.append(f"--{BOUNDARY}--\r\n")
+    return "".join(parts).encode()
+
+
+def endpoints(origin_url: str) -> dict[str, tuple[str, str, bytes]]:
+    return {
+        "health": ("GET", "/", b""),
+        "metrics": ("GET", "/metrics", b""),
+        "api-llm": ("POST", "/api/", multipart("1. Which film is the best?\n")),
+        "api-csv": ("POST", "/api/", multipart(
+            "1. What's the correlation between the x and y?\n"
+            "2. Draw a scatterplot of x and y along with a dotted red regression line through it.\n", CSV)),
+        "api-scrape": ("POST", "/api/", multipart(
+            f"Scrape {origin_url}\n1. How many $2 bn movies were released before 2000?\n"
+            "2. What's the correlation between the Rank and Peak?\n")),
+    }
+
+
+async def call(app, method: str, path: str, body: bytes) -> int:
+    """One request through the ASGI interface directly, so no client library is imported."""
+    headers = [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode()),
+               (b"content-length", str(len(body)).encode())] if body else []
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "", "headers": headers,
+        "client": ("127.0.0.1", 50000), "server": ("bench", 80),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    status = 0
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.Event().wait()  # no disconnect while the response is produced
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+def mark(phase: str) -> None:
+    # separates the import-time profile (on stderr) into phases
+    sys.stderr.write(f"coldstart-phase: {phase}\n")
+    sys.stderr.flush()
+
+
+def child(endpoint: str) -> dict:
+    method, path, body = endpoints(os.environ["BENCH_ORIGIN_URL"])[endpoint]
+    seconds = {}
+    mark("import")
+    t0 = time.perf_counter()
+    from app.main import app
+
+    seconds["import"] = time.perf_counter() - t0
+
+    async def run() -> list[int]:
+        mark("startup")
+        t0 = time.perf_counter()
+        async with app.router.lifespan_context(app):
+            seconds["startup"] = time.perf_counter() - t0
+            statuses = []
+            for phase in ("first", "second"):
+                mark(phase)
+                t0 = time.perf_counter()
+                statuses.append(await call(app, method, path, body))
+                seconds[phase] = time.perf_counter() - t0
+            mark("shutdown")
+        return statuses
+
+    statuses = asyncio.run(run())
+    return {"seconds": {k: round(v, 4) for k, v in seconds.items()}, "status": statuses}
+
+
+def profile(stderr: str, top: int) -> dict[str, dict]:
+    """Per phase: modules imported and the slowest top-level imports (cumulative ms)."""
+    out: dict[str, dict] = {}
+    phase = None
+    for line in stderr.splitlines():
+        if line.startswith("coldstart-phase: "):
+            phase = line.split(": ", 1)[1]
+            out.setdefault(phase, {"modules": 0, "ms": 0.0, "slowest": []})
+            continue
+        if phase is None or not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative_us, name = line.split(":", 1)[1].split("|")
+        out[phase]["modules"] += 1
+        if len(name) - len(name.lstrip(" ")) == 1:  # imported directly, not by another module
+            out[phase]["ms"] += int(cumulative_us) / 1000
+            out[phase]["slowest"].append((name.strip(), round(int(cumulative_us) / 1000, 1)))
+    for stats in out.values():
+        stats["ms"] = round(stats["ms"], 1)
+        stats["slowest"] = sorted(stats["slowest"], key=lambda m: -m[1])[:top]
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mode", choices=("serverless", "container"), default="serverless")
+    ap.add_argument("--endpoints", default="health,metrics,api-llm,api-csv,api-scrape")
+    ap.add_argument("--top", type=int, default=5, help="slowest imports listed per phase")
+    ap.add_argument("--out", help="result file (default benchmarks/results/coldstart-<mode>-<commit>.json)")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(child(args.child)))
+        return
+
+    import tempfile
+    from pathlib import Path
+
+    from benchmarks.bench_e2e import RESULTS, ROOT, git_commit
+    from benchmarks.fixtures import films_page
+    from benchmarks.stubs import StubLLM, StubOrigin
+
+    commit = git_commit()
+    report = {"meta": {"commit": commit, "mode": args.mode, "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "python": sys.version.split()[0]}, "endpoints": {}}
+    with StubLLM(latency=0.05, reply='"stub"') as llm, StubOrigin({"films": films_page()}) as origin, \
+            tempfile.TemporaryDirectory() as cache_dir:
+        env = {**os.environ, "OPENAI_PROXY_URL": llm.url, "OPENAI_PROXY_TOKEN": "stub", "CACHE_DIR": cache_dir,
+               "BENCH_ORIGIN_URL": origin.url("films"), "LLM_CACHE_DISK": "0", "FETCH_CACHE_DISK": "0",
+               "TABLE_CACHE_DISK": "0"}
+        if args.mode == "serverless":
+            env.update({"VERCEL": "1"})
+        else:
+            env.pop("VERCEL", None)
+            env.update({"WARMUP": "1"})
+        for endpoint in args.endpoints.split(","):
+            t0 = time.perf_counter()
+            out = subprocess.run([sys.executable, "-X", "importtime", "-m", "benchmarks.bench_coldstart",
+                                  "--child", endpoint], cwd=ROOT, env=env, capture_output=True, text=True)
+            wall = time.perf_counter() - t0
+            if out.returncode != 0:
+                print(f"{endpoint}: failed\n{out.stderr[-2000:]}")
+                continue
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            result["process_seconds"] = round(wall, 3)
+            result["imports"] = profile(out.stderr, args.top)
+            report["endpoints"][endpoint] = result
+            s = result["seconds"]
+            print(f"{endpoint:11s} status={result['status']} process={wall:.2f}s import={s['import']:.3f}s "
+                  f"startup={s['startup']:.3f}s first={s['first']:.3f}s second={s['second']:.3f}s")
+            for phase in PHASES:
+                stats = result["imports"].get(phase)
+                if stats and stats["modules"]:
+                    slowest = ", ".join(f"{name} {ms:.0f}ms" for name, ms in stats["slowest"])
+                    print(f"{'':11s}   {phase:7s} {stats['modules']:4d} modules {stats['ms']:7.0f}ms  {slowest}")
+
+    out_path = Path(args.out) if args.out else RESULTS / f"coldstart-{args.mode}-{commit}.json"
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"\nwrote {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Prompt tokens and build latency of the table context for tables of 10 to 1M rows: the
+old head(20) JSON sample vs. the TableDigest (stats and computed values over all rows).
+
+    python -m benchmarks.bench_digest --max-rows 1000000
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.analyzer.context import AnalysisContext
+from app.analyzer.digest import TableDigest, estimate_tokens
+
+QUESTIONS = [
+    "How many $2 bn movies were released before 2000?",
+    "What is the average worldwide gross?",
+    "What's the correlation between the rank and peak?",
+    "Which title has the highest worldwide gross?",
+]
+
+
+def table(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    gross = np.sort(rng.uniform(1e8, 3e9, rows))[::-1]
+    return pd.DataFrame({
+        "rank": np.arange(1, rows + 1),
+        "peak": rng.integers(1, 50, rows),
+        "title": [f"Film {i}" for i in range(rows)],
+        "worldwide_gross": [f"${g:,.0f}[{i % 7}]" for i, g in enumerate(gross)],
+        "year": rng.integers(1950, 2025, rows),
+        "studio": rng.choice(["Disney", "Warner Bros.", "Universal", "Paramount", "Sony"], rows),
+    })
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--max-rows", type=int, default=1_000_000)
+    args = ap.parse_args()
+
+    rows = 10
+    while rows <= args.max_rows:
+        df = table(rows)
+        t0 = time.perf_counter()
+        sample = json.dumps(df.head(20).to_dict(orient="records"), default=str)
+        t_sample = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        digest = TableDigest(AnalysisContext([df]), QUESTIONS).render()
+        t_digest = time.perf_counter() - t0
+        print(f"rows={rows:>9,d}  head(20) json: {estimate_tokens(sample):5d} tokens {t_sample * 1000:8.1f}ms  "
+              f"digest: {estimate_tokens(digest):5d} tokens {t_digest * 1000:8.1f}ms")
+        rows *= 10
+
+
+if __name__ == "__main__":
+    main()
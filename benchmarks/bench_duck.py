@@ -0,0 +1,93 @@
+"""
+DuckDB per-query overhead and pushdown:
+- the old Duck.query (fresh :memory: connection + INSTALL/LOAD per call) vs. the shared
+  engine's pooled connections;
+- a correlation over a large parquet upload: pandas read_parquet + corr vs. corr() pushed
+  down to a DuckDB view of the file. Each side runs in a fresh process for peak RSS.
+
+    python -m benchmarks.bench_duck --rows 20000000
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def old_query(sql: str):
+    import duckdb
+
+    con = duckdb.connect(database=":memory:")
+    for ext in ("httpfs", "parquet"):
+        try:
+            con.execute(f"INSTALL {ext}; LOAD {ext};")
+        except duckdb.Error:
+            pass  # offline: the old code would have raised here
+    return con.sql(sql).fetchall()
+
+
+def per_query(n: int) -> None:
+    from app.tool.duck import engine
+
+    engine.start()
+    for name, fn in (("fresh connection", old_query), ("engine", lambda sql: engine.query(sql))):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn("SELECT 42")
+        print(f"{name:17s} {(time.perf_counter() - t0) / n * 1000:8.2f} ms/query")
+
+
+def child(method: str, path: Path) -> dict:
+    rss = lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # noqa: E731
+    base = rss()
+    t0 = time.perf_counter()
+    if method == "pandas":
+        import pandas as pd
+
+        df = pd.read_parquet(path)
+        r = df["x"].corr(df["y"])
+    else:
+        from app.tool.duck import engine
+
+        with engine.session() as duck:
+            r = duck.register("t", path).scalar('corr("x", "y")')
+    return {"method": method, "seconds": round(time.perf_counter() - t0, 3),
+            "peak_rss_delta_mb": round(rss() - base), "corr": round(float(r), 6)}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=20_000_000)
+    ap.add_argument("--queries", type=int, default=20)
+    ap.add_argument("--child", nargs=2, metavar=("METHOD", "PATH"))
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(child(args.child[0], Path(args.child[1]))))
+        return
+
+    per_query(args.queries)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "data.parquet"
+        rng = np.random.default_rng(0)
+        x = rng.uniform(0, 100, args.rows)
+        pq.write_table(pa.table({
+            "x": x, "y": 2 * x + rng.normal(0, 10, args.rows), "z": rng.integers(0, 1000, args.rows),
+            "category": rng.choice(list("ABCDE"), args.rows),
+        }), path)
+        del x
+        for method in ("pandas", "duckdb"):
+            out = subprocess.run([sys.executable, "-m", "benchmarks.bench_duck", "--child", method, str(path)],
+                                 capture_output=True, text=True, check=True)
+            print(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+End-to-end benchmark of POST /api/, fully offline: `app.main.app` is driven in-process
+through httpx's ASGI transport (with its lifespan, so plot workers and DuckDB start as in
+production), pages come from a local origin serving recorded HTML, and the LLM is a stub
+with fixed latency and deterministic replies.
+
+Scenarios:
+- scrape: the questions of question.txt against the films page (fetch, parse, local
+  handlers, one plot, LLM);
+- csv-<rows>: a CSV attachment of increasing size with counts, a correlation, a plot and an
+  LLM question;
+- plots: a question set that is mostly charts.
+
+Each scenario runs in a fresh process (so its peak RSS is its own) at every concurrency
+level, and reports p50/p95/p99 latency, throughput, errors and the mean per-stage time
+taken from the Server-Timing header. Results are written as JSON; --compare prints the
+change against an earlier run.
+
+    python -m benchmarks.bench_e2e --concurrency 1,4,16 --requests 16
+    python -m benchmarks.bench_e2e --compare benchmarks/results/e2e-<commit>.json
+    python -m benchmarks.bench_e2e --html saved_wikipedia_page.html  # a recorded real page
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.fixtures import films_page, numeric_csv
+from benchmarks.stubs import StubLLM, StubOrigin, structured
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS = Path(__file__).resolve().parent / "results"
+BOUNDARY = "bench-e2e-3f9a"
+
+SCRAPE_QUESTIONS = """Scrape the list of highest grossing films from Wikipedia. It is at the URL:
+{url}
+
+Answer the following questions and respond with a JSON array of strings containing the answer.
+
+1. How many $2 bn movies were released before 2000?
+2. Which is the earliest film that grossed over $1.5 bn?
+3. What's the correlation between the Rank and Peak?
+4. Draw a scatterplot of Rank and Peak along with a dotted red regression line through it.
+   Return as a base-64 encoded data URI, `"data:image/png;base64,iVBORw0KG..."` under 100,000 bytes.
+5. Which studio appears most often in request {nonce}?
+"""
+
+CSV_QUESTIONS = """Answer the following questions about the attached data.csv as a JSON array.
+
+1. What's the correlation between the x and y?
+2. Draw a scatterplot of x and y along with a dotted red regression line through it.
+3. What's the correlation between the z and x?
+4. Describe the category column for request {nonce}.
+"""
+
+PLOT_QUESTIONS = """Scrape {url} and answer as a JSON array.
+
+1. Draw a scatterplot of Rank and Peak along with a dotted red regression line through it.
+2. Draw a scatterplot of Rank and Year.
+3. Draw a scatterplot of Year and Peak along with a regression line.
+4. Draw a scatterplot of Peak and Rank.
+5. Summarize the trend for request {nonce}.
+"""
+
+
+def fake_answer(question: str) -> str:
+    """Deterministic answer per question, so runs are comparable."""
+    return f"stub-{hashlib.sha1(question.encode()).hexdigest()[:8]}"
+
+
+async def multipart(questions: str, csv_path: Path | None):
+    """Request body, streamed; attachments are read from disk in 1 MiB chunks."""
+    yield (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="questions"; filename="questions.txt"\r\n'
+           f"Content-Type: text/plain\r\n\r\n{questions}\r\n").encode()
+    if csv_path is not None:
+        yield (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="attachments"; filename="data.csv"\r\n'
+               f"Content-Type: text/csv\r\n\r\n").encode()
+        with open(csv_path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                yield chunk
+        yield b"\r\n"
+    yield f"--{BOUNDARY}--\r\n".encode()
+
+
+def server_timing(header: str) -> dict[str, float]:
+    """'fetch;dur=12.3, llm;dur=40.1;desc="2 spans"' -> {"fetch": 12.3, "llm": 40.1}"""
+    out = {}
+    for part in header.split(","):
+        name, *params = part.strip().split(";")
+        for p in params:
+            if p.startswith("dur="):
+                out[name] = float(p[4:])
+    return out
+
+
+def percentiles(latencies: list[float]) -> dict[str, float]:
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if latencies else (float("nan"),) * 3
+    return {"p50": round(p50, 4), "p95": round(p95, 4), "p99": round(p99, 4)}
+
+
+async def drive(scenario: str, origin_url: str, csv_path: Path | None, levels: list[int], requests: int) -> dict:
+    import httpx
+
+    from app.main import app
+
+    template = {"scrape": SCRAPE_QUESTIONS, "plots": PLOT_QUESTIONS}.get(scenario, CSV_QUESTIONS)
+    rss = lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # noqa: E731
+    nonce = 0
+    stages: dict[str, list[float]] = {}
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+            async def one() -> tuple[float, bool]:
+                nonlocal nonce
+                nonce += 1
+                # a fresh LLM question each time, so the response cache doesn't hide the model
+                questions = template.format(url=origin_url, nonce=nonce)
+                t0 = time.perf_counter()
+                r = await client.post("/api/", content=multipart(questions, csv_path),
+                                      headers={"content-type": f"multipart/form-data; boundary={BOUNDARY}"})
+                elapsed = time.perf_counter() - t0
+                for stage, ms in server_timing(r.headers.get("server-timing", "")).items():
+                    stages.setdefault(stage, []).append(ms)
+                return elapsed, r.status_code == 200
+
+            await one()  # warm-up: first plot, first fetch, first DuckDB query
+            stages.clear()
+            base_rss = rss()
+            results = []
+            for concurrency in levels:
+                slots = asyncio.Semaphore(concurrency)
+
+                async def bounded():
+                    async with slots:
+                        return await one()
+
+                t0 = time.perf_counter()
+                done = await asyncio.gather(*(bounded() for _ in range(requests)))
+                wall = time.perf_counter() - t0
+                latencies = [t for t, ok in done if ok]
+                results.append({
+                    "concurrency": concurrency, "requests": requests, "errors": sum(not ok for _, ok in done),
+                    **percentiles(latencies), "throughput_rps": round(len(latencies) / wall, 3),
+                })
+    return {
+        "levels": results,
+        "stages_ms": {s: round(float(np.mean(v)), 2) for s, v in sorted(stages.items())},
+        "peak_rss_mb": round(rss()),
+        "peak_rss_over_warm_mb": round(rss() - base_rss),
+    }
+
+
+def child(args: argparse.Namespace) -> dict:
+    html = Path(args.html).read_text() if args.html else films_page()
+    with StubLLM(latency=args.llm_latency, reply=structured(fake_answer)) as llm, StubOrigin({"films": html}) as origin:
+        # before app.* is imported: config is read at import time
+        os.environ.update({
+            "OPENAI_PROXY_URL": llm.url, "OPENAI_PROXY_TOKEN": "stub", "SERVER_TIMING": "1", "METRICS": "1",
+            "CACHE_DIR": args.cache_dir, "LLM_CACHE_DISK": "0",
+        })
+        csv_path = Path(args.csv) if args.csv else None
+        levels = [int(c) for c in args.concurrency.split(",")]
+        return asyncio.run(drive(args.child, origin.url("films"), csv_path, levels, args.requests))
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: dict, baseline: dict) -> None:
+    print(f"\nvs. {baseline['meta']['commit']} ({baseline['meta']['date']}):")
+    for name, result in current["scenarios"].items():
+        old = baseline["scenarios"].get(name)
+        if old is None:
+            continue
+        for level, old_level in zip(result["levels"], old["levels"]):
+            changes = "  ".join(
+                f"{k} {(level[k] / old_level[k] - 1) * 100:+6.1f}%"
+                for k in ("p50", "p95", "p99", "throughput_rps") if old_level.get(k)
+            )
+            print(f"  {name:12s} c={level['concurrency']:<3d} {changes}")
+        print(f"  {name:12s} peak RSS {result['peak_rss_mb']} MB (was {old['peak_rss_mb']} MB)")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scenarios", default="scrape,csv,plots")
+    ap.add_argument("--csv-rows", default="1000,100000,1000000", help="sizes of the csv scenario")
+    ap.add_argument("--concurrency", default="1,4,16")
+    ap.add_argument("--requests", type=int, default=16, help="requests per concurrency level")
+    ap.add_argument("--llm-latency", type=float, default=0.2)
+    ap.add_argument("--html", help="recorded page to serve instead of the synthetic films page")
+    ap.add_argument("--out", help="result file (default benchmarks/results/e2e-<commit>.json)")
+    ap.add_argument("--compare", help="earlier result file to compare against")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    ap.add_argument("--csv", help=argparse.SUPPRESS)
+    ap.add_argument("--cache-dir", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(child(args)))
+        return
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit, "date": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+            "cpus": os.cpu_count(), "concurrency": args.concurrency, "requests": args.requests,
+            "llm_latency": args.llm_latency, "html": args.html or "synthetic films page",
+        },
+        "scenarios": {},
+    }
+    with tempfile.TemporaryDirectory() as tmpdir:
+        runs: list[tuple[str, Path | None]] = []
+        for scenario in args.scenarios.split(","):
+            if scenario != "csv":
+                runs.append((scenario, None))
+                continue
+            for rows in (int(r) for r in args.csv_rows.split(",")):
+                path = Path(tmpdir) / f"data-{rows}.csv"
+                path.write_text(numeric_csv(rows))
+                runs.append((f"csv-{rows}", path))
+
+        for name, csv_path in runs:
+            cmd = [sys.executable, "-m", "benchmarks.bench_e2e", "--child", name.split("-")[0],
+                   "--concurrency", args.concurrency, "--requests", str(args.requests),
+                   "--llm-latency", str(args.llm_latency), "--cache-dir", str(Path(tmpdir) / f"cache-{name}")]
+            if csv_path is not None:
+                cmd += ["--csv", str(csv_path)]
+            if args.html:
+                cmd += ["--html", args.html]
+            out = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+            if out.returncode != 0:
+                print(f"{name}: failed\n{out.stderr[-2000:]}")
+                continue
+            result = report["scenarios"][name] = json.loads(out.stdout.strip().splitlines()[-1])
+            for level in result["levels"]:
+                print(f"{name:12s} c={level['concurrency']:<3d} p50={level['p50']:.3f}s p95={level['p95']:.3f}s "
+                      f"p99={level['p99']:.3f}s {level['throughput_rps']:.2f} req/s errors={level['errors']}")
+            stages = " ".join(f"{s}={ms:.0f}ms" for s, ms in result["stages_ms"].items())
+            print(f"{name:12s} peak RSS {result['peak_rss_mb']} MB; mean per request: {stages}")
+
+    out_path = Path(args.out) if args.out else RESULTS / f"e2e-{commit}.json"
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"\nwrote {out_path}")
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == "__main__":
+    main()
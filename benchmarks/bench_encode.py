@@ -0,0 +1,97 @@
+"""
+Encode time and bytes per chart type: the two old size guards (tool/plot.py: RGB PNG with
+a WebP fallback and byte truncation; analyzer/plot_util.py: PIL optimize + 0.9 resize loop)
+vs. app.utils.image.encode_figure. "valid" is whether PIL can decode the result.
+
+    python -m benchmarks.bench_encode --max-bytes 100000
+"""
+import argparse
+import io
+import time
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+
+from app.utils.image import encode_figure
+
+
+def chart(kind: str) -> Figure:
+    rng = np.random.default_rng(0)
+    fig = Figure(figsize=(5, 4), dpi=120)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    if kind == "scatter-50":
+        x = rng.uniform(0, 50, 50)
+        ax.scatter(x, 2 * x + rng.normal(0, 5, 50))
+    elif kind == "scatter-200k":
+        x = rng.normal(0, 1, 200_000)
+        ax.scatter(x, x + rng.normal(0, 1, 200_000), s=1, c=rng.uniform(0, 1, 200_000), cmap="viridis")
+    elif kind == "line-10k":
+        ax.plot(np.cumsum(rng.normal(0, 1, 10_000)))
+    elif kind == "bar-30":
+        ax.bar(range(30), rng.uniform(0, 100, 30), color="tab:blue")
+    ax.set_xlabel("x")
+    ax.set_ylabel("y")
+    fig.tight_layout()
+    return fig
+
+
+def old_tool_plot(fig: Figure, max_bytes: int) -> tuple[bytes, int]:
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    data = buf.getvalue()
+    if len(data) <= max_bytes:
+        return data, 1
+    out = io.BytesIO()
+    Image.open(io.BytesIO(data)).save(out, format="WEBP", quality=55, method=6)
+    return out.getvalue(), 2
+
+
+def old_plot_util(fig: Figure, max_bytes: int) -> tuple[bytes, int]:
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=120)
+    img = Image.open(io.BytesIO(buf.getvalue()))
+    out = io.BytesIO()
+    img.save(out, format="PNG", optimize=True)
+    data, encodes = out.getvalue(), 2
+    while len(data) > max_bytes and max(img.size) > 400:
+        img = img.resize((int(img.width * 0.9), int(img.height * 0.9)))
+        out = io.BytesIO()
+        img.save(out, format="PNG", optimize=True)
+        data, encodes = out.getvalue(), encodes + 1
+    return data, encodes
+
+
+def new_encoder(fig: Figure, max_bytes: int) -> tuple[bytes, int]:
+    encoded = encode_figure(fig, max_bytes, dpi=120)
+    return encoded.data, encoded.encodes
+
+
+def valid(data: bytes) -> bool:
+    try:
+        Image.open(io.BytesIO(data)).load()
+        return True
+    except Exception:
+        return False
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--max-bytes", type=int, default=100_000)
+    args = ap.parse_args()
+
+    for kind in ("scatter-50", "scatter-200k", "line-10k", "bar-30"):
+        fig = chart(kind)
+        fig.canvas.draw()  # pay the first layout outside the timings
+        for name, encode in (("tool/plot", old_tool_plot), ("plot_util", old_plot_util), ("encoder", new_encoder)):
+            t0 = time.perf_counter()
+            data, encodes = encode(fig, args.max_bytes)
+            elapsed = time.perf_counter() - t0
+            print(f"{kind:13s} {name:10s} {elapsed * 1000:7.1f}ms {len(data):8d}B encodes={encodes:2d} "
+                  f"under_cap={len(data) <= args.max_bytes} valid={valid(data)}")
+
+
+if __name__ == "__main__":
+    main()
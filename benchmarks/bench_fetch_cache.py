@@ -0,0 +1,48 @@
+"""
+Upstream traffic and latency of repeated Web.get calls against a local origin, for the
+fresh, stale-while-revalidate and conditional-revalidation paths of the fetch cache.
+
+    python -m benchmarks.bench_fetch_cache --kb 800 --repeat 20
+"""
+import argparse
+import time
+
+from benchmarks.stubs import StubOrigin
+
+
+def timed(fn, repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--kb", type=int, default=800, help="page size")
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    from app.tool.fetch import Fetcher
+
+    page = "<html><body>" + "<p>row</p>" * (args.kb * 100) + "</body></html>"
+    with StubOrigin({"page": page}) as origin:
+        url = origin.url("page")
+        scenarios = {
+            "fresh": Fetcher(min_fresh=3600),
+            "stale-while-revalidate": Fetcher(min_fresh=0, stale_while_revalidate=3600),
+            "revalidate (304)": Fetcher(min_fresh=0, stale_while_revalidate=0),
+        }
+        for name, fetcher in scenarios.items():
+            origin.full = origin.not_modified = 0
+            cold = timed(lambda: fetcher.get(url), 1)
+            warm = timed(lambda: fetcher.get(url), args.repeat)
+            time.sleep(0.2)  # let background revalidations land
+            print(
+                f"{name:24s} cold={cold * 1000:7.1f}ms warm={warm * 1000:7.2f}ms "
+                f"upstream 200s={origin.full} 304s={origin.not_modified} counters={fetcher.counters}"
+            )
+
+
+if __name__ == "__main__":
+    main()
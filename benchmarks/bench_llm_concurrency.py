@@ -0,0 +1,64 @@
+"""
+Throughput of N concurrent /api/ requests against a stub LLM with fixed latency, plus the
+latency of the / health check while they are in flight. With --duplicates every request
+carries the same questions, which the response cache collapses into one upstream call.
+
+    python -m benchmarks.bench_llm_concurrency --requests 32 --latency 0.5 [--duplicates]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from benchmarks.stubs import StubLLM
+
+
+async def run(n: int, duplicates: bool) -> None:
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+
+        async def one(i: int) -> float:
+            questions = f"1. What is answer {0 if duplicates else i}?\n".encode()
+            t0 = time.perf_counter()
+            r = await client.post("/api/", files={"questions": ("questions.txt", questions)})
+            r.raise_for_status()
+            return time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        load = asyncio.gather(*(one(i) for i in range(n)))
+        await asyncio.sleep(0.05)
+        h0 = time.perf_counter()
+        (await client.get("/")).raise_for_status()
+        health = time.perf_counter() - h0
+        latencies = sorted(await load)
+        wall = time.perf_counter() - t0
+
+    print(f"requests={n} wall={wall:.2f}s throughput={n / wall:.1f} req/s")
+    print(f"p50={latencies[n // 2]:.3f}s max={latencies[-1]:.3f}s health_check_under_load={health * 1000:.1f}ms")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=32)
+    ap.add_argument("--latency", type=float, default=0.5)
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--duplicates", action="store_true")
+    args = ap.parse_args()
+
+    with StubLLM(latency=args.latency, reply='["ok"]', fail_rate=args.fail_rate) as llm:
+        os.environ["OPENAI_PROXY_URL"] = llm.url
+        os.environ.setdefault("OPENAI_PROXY_TOKEN", "stub")
+        os.environ.setdefault("LLM_CACHE_DISK", "0")
+        asyncio.run(run(args.requests, args.duplicates))
+        from app.tool.llm import cache_stats
+
+        print(f"upstream calls={llm.calls} peak_in_flight={llm.peak_in_flight}")
+        print(f"cache={cache_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Per-call cost of the instrumentation (app.utils.metrics) with metrics on and off, against
+an uninstrumented baseline: a span around an empty block, and a labelled counter increment.
+
+    python -m benchmarks.bench_metrics --n 1000000
+"""
+import argparse
+import time
+
+from app.utils import metrics
+
+
+def per_call(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e9
+
+
+def span() -> None:
+    with metrics.span("compute"):
+        pass
+
+
+def count() -> None:
+    metrics.CACHE_REQUESTS.inc(cache="llm", result="hit")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=1_000_000)
+    args = ap.parse_args()
+
+    baseline = per_call(lambda: None, args.n)
+    print(f"{'baseline call':22s} {baseline:7.0f} ns")
+    for enabled in (False, True):
+        metrics.enabled = enabled
+        with metrics.trace():
+            label = "on, in a request" if enabled else "off"
+            print(f"{'span, ' + label:22s} {per_call(span, args.n) - baseline:7.0f} ns")
+            print(f"{'counter, ' + label:22s} {per_call(count, args.n) - baseline:7.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
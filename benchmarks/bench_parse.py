@@ -0,0 +1,83 @@
+"""
+Per-cell regex lambdas (the old WikiFilms.to_num / year_from_title) vs. the vectorized
+Tables.parse_money / parse_year / parse_int on synthetic Wikipedia-style columns.
+
+    python -m benchmarks.bench_parse --rows 100000
+"""
+import argparse
+import random
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.tool.tables import Tables
+
+
+def old_to_num(v):
+    s = str(v).replace(",", "")
+    m = re.search(r"\$\s*([0-9]+(?:\.[0-9]+)?)\s*([mb]n|billion)?", s, re.I)
+    if m:
+        val = float(m.group(1))
+        unit = (m.group(2) or "").lower()
+        if unit.startswith("b"):
+            val *= 1_000_000_000
+        elif unit.startswith("m"):
+            val *= 1_000_000
+        return val
+    s = re.sub(r"[^0-9.]", "", s)
+    return float(s) if s else np.nan
+
+
+def old_year_from_title(s):
+    m = re.search(r"(19|20)\d{2}", str(s))
+    return int(m.group()) if m else None
+
+
+def old_int(x):
+    s = str(x).replace(",", "")
+    m = re.search(r"-?\d+", s)
+    return int(m.group()) if m else None
+
+
+def columns(rows: int) -> dict[str, pd.Series]:
+    rng = random.Random(0)
+    money = [
+        rng.choice(["", "T", "F8"]) + f"${rng.randint(10**8, 3 * 10**9):,}[{rng.randint(1, 9)}]"
+        if rng.random() > 0.1 else f"${rng.randint(1, 9)}.{rng.randint(0, 9)} billion"
+        for _ in range(rows)
+    ]
+    titles = [f"Film {i} ({rng.randint(1950, 2024)})" for i in range(rows)]
+    ints = [f"{rng.randint(1, 10**6):,}" + ("[a]" if rng.random() < 0.2 else "") for _ in range(rows)]
+    return {"money": pd.Series(money), "year": pd.Series(titles), "int": pd.Series(ints)}
+
+
+def bench(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=100_000)
+    args = ap.parse_args()
+
+    cols = columns(args.rows)
+    cases = {
+        "money": (lambda: cols["money"].apply(old_to_num), lambda: Tables.parse_money(cols["money"])),
+        "year": (lambda: cols["year"].apply(old_year_from_title), lambda: Tables.parse_year(cols["year"])),
+        "int": (lambda: cols["int"].map(old_int), lambda: Tables.parse_int(cols["int"])),
+    }
+    print(f"rows={args.rows}")
+    for name, (old, new) in cases.items():
+        t_old, t_new = bench(old), bench(new)
+        print(f"{name:6s} per-cell={t_old * 1000:8.1f}ms vectorized={t_new * 1000:8.1f}ms speedup={t_old / t_new:4.1f}x")
+
+
+if __name__ == "__main__":
+    main()
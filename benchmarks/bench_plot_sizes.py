@@ -0,0 +1,70 @@
+"""
+Render time and image size of the scatter-with-regression chart from 1k to 10M points:
+every point drawn as a marker (the chart before the density mode), against
+tool.plot.scatter_with_regression, which bins inputs over PLOT_MAX_POINTS onto a grid
+(the binning time is shown on its own: the server does it before shipping the spec).
+
+    python -m benchmarks.bench_plot_sizes --points 1000,10000,100000,1000000,10000000 --markers-max 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.config import MAX_IMAGE_BYTES, PLOT_MAX_POINTS
+from app.tool.density import Density
+from app.tool.plot import scatter_with_regression
+
+
+def markers(x: np.ndarray, y: np.ndarray) -> str:
+    """The chart as it was drawn before: one marker per point, the line through every x."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    from app.utils.image import figure_to_data_uri
+
+    m, b = np.polyfit(x[~(np.isnan(x) | np.isnan(y))], y[~(np.isnan(x) | np.isnan(y))], 1)
+    fig = Figure(figsize=(5, 4), dpi=120)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.scatter(x, y)
+    ax.plot(x, m * x + b, linestyle=":", color="red")
+    fig.tight_layout()
+    return figure_to_data_uri(fig, MAX_IMAGE_BYTES)
+
+
+def timed(fn, *args, **kwargs) -> tuple[object, float]:
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, time.perf_counter() - t0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--points", default="1000,10000,100000,1000000,10000000")
+    ap.add_argument("--markers-max", type=int, default=1_000_000, help="largest size drawn marker by marker")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    scatter_with_regression(np.arange(3.0), np.arange(3.0), "x", "y")  # matplotlib's one-off setup
+    print(f"PLOT_MAX_POINTS={PLOT_MAX_POINTS} MAX_IMAGE_BYTES={MAX_IMAGE_BYTES}")
+    for n in (int(p) for p in args.points.split(",")):
+        x = rng.normal(50, 15, n)
+        y = 2 * x + rng.normal(0, 20, n)
+        row = f"{n:>9,d} points"
+        if n <= args.markers_max:
+            uri, seconds = timed(markers, x, y)
+            row += f"  markers {seconds:7.2f}s {len(uri):>7,d} B"
+        else:
+            row += f"  markers {'-':>7s}  {'-':>7s}  "
+        uri, seconds = timed(scatter_with_regression, x, y, "x", "y", dotted_red=True)
+        mode = "density" if n > PLOT_MAX_POINTS else "scatter"
+        row += f"  {mode} {seconds:7.2f}s {len(uri):>7,d} B"
+        if n > PLOT_MAX_POINTS:
+            density, binning = timed(Density.of, x, y)
+            row += f"  (binning {binning:.2f}s, spec {density.counts.nbytes:,d} B vs {x.nbytes + y.nbytes:,d} B raw)"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
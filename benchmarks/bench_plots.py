@@ -0,0 +1,62 @@
+"""
+Plots/sec of rendering scatter-with-regression charts inline (one after another in the
+server process, as the handler used to) vs. through the pre-warmed PlotRenderer pool.
+
+    python -m benchmarks.bench_plots --plots 32 --points 500 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import numpy as np
+
+from app.tool.render import PlotRenderer, PlotSpec, render_spec
+
+
+def specs(n: int, points: int) -> list[PlotSpec]:
+    rng = np.random.default_rng(0)
+    out = []
+    for i in range(n):
+        x = rng.uniform(0, 100, points)
+        y = 2 * x + rng.normal(0, 10, points)
+        out.append(PlotSpec("scatter_with_regression", x, y, "Rank", "Peak", dotted_red=i % 2 == 0))
+    return out
+
+
+async def pooled(batch: list[PlotSpec], workers: int) -> dict:
+    renderer = PlotRenderer(workers)
+    t0 = time.perf_counter()
+    await renderer.start()
+    warm = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    await renderer.render_many(batch)
+    elapsed = time.perf_counter() - t0
+    renderer.shutdown()
+    return {"path": f"pool x{workers}", "warmup_s": round(warm, 2), "seconds": round(elapsed, 3),
+            "plots_per_s": round(len(batch) / elapsed, 1)}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--plots", type=int, default=32)
+    ap.add_argument("--points", type=int, default=500)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = ap.parse_args()
+
+    batch = specs(args.plots, args.points)
+    t0 = time.perf_counter()
+    render_spec(batch[0])  # first plot pays matplotlib's one-off setup
+    first = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for spec in batch:
+        render_spec(spec)
+    elapsed = time.perf_counter() - t0
+    print({"path": "inline", "first_plot_s": round(first, 2), "seconds": round(elapsed, 3),
+           "plots_per_s": round(args.plots / elapsed, 1)})
+    for workers in sorted({1, args.workers}):
+        print(asyncio.run(pooled(batch, workers)))
+
+
+if __name__ == "__main__":
+    main()
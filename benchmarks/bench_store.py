@@ -0,0 +1,107 @@
+"""
+Memory of N worker processes holding the same large table: each parsing a private copy,
+against each memory-mapping it from the shared table store (app.tool.store). The first
+worker to miss writes the table; the others map the file it wrote. Reports per-worker
+RSS and PSS (resident memory with shared pages split between the processes mapping them)
+from /proc/self/smaps_rollup, and the store's hit counts from its index.
+
+    python -m benchmarks.bench_store --workers 4 --rows 2000000
+"""
+import argparse
+import multiprocessing as mp
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+def _memory() -> dict[str, int]:
+    """Rss and Pss of this process in kB."""
+    fields = {}
+    for line in Path("/proc/self/smaps_rollup").read_text().splitlines():
+        name, _, value = line.partition(":")
+        if name in ("Rss", "Pss"):
+            fields[name.lower()] = int(value.split()[0])
+    return fields
+
+
+def _table(rows: int):
+    import pandas as pd
+
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "x": rng.normal(size=rows),
+        "y": rng.normal(size=rows),
+        "year": rng.integers(1950, 2025, size=rows),
+        "gross": rng.uniform(1e6, 3e9, size=rows),
+    })
+
+
+def _worker(mode: str, directory: str, rows: int, lead: bool, loaded, barrier, out) -> None:
+    import pyarrow.compute as pc
+
+    from app.tool.store import TableStore
+    from app.tool.tables import TableCache
+
+    before = _memory()["rss"]
+    if not lead:
+        loaded.wait()
+    t0 = time.perf_counter()
+    if mode == "private":
+        df = _table(rows)
+        total = float(df["gross"].sum())
+    else:
+        store = TableStore(Path(directory))
+        table = store.get("bench")
+        if table is None:
+            table = store.put("bench", TableCache.to_arrow(_table(rows)))
+        total = pc.sum(table["gross"]).as_py()  # reads every page of the column
+    seconds = time.perf_counter() - t0
+    loaded.set()
+    barrier.wait()  # every worker holds its table while memory is measured
+    out.put({**_memory(), "base": before, "seconds": seconds, "total": total})
+    barrier.wait()
+    if mode == "store":
+        store.flush()
+
+
+def run(mode: str, workers: int, rows: int, directory: str) -> list[dict]:
+    ctx = mp.get_context("spawn")
+    barrier, out = ctx.Barrier(workers), ctx.Queue()
+    # the first worker loads the table on its own, as the first request for it would
+    loaded = ctx.Event()
+    procs = [ctx.Process(target=_worker, args=(mode, directory, rows, i == 0, loaded, barrier, out))
+             for i in range(workers)]
+    for p in procs:
+        p.start()
+    results = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return results
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--rows", type=int, default=2_000_000)
+    args = ap.parse_args()
+
+    from app.tool.store import TableStore
+
+    with tempfile.TemporaryDirectory(prefix="bench-store-") as directory:
+        for mode in ("private", "store"):
+            results = run(mode, args.workers, args.rows, directory)
+            table_mb = np.median([(r["rss"] - r["base"]) / 1024 for r in results])
+            pss = sum(r["pss"] for r in results) / 1024
+            load = np.median([r["seconds"] for r in results]) * 1000
+            print(f"{mode:8} rss/worker {np.median([r['rss'] for r in results]) / 1024:7.0f} MB "
+                  f"(table {table_mb:5.0f} MB)   pss total {pss:7.0f} MB   load {load:6.0f} ms")
+        stats = TableStore(Path(directory)).stats()
+        print(f"store    {stats['entries']} file(s), {stats['bytes'] / 2**20:.0f} MB, "
+              f"{stats['host_hits']} hits across workers")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Time to first answer: POST /api/ (every answer at once, when the slowest is done) against
+POST /api/stream (NDJSON, one line per answer as it is ready) for a CSV request mixing a
+local answer, charts and LLM questions. The app runs under uvicorn -- httpx's ASGI
+transport would buffer the stream -- with a stub LLM of fixed latency.
+
+    python -m benchmarks.bench_stream --requests 5 --llm-latency 1.0
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from benchmarks.fixtures import numeric_csv
+from benchmarks.stubs import StubLLM, _Server, structured
+
+QUESTIONS = """Answer the following questions about the attached data.csv as a JSON array.
+
+1. What's the correlation between the x and y?
+2. Draw a scatterplot of x and y along with a dotted red regression line through it.
+3. Describe the category column for request {nonce}.
+4. Draw a scatterplot of z and x.
+"""
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=5)
+    ap.add_argument("--rows", type=int, default=10000)
+    ap.add_argument("--llm-latency", type=float, default=1.0)
+    args = ap.parse_args()
+
+    with StubLLM(latency=args.llm_latency, reply=structured(lambda q: "stub answer")) as llm:
+        # before app.* is imported: config is read at import time
+        os.environ.update({"OPENAI_PROXY_URL": llm.url, "OPENAI_PROXY_TOKEN": "stub", "LLM_CACHE_DISK": "0"})
+        import httpx
+
+        from app.main import app
+
+        csv = numeric_csv(args.rows).encode()
+        with _Server(app) as server, httpx.Client(base_url=server.base_url, timeout=None) as client:
+            nonce = 0
+
+            def files() -> dict:
+                nonlocal nonce
+                nonce += 1  # a fresh LLM question each time, so the response cache doesn't answer it
+                return {"questions": ("questions.txt", QUESTIONS.format(nonce=nonce).encode()),
+                        "data.csv": ("data.csv", csv)}
+
+            client.post("/api/", files=files()).raise_for_status()  # warm-up
+            full, first, last = [], [], []
+            for _ in range(args.requests):
+                t0 = time.perf_counter()
+                client.post("/api/", files=files()).raise_for_status()
+                full.append(time.perf_counter() - t0)
+
+                t0 = time.perf_counter()
+                with client.stream("POST", "/api/stream", files=files()) as r:
+                    r.raise_for_status()
+                    lines = r.iter_lines()
+                    next(lines)
+                    first.append(time.perf_counter() - t0)
+                    for _ in lines:
+                        pass
+                    last.append(time.perf_counter() - t0)
+
+    ms = lambda v: f"{np.median(v) * 1000:7.0f} ms"  # noqa: E731
+    print(f"/api/        response        {ms(full)}")
+    print(f"/api/stream  first answer    {ms(first)}")
+    print(f"/api/stream  done            {ms(last)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Prompt tokens, calls and answers for N questions against a flaky stub model that omits a
+share of answers, garbles others, and cuts off a share of its replies mid-stream:
+- per-question: one call per question with the full system prompt (the old runner);
+- whole-batch retry: all questions in one call, re-sent in full whenever the reply fails
+  to parse or any answer is missing;
+- structured: tool.structured -- batched id'd answers parsed incrementally, follow-up
+  batches with only the missing ones.
+
+    python -m benchmarks.bench_structured --questions 12 --drop 0.15 --truncate 0.3
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+from benchmarks.stubs import QUESTION_ID, StubLLM
+
+SYSTEM = "You are a helpful data analyst.\n" + "Table digest line with statistics and values.\n" * 130
+
+
+class FlakyModel:
+    """Answers "[qN] ..." prompts in the answers format, or a bare value for a bare question."""
+
+    def __init__(self, drop: float, truncate: float, seed: int = 0):
+        self.drop = drop
+        self.truncate = truncate
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.prompt_chars = 0
+
+    def __call__(self, payload: dict) -> str:
+        self.calls += 1
+        self.prompt_chars += sum(len(m["content"]) for m in payload["messages"])
+        user = payload["messages"][-1]["content"]
+        asked = QUESTION_ID.findall(user)
+        if not asked:  # per-question mode
+            return "" if self.rng.random() < self.drop else json.dumps(f"answer to {user[:20]}")
+        answers = []
+        for qid, question in asked:
+            roll = self.rng.random()
+            if roll < self.drop / 2:
+                continue  # omitted
+            answers.append({"id": qid, "answer": None if roll < self.drop else f"answer to {question[:20]}"})
+        text = json.dumps({"answers": answers})
+        if self.rng.random() < self.truncate:
+            text = text[: self.rng.randint(len(text) // 3, len(text) - 1)]
+        return text
+
+
+def questions(n: int, trial: int) -> dict[str, str]:
+    # distinct per trial, so the response cache never answers for the model
+    return {f"q{i + 1}": f"What is the value of metric {i + 1} in run {trial}?" for i in range(n)}
+
+
+async def per_question(qs: dict[str, str], rounds: int) -> dict[str, object]:
+    from app.tool.llm import acomplete
+    from app.tool.structured import parse_answer
+
+    results = {}
+    for _ in range(rounds):
+        pending = [qid for qid in qs if qid not in results]
+        replies = await asyncio.gather(*(acomplete(SYSTEM, qs[qid], cache=False) for qid in pending))
+        results.update({qid: parse_answer(r) for qid, r in zip(pending, replies) if r})
+    return results
+
+
+async def whole_batch(qs: dict[str, str], rounds: int) -> dict[str, object]:
+    from app.tool.llm import acomplete
+    from app.tool.structured import batch_prompt, clean_llm_output
+
+    for _ in range(rounds):
+        reply = await acomplete(SYSTEM, batch_prompt(qs), cache=False)
+        try:
+            answers = {a["id"]: a["answer"] for a in json.loads(clean_llm_output(reply))["answers"]}
+        except (json.JSONDecodeError, KeyError, TypeError):
+            continue
+        if all(answers.get(qid) is not None for qid in qs):
+            return answers
+    return {}
+
+
+async def structured(qs: dict[str, str], rounds: int) -> dict[str, object]:
+    from app.tool.structured import answer_all
+
+    results: dict[str, object] = {}
+    await answer_all(SYSTEM, qs, results, rounds=rounds)
+    return results
+
+
+async def run(strategy, qs: dict[str, str], rounds: int) -> tuple[dict, float]:
+    from app.tool import llm
+
+    t0 = time.perf_counter()
+    results = await strategy(qs, rounds)
+    elapsed = time.perf_counter() - t0
+    await llm.aclose()
+    return results, elapsed
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--questions", type=int, default=12)
+    ap.add_argument("--drop", type=float, default=0.15, help="share of answers omitted or invalid")
+    ap.add_argument("--truncate", type=float, default=0.3, help="share of replies cut off")
+    ap.add_argument("--rounds", type=int, default=3)
+    ap.add_argument("--latency", type=float, default=0.3)
+    ap.add_argument("--trials", type=int, default=10)
+    args = ap.parse_args()
+
+    model: FlakyModel | None = None
+    with StubLLM(latency=args.latency, reply=lambda payload: model(payload)) as stub:
+        # before app.* is imported: config is read at import time
+        os.environ.update({"OPENAI_PROXY_URL": stub.url, "OPENAI_PROXY_TOKEN": "stub", "LLM_CACHE_DISK": "0"})
+        for name, strategy in (("per-question", per_question), ("whole-batch retry", whole_batch),
+                               ("structured", structured)):
+            calls = chars = answered = 0
+            seconds = 0.0
+            for trial in range(args.trials):
+                model = FlakyModel(args.drop, args.truncate, seed=trial)
+                qs = questions(args.questions, trial)
+                results, elapsed = asyncio.run(run(strategy, qs, args.rounds))
+                calls += model.calls
+                chars += model.prompt_chars
+                answered += sum(results.get(qid) is not None for qid in qs)
+                seconds += elapsed
+            n = args.trials
+            print(f"{name:18s} calls={calls / n:5.1f} prompt_tokens~{chars / 4 / n:7.0f} "
+                  f"answered={answered / n:5.1f}/{args.questions} wall={seconds / n:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
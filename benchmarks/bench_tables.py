@@ -0,0 +1,74 @@
+"""
+Peak memory and latency of picking the films table from a large multi-table page:
+pd.read_html over every table vs. the streaming TableExtractor. Each run happens in a
+fresh process so peak RSS is not polluted by the other path.
+
+    python -m benchmarks.bench_tables --noise-tables 200 --noise-rows 500
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+KEYWORDS = ("rank", "peak", "title", "worldwide gross", "year")
+
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run(method: str, noise_tables: int, noise_rows: int, chunked: bool) -> dict:
+    import io
+
+    import pandas as pd
+
+    from app.tool.html_tables import TableExtractor
+    from benchmarks.fixtures import films_page
+
+    html = films_page(rows=50, noise_tables=noise_tables, noise_rows=noise_rows)
+    base = _rss_mb()
+    t0 = time.perf_counter()
+    if method == "read_html":
+        tables = pd.read_html(io.StringIO(html), flavor="lxml")
+        best = next(t for t in tables if "Peak" in t.columns)
+    else:
+        extractor = TableExtractor(keywords=KEYWORDS)
+        step = 64 * 1024 if chunked else len(html)
+        for i in range(0, len(html), step):
+            extractor.feed(html[i : i + step])
+        best = extractor.close()[0]
+    elapsed = time.perf_counter() - t0
+    return {
+        "method": method + (" (64 KiB chunks)" if chunked else ""),
+        "page_mb": round(len(html) / 1e6, 2),
+        "seconds": round(elapsed, 4),
+        "peak_rss_delta_mb": round(_rss_mb() - base, 1),
+        "shape": list(best.shape),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--noise-tables", type=int, default=200)
+    ap.add_argument("--noise-rows", type=int, default=500)
+    ap.add_argument("--child", nargs=2, metavar=("METHOD", "CHUNKED"))
+    args = ap.parse_args()
+
+    if args.child:
+        method, chunked = args.child
+        print(json.dumps(_run(method, args.noise_tables, args.noise_rows, chunked == "1")))
+        return
+
+    for method, chunked in (("read_html", "0"), ("extractor", "0"), ("extractor", "1")):
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_tables", "--child", method, chunked,
+             "--noise-tables", str(args.noise_tables), "--noise-rows", str(args.noise_rows)],
+            capture_output=True, text=True, check=True,
+        )
+        print(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    main()
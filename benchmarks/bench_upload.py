@@ -0,0 +1,112 @@
+"""
+Peak RSS and latency of receiving a large CSV attachment over HTTP: the old path
+(UploadFile spooling, a copy into a TemporaryDirectory, then pd.read_csv) vs. utils.io.ingest
+(parsed in chunks while it uploads). Each path runs in a fresh server process; the client
+streams the body from disk so it adds no memory of its own.
+
+    python -m benchmarks.bench_upload --mb 500
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BOUNDARY = "bench-boundary-7d2f"
+
+
+def write_csv(path: Path, mb: int) -> None:
+    rng = np.random.default_rng(0)
+    with open(path, "w") as f:
+        f.write("id,x,y,z,category\n")
+        i = 0
+        while f.tell() < mb * 1024 * 1024:
+            n = 500_000
+            x = rng.uniform(0, 100, n)
+            pd.DataFrame({
+                "id": np.arange(i, i + n), "x": x.round(3), "y": (2 * x + rng.normal(0, 10, n)).round(3),
+                "z": rng.integers(0, 1000, n), "category": rng.choice(list("ABCDE"), n),
+            }).to_csv(f, header=False, index=False)
+            i += n
+
+
+def body(path: Path):
+    yield (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="questions"; filename="questions.txt"\r\n'
+           f"Content-Type: text/plain\r\n\r\n1. How many rows?\r\n").encode()
+    yield (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="attachments"; filename="data.csv"\r\n'
+           f"Content-Type: text/csv\r\n\r\n").encode()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            yield chunk
+    yield f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def server_app(method: str):
+    from fastapi import FastAPI, File, Request, UploadFile
+
+    app = FastAPI()
+    if method == "old":
+        @app.post("/upload")
+        async def old(questions: UploadFile = File(...), attachments: list[UploadFile] = File(default=[])):
+            with tempfile.TemporaryDirectory() as tmpdir:
+                tables = []
+                for att in attachments:
+                    with open(Path(tmpdir) / att.filename, "wb") as f:
+                        shutil.copyfileobj(att.file, f)
+                    tables.append(pd.read_csv(Path(tmpdir) / att.filename))
+                return {"shape": list(tables[0].shape)}
+    else:
+        from app.utils.io import ingest
+
+        @app.post("/upload")
+        async def new(request: Request):
+            upload = await ingest(request)
+            return {"shape": list(next(iter(upload.tables.values())).shape)}
+    return app
+
+
+def run(method: str, path: Path) -> dict:
+    import httpx
+
+    from benchmarks.stubs import _Server
+
+    rss = lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # noqa: E731
+    with _Server(server_app(method)) as server:
+        base = rss()
+        t0 = time.perf_counter()
+        r = httpx.post(server.base_url + "/upload", content=body(path), timeout=None,
+                       headers={"content-type": f"multipart/form-data; boundary={BOUNDARY}"})
+        elapsed = time.perf_counter() - t0
+    return {"method": method, "file_mb": round(path.stat().st_size / 2**20), "status": r.status_code,
+            "shape": r.json().get("shape"), "seconds": round(elapsed, 2), "peak_rss_delta_mb": round(rss() - base)}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mb", type=int, default=500)
+    ap.add_argument("--child", nargs=2, metavar=("METHOD", "PATH"))
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(run(args.child[0], Path(args.child[1]))))
+        return
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "data.csv"
+        write_csv(path, args.mb)
+        for method in ("old", "new"):
+            out = subprocess.run([sys.executable, "-m", "benchmarks.bench_upload", "--child", method, str(path)],
+                                 capture_output=True, text=True, check=True, env={**os.environ, "UPLOAD_MAX_BYTES": str(2**40)})
+            print(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    main()
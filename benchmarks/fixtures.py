@@ -0,0 +1,98 @@
+"""
+Deterministic stand-ins for the pages and files the agent is asked about.
+
+`films_page` mimics the structure of Wikipedia's "List of highest-grossing films": a
+`wikitable` whose titles are row headers, grosses like "$2,923,706,026" with footnote
+markers, a Peak column with rowspans, and a number of unrelated tables around it.
+"""
+import random
+
+FILMS = [
+    ("Avatar", 2009), ("Avengers: Endgame", 2019), ("Avatar: The Way of Water", 2022),
+    ("Titanic", 1997), ("Star Wars: The Force Awakens", 2015), ("Avengers: Infinity War", 2018),
+    ("Spider-Man: No Way Home", 2021), ("Inside Out 2", 2024), ("Jurassic World", 2015),
+    ("The Lion King", 2019), ("The Avengers", 2012), ("Furious 7", 2015), ("Top Gun: Maverick", 2022),
+    ("Frozen II", 2019), ("Barbie", 2023), ("Avengers: Age of Ultron", 2015),
+    ("The Super Mario Bros. Movie", 2023), ("Black Panther", 2018),
+    ("Harry Potter and the Deathly Hallows – Part 2", 2011), ("Deadpool & Wolverine", 2024),
+    ("Star Wars: The Last Jedi", 2017), ("Jurassic World: Fallen Kingdom", 2018), ("Frozen", 2013),
+    ("Beauty and the Beast", 2017), ("Incredibles 2", 2018), ("The Fate of the Furious", 2017),
+    ("Iron Man 3", 2013), ("Minions", 2015), ("Captain America: Civil War", 2016), ("Aquaman", 2018),
+    ("The Lord of the Rings: The Return of the King", 2003), ("Spider-Man: Far From Home", 2019),
+    ("Captain Marvel", 2019), ("Transformers: Dark of the Moon", 2011), ("Skyfall", 2012),
+    ("Transformers: Age of Extinction", 2014), ("The Dark Knight Rises", 2012), ("Joker", 2019),
+    ("Star Wars: The Rise of Skywalker", 2019), ("Toy Story 4", 2019), ("Toy Story 3", 2010),
+    ("Pirates of the Caribbean: Dead Man's Chest", 2006), ("Moana 2", 2024),
+    ("Rogue One: A Star Wars Story", 2016), ("Aladdin", 2019),
+    ("Pirates of the Caribbean: On Stranger Tides", 2011), ("Despicable Me 3", 2017),
+    ("Jurassic Park", 1993), ("Finding Dory", 2016), ("Star Wars: Episode I – The Phantom Menace", 1999),
+]
+
+
+def _films_table(rows: int, rng: random.Random) -> str:
+    out = [
+        '<table class="wikitable sortable plainrowheaders">',
+        "<caption>Highest-grossing films</caption>",
+        "<tr><th>Rank</th><th>Peak</th><th>Title</th><th>Worldwide gross</th><th>Year</th><th>Ref</th></tr>",
+    ]
+    gross = 2_923_706_026
+    peak_left = 0
+    for i in range(rows):
+        title, year = FILMS[i % len(FILMS)]
+        if i >= len(FILMS):
+            title = f"{title} ({i // len(FILMS) + 1})"
+        cells = [f"<td>{i + 1}</td>"]
+        if peak_left == 0:
+            span = rng.choice([1, 1, 1, 2, 3])
+            peak_left = span
+            attr = f' rowspan="{span}"' if span > 1 else ""
+            cells.append(f"<td{attr}>{rng.randint(1, max(2, i + 1))}</td>")
+        peak_left -= 1
+        marker = rng.choice(["", "", "T", "F8", "SM"])
+        cells.append(f'<th scope="row"><i><a href="/wiki/{i}">{title}</a></i></th>')
+        cells.append(f"<td>{marker}${gross:,}<sup>[{i % 7 + 1}]</sup></td>")
+        cells.append(f"<td>{year}</td>")
+        cells.append(f'<td><sup class="reference">[# {i + 1}]</sup></td>')
+        out.append("<tr>" + "".join(cells) + "</tr>")
+        gross = int(gross * rng.uniform(0.93, 0.999))
+    out.append("</table>")
+    return "\n".join(out)
+
+
+def _noise_table(rows: int, cols: int, rng: random.Random) -> str:
+    head = "".join(f"<th>Column {c}</th>" for c in range(cols))
+    words = ["Lorem", "ipsum", "dolor", "sit", "amet", "n/a"]
+    body = "".join(
+        "<tr>"
+        + "".join(f"<td>{rng.choice(words)}</td>" for _ in range(cols - 2))
+        + "".join(f"<td>{rng.randint(0, 9999):,}</td>" for _ in range(2))
+        + "</tr>"
+        for _ in range(rows)
+    )
+    return f'<table class="wikitable"><tr>{head}</tr>{body}</table>'
+
+
+def films_page(rows: int = 50, noise_tables: int = 20, noise_rows: int = 30, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts = ["<!DOCTYPE html><html><head><title>List of highest-grossing films</title>"]
+    parts.append("<style>.wikitable{border:1px}</style></head><body>")
+    parts.append("<p>" + "Films generate income from several revenue streams. " * 40 + "</p>")
+    for i in range(noise_tables):
+        if i == noise_tables // 3:
+            parts.append(_films_table(rows, rng))
+        parts.append(f"<h2>Section {i}</h2><p>{'Lorem ipsum dolor sit amet. ' * 20}</p>")
+        parts.append(_noise_table(noise_rows, 6, rng))
+    if noise_tables == 0:
+        parts.append(_films_table(rows, rng))
+    parts.append("</body></html>")
+    return "\n".join(parts)
+
+
+def numeric_csv(rows: int, seed: int = 0) -> str:
+    """CSV with a few correlated numeric columns and a low-cardinality text column."""
+    rng = random.Random(seed)
+    lines = ["id,x,y,z,category"]
+    for i in range(rows):
+        x = rng.uniform(0, 100)
+        lines.append(f"{i},{x:.3f},{2 * x + rng.gauss(0, 10):.3f},{rng.randint(0, 1000)},{rng.choice('ABCDE')}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,145 @@
+"""
+Local stand-ins for the external services the agent talks to, so benchmarks run offline.
+
+    from benchmarks.stubs import StubLLM
+    with StubLLM(latency=0.2) as llm:
+        os.environ["OPENAI_PROXY_URL"] = llm.url  # before importing app.*
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import socket
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+QUESTION_ID = re.compile(r"^\[(q\d+)\] (.*)$", re.M)
+
+
+def structured(answer: Callable[[str], Any]) -> Callable[[dict], str]:
+    """A StubLLM `reply` that answers every "[qN] question" of the prompt in the answers format."""
+
+    def reply(payload: dict) -> str:
+        asked = QUESTION_ID.findall(payload["messages"][-1]["content"])
+        return json.dumps({"answers": [{"id": qid, "answer": answer(question)} for qid, question in asked]})
+
+    return reply
+
+
+class _Server:
+    """Runs a FastAPI app with uvicorn on a background thread."""
+
+    def __init__(self, app: FastAPI):
+        self.port = free_port()
+        self.server = uvicorn.Server(
+            uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning")
+        )
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+
+class StubLLM(_Server):
+    """
+    OpenAI-compatible /v1/chat/completions endpoint with fixed latency.
+
+    `reply` is returned as the message content (a callable gets the request payload);
+    `fail_rate` answers that fraction of calls with 429/503 to exercise client retries.
+    """
+
+    def __init__(self, latency: float = 0.1, reply="[]", fail_rate: float = 0.0):
+        self.latency = latency
+        self.reply = reply
+        self.fail_rate = fail_rate
+        self.calls = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        app = FastAPI()
+        app.post("/v1/chat/completions")(self._completions)
+        super().__init__(app)
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}/v1/chat/completions"
+
+    async def _completions(self, request: Request):
+        payload = await request.json()
+        self.calls += 1
+        if self.fail_rate and random.random() < self.fail_rate:
+            return JSONResponse({"error": "busy"}, status_code=random.choice([429, 503]))
+        content = self.reply(payload) if callable(self.reply) else self.reply
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        if payload.get("stream"):
+            return StreamingResponse(self._sse(content), media_type="text/event-stream")
+        return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+    @staticmethod
+    async def _sse(content: str):
+        for i in range(0, len(content), 16):
+            chunk = {"choices": [{"delta": {"content": content[i : i + 16]}}]}
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+
+class StubOrigin(_Server):
+    """
+    Static web server for recorded pages with ETag/Last-Modified validators. Counts full
+    responses and 304s so cache behaviour can be asserted.
+    """
+
+    LAST_MODIFIED = "Mon, 01 Jan 2024 00:00:00 GMT"
+
+    def __init__(self, pages: dict[str, str], cache_control: str = "max-age=0, must-revalidate"):
+        self.pages = pages
+        self.cache_control = cache_control
+        self.full = 0
+        self.not_modified = 0
+        app = FastAPI()
+        app.get("/{path:path}")(self._page)
+        super().__init__(app)
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    async def _page(self, path: str, request: Request):
+        body = self.pages.get(path)
+        if body is None:
+            return Response(status_code=404)
+        etag = '"%s"' % hashlib.sha1(body.encode()).hexdigest()
+        headers = {"ETag": etag, "Last-Modified": self.LAST_MODIFIED, "Cache-Control": self.cache_control}
+        if request.headers.get("if-none-match") == etag:
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        self.full += 1
+        return HTMLResponse(body, headers=headers)